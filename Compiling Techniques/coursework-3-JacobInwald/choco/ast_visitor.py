@@ -1,12 +1,13 @@
 import re
-from typing import Any, Callable
+from typing import Any, Callable, Dict, Tuple, Type
 
 from choco.dialects.choco_ast import *
 
+CAMEL_CASE_BOUNDARY = re.compile(r"(?<!^)(?=[A-Z])")
+
 
 def camel_to_snake(name: str) -> str:
-    pattern = re.compile(r"(?<!^)(?=[A-Z])")
-    return pattern.sub("_", name).lower()
+    return CAMEL_CASE_BOUNDARY.sub("_", name).lower()
 
 
 def get_method(instance: object, method: str) -> Optional[Callable[..., Any]]:
@@ -20,19 +21,41 @@ def get_method(instance: object, method: str) -> Optional[Callable[..., Any]]:
             return None
 
 
+# The `traverse_*` and `visit_*` functions of a visitor class for an operation class.
+Handlers = Tuple[Optional[Callable[..., Any]], Optional[Callable[..., Any]]]
+
+
 class Visitor:
+    # Handlers of this visitor class, by operation class, filled in on first use.
+    _handlers: Dict[Type[Operation], Handlers] = {}
+
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        cls._handlers = {}
+
+    @classmethod
+    def _find_handlers(cls, op_type: Type[Operation]) -> Handlers:
+        class_name = camel_to_snake(op_type.__name__)
+        return (
+            get_method(cls, f"traverse_{class_name}"),
+            get_method(cls, f"visit_{class_name}"),
+        )
+
     def traverse(self, operation: Operation):
-        class_name = camel_to_snake(type(operation).__name__)
+        op_type = type(operation)
+        handlers = self._handlers.get(op_type)
+        if handlers is None:
+            handlers = self._find_handlers(op_type)
+            self._handlers[op_type] = handlers
+        traverse, visit = handlers
 
-        traverse = get_method(self, f"traverse_{class_name}")
         if traverse:
-            traverse(operation)
+            traverse(self, operation)
         else:
             for r in operation.regions:
                 for b in r.blocks:
                     for op in b.ops:
                         self.traverse(op)
 
-        visit = get_method(self, f"visit_{class_name}")
         if visit:
-            visit(operation)
+            visit(self, operation)
@@ -0,0 +1,314 @@
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Set, Tuple, Union
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp, StringAttr, UnitAttr
+from xdsl.ir import MLContext, Operation, OpResult, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import enclosing_function
+from choco.dialects.choco_flat import *
+
+Access = Union[GetAddress, IndexString]
+
+
+def defining_op(value: SSAValue) -> Optional[Operation]:
+    return value.op if isinstance(value, OpResult) else None
+
+
+def is_len_of(value: SSAValue) -> Optional[SSAValue]:
+    """The argument of the `len` call that computes a value, if it is one."""
+    op = defining_op(value)
+    if isinstance(op, CallExpr) and op.func_name.data == "len":  # type: ignore
+        return op.args[0]
+    return None
+
+
+def constant_length(value: SSAValue) -> Optional[int]:
+    """The length of a list or string whose elements are known."""
+    op = defining_op(value)
+    if isinstance(op, ListExpr):
+        return len(op.elems)
+    if isinstance(op, Literal) and isinstance(op.value, StringAttr):
+        return len(op.value.data)
+    return None
+
+
+def constant_int(value: SSAValue) -> Optional[int]:
+    op = defining_op(value)
+    if (
+        isinstance(op, Literal)
+        and isinstance(op.value, IntegerAttr)
+        and op.result.type == int_type
+    ):
+        return op.value.parameters[0].data  # type: ignore
+    return None
+
+
+def assignments(value: SSAValue) -> List[Assign]:
+    return [
+        use.operation
+        for use in value.uses
+        if isinstance(use.operation, Assign) and use.index == 0
+    ]
+
+
+def dominates(op: Operation, other: Operation) -> bool:
+    """
+    Whether `op` has run every time `other` runs: it comes before an ancestor of
+    `other` in the same block, or it is in the condition of a loop whose body contains
+    `other`. Functions may be called from anywhere, so nothing outside of them
+    dominates their operations.
+    """
+    block = op.parent_block()
+    assert block is not None
+    ancestor = other
+    while ancestor is not None and not isinstance(ancestor, FuncDef):
+        if ancestor.parent_block() is block:
+            return block.get_operation_index(op) < block.get_operation_index(ancestor)
+        parent = ancestor.parent_op()
+        if (
+            isinstance(parent, While)
+            and ancestor.parent_region() is parent.body
+            and block is parent.cond.block
+        ):
+            return True
+        ancestor = parent
+    return False
+
+
+# The largest constant added to an index that is known to stay non-negative. A list
+# holds less than 2**29 elements, so the sum can not overflow.
+MAX_INCREMENT = 2**16
+
+
+@dataclass
+class BoundsAnalysis:
+    """
+    Find the list and string accesses whose value can not be None and whose index is
+    within the bounds of the value.
+
+    An index is within the bounds if it is not negative and the access only runs after
+    a condition `index < len(value)` held, without the index or the value changing in
+    between. This is the case of the accesses of the loops produced by `ForToWhile`
+    once their index is promoted by mem2reg, and of accesses with a constant index
+    into a list or string literal.
+    """
+
+    user_functions: Set[str]
+    nonnegative: Set[SSAValue] = field(default_factory=set)
+
+    def find_nonnegative(self, module: ModuleOp) -> None:
+        """
+        Find the int phis that can not be negative. They are first all assumed to be
+        non-negative, and are dropped until all the values assigned to the remaining
+        ones are non-negative.
+        """
+        phis = [
+            op.result
+            for op in module.walk()
+            if isinstance(op, Phi) and op.result.type == int_type
+        ]
+        self.nonnegative = set(phi for phi in phis if assignments(phi))
+        changed = True
+        while changed:
+            changed = False
+            for phi in phis:
+                if phi in self.nonnegative and not all(
+                    self.is_nonnegative(assign.value) for assign in assignments(phi)
+                ):
+                    self.nonnegative.discard(phi)
+                    changed = True
+
+    def is_nonnegative(self, value: SSAValue) -> bool:
+        op = defining_op(value)
+        if isinstance(op, Phi):
+            return value in self.nonnegative
+        if is_len_of(value) is not None:
+            return True
+        constant = constant_int(value)
+        if constant is not None:
+            return constant >= 0
+        if not isinstance(op, BinaryExpr):
+            return False
+        if op.op.data in ["//", "%"]:
+            return self.is_nonnegative(op.lhs) and self.is_nonnegative(op.rhs)
+        if op.op.data != "+":
+            return False
+        for term, increment in [(op.lhs, op.rhs), (op.rhs, op.lhs)]:
+            constant = constant_int(increment)
+            if (
+                constant is not None
+                and 0 <= constant <= MAX_INCREMENT
+                and self.is_nonnegative(term)
+                and any(True for _ in self.bounds(op, term))
+            ):
+                return True
+        return False
+
+    def calls_user_function(self, op: Operation) -> bool:
+        return any(
+            isinstance(inner, CallExpr)
+            and inner.func_name.data in self.user_functions  # type: ignore
+            for inner in op.walk()
+        )
+
+    def stores_in(self, memloc: SSAValue, op: Operation) -> bool:
+        """Whether a memory location may be stored to while an operation runs."""
+        calls_user_function = self.calls_user_function(op)
+        for use in memloc.uses:
+            if not isinstance(use.operation, Store) or use.index != 0:
+                continue
+            if op.is_ancestor(use.operation):
+                return True
+            if calls_user_function and enclosing_function(
+                use.operation
+            ) is not enclosing_function(op):
+                return True
+        return False
+
+    def unchanged_until(self, load: Load, guard: Operation) -> bool:
+        """
+        Whether the variable read by a load keeps its value until `guard`, which comes
+        after it in the same block.
+        """
+        op = load.next_op
+        while op is not guard:
+            if op is None or self.stores_in(load.memloc, op):
+                return False
+            op = op.next_op
+        return True
+
+    def changes_in(self, value: SSAValue, guard: Operation, anchor: Operation) -> bool:
+        """
+        Whether a value may change inside the operation `guard` before its operation
+        `anchor` runs. Only phis change, when they are assigned.
+        """
+        if not isinstance(defining_op(value), Phi):
+            return False
+        block = anchor.parent_block()
+        return any(
+            guard.is_ancestor(assign)
+            and not (
+                assign.parent_block() is block
+                and block.get_operation_index(assign)  # type: ignore
+                > block.get_operation_index(anchor)  # type: ignore
+            )
+            for assign in assignments(value)
+        )
+
+    def same_value(self, value: SSAValue, other: SSAValue, guard: Operation) -> bool:
+        """
+        Whether two values are the same list or string inside `guard`: they are the
+        same SSA value, or loads of a variable that is not stored to in `guard`, done
+        either in `guard` or before it without a store in between.
+        """
+        if value is other:
+            return True
+        loads = [defining_op(value), defining_op(other)]
+        if not all(isinstance(load, Load) for load in loads):
+            return False
+        memloc = loads[0].memloc  # type: ignore
+        if loads[1].memloc is not memloc or self.stores_in(memloc, guard):  # type: ignore
+            return False
+        return all(
+            guard.is_ancestor(load)  # type: ignore
+            or (
+                load.parent_block() is guard.parent_block()  # type: ignore
+                and self.unchanged_until(load, guard)  # type: ignore
+            )
+            for load in loads
+        )
+
+    def bounds(
+        self, op: Operation, index: SSAValue
+    ) -> Iterator[Tuple[SSAValue, Operation]]:
+        """
+        The lists and strings `value` such that `index < len(value)` held when an
+        enclosing loop or if checked its condition, and `index` did not change until
+        `op` runs, with the loop or if that checked it.
+        """
+        ancestor = op
+        while True:
+            guard = ancestor.parent_op()
+            if guard is None or isinstance(guard, FuncDef):
+                return
+            cond: Optional[SSAValue] = None
+            if isinstance(guard, While) and ancestor.parent_region() is guard.body:
+                cond = guard.cond_ssa_value
+                if not guard.is_ancestor(cond.owner):  # type: ignore
+                    cond = None
+            if isinstance(guard, If) and ancestor.parent_region() is guard.then:
+                # the condition is computed right before the if
+                if defining_op(guard.cond) is guard.prev_op:
+                    cond = guard.cond
+            compare = None if cond is None else defining_op(cond)
+            if isinstance(compare, BinaryExpr) and not self.changes_in(
+                index, guard, ancestor
+            ):
+                value = None
+                if compare.op.data == "<" and compare.lhs is index:
+                    value = is_len_of(compare.rhs)
+                if compare.op.data == ">" and compare.rhs is index:
+                    value = is_len_of(compare.lhs)
+                if value is not None and not self.changes_in(value, guard, ancestor):
+                    yield value, guard
+            ancestor = guard
+
+    def is_not_none(self, access: Access) -> bool:
+        value = access.value
+        if constant_length(value) is not None:
+            return True
+        op = defining_op(value)
+        if isinstance(op, CallExpr):
+            # concatenation always returns a new list
+            if op.func_name.data == "_list_concat":  # type: ignore
+                return True
+        if op is None or isinstance(op, Phi):
+            return False
+        # the value has already been used by an operation that fails on None
+        for use in value.uses:
+            checker = use.operation
+            if checker is access or use.index != 0:
+                continue
+            fails_on_none = isinstance(checker, (GetAddress, IndexString)) or (
+                isinstance(checker, CallExpr)
+                and checker.func_name.data == "len"  # type: ignore
+            )
+            if fails_on_none and dominates(checker, access):
+                return True
+        return False
+
+    def is_in_bounds(self, access: Access) -> bool:
+        index = constant_int(access.index)
+        length = constant_length(access.value)
+        if index is not None and length is not None:
+            return 0 <= index < length
+        return self.is_nonnegative(access.index) and any(
+            self.same_value(value, access.value, guard)
+            for value, guard in self.bounds(access, access.index)
+        )
+
+
+class ChocoFlatBoundsCheckElimination(ModulePass):
+    """
+    Mark the list and string accesses whose None check or bounds check can never fail,
+    so that the checks are not generated.
+    """
+
+    name = "choco-flat-bounds-check-elimination"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        user_functions = set(
+            func.func_name.data for func in op.walk() if isinstance(func, FuncDef)
+        )
+        analysis = BoundsAnalysis(user_functions)
+        analysis.find_nonnegative(op)
+        for access in op.walk():
+            if not isinstance(access, (GetAddress, IndexString)):
+                continue
+            if analysis.is_in_bounds(access):
+                # the length of the value has been read, so it is not None either
+                access.properties["in_bounds"] = UnitAttr()
+                access.properties["not_none"] = UnitAttr()
+            elif analysis.is_not_none(access):
+                access.properties["not_none"] = UnitAttr()
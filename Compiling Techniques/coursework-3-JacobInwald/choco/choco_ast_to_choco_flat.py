@@ -1,7 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional, Tuple
 
 from xdsl.dialects.builtin import IntegerAttr, ModuleOp, StringAttr
 from xdsl.ir import (
@@ -23,35 +22,26 @@ from choco.dialects.choco_flat import (
     Store,
     Yield,
 )
+from choco.symbol_table import Scope, SymbolTable
 from choco.type_checking import Type, join, to_attribute
 from util.list_ops import flatten
 
 
-@dataclass
-class SSAValueCtx:
+class SSAValueCtx(SymbolTable[SSAValue]):
     """
     Context that relates identifiers from the AST to SSA values used in the flat representation.
     """
 
-    dictionary: Dict[str, SSAValue] = field(default_factory=dict)
-    parent_scope: Optional[SSAValueCtx] = None
-
-    def __getitem__(self, identifier: str) -> Optional[SSAValue]:
+    def __getitem__(self, identifier: str) -> Optional[SSAValue]:  # type: ignore
         """Check if the given identifier is in the current scope, or a parent scope"""
-        ssa_value = self.dictionary.get(identifier, None)
-        if ssa_value:
-            return ssa_value
-        elif self.parent_scope:
-            return self.parent_scope[identifier]
-        else:
-            return None
+        return self.get(identifier)
 
     def __setitem__(self, identifier: str, ssa_value: SSAValue):
         """Relate the given identifier and SSA value in the current scope"""
-        if identifier in self.dictionary:
+        if identifier in self.current:
             raise Exception()
         else:
-            self.dictionary[identifier] = ssa_value
+            self.declare(identifier, ssa_value)
 
 
 class ChocoASTToChocoFlat(ModulePass):
@@ -193,14 +183,15 @@ def translate_fun_def(ctx: SSAValueCtx, fun_def: choco_ast.FuncDef) -> Operation
         # store the passed parameter value into the allocated memory location
         store = Store.build(operands=[alloc, arg])
         block.add_ops([alloc, store])
-    c = SSAValueCtx(
-        dictionary=dict(zip(param_names, reversed(allocs))), parent_scope=ctx
-    )
-    block.add_ops(
-        flatten(
-            [translate_def_or_stmt(c, op) for op in fun_def.func_body.blocks[0].ops]
+    with ctx.scope(Scope(dict(zip(param_names, reversed(allocs))))):
+        block.add_ops(
+            flatten(
+                [
+                    translate_def_or_stmt(ctx, op)
+                    for op in fun_def.func_body.blocks[0].ops
+                ]
+            )
         )
-    )
     body.add_block(block)
 
     return choco_flat.FuncDef.create(
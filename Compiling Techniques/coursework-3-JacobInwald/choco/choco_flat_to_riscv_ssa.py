@@ -17,22 +17,6 @@ from xdsl.pattern_rewriter import (
 from choco.dialects.choco_flat import *
 from riscv.ssa_dialect import *
 
-cur_imm: LIOp = None
-
-def def_imm(imm) -> Operation:
-    global cur_imm
-    
-    if cur_imm is None or \
-        cur_imm.immediate.value.data != imm:
-        constant = LIOp(imm)
-        cur_imm = constant
-        return constant, True
-    return cur_imm, False
-
-def reset_imm():
-    global cur_imm
-    cur_imm = None
-
 
 class LiteralPattern(RewritePattern):
 
@@ -124,6 +108,29 @@ class UnaryExprPattern(RewritePattern):
             raise NotImplementedError(f'UnaryExprPattern: {op} {e}')
 
 
+def constant_operand(value: SSAValue) -> int | None:
+    """The value of an int operand that is a constant, lowered yet or not."""
+    op = value.owner
+    if isinstance(op, LIOp) and isinstance(op.immediate, IntegerAttr):
+        return op.immediate.value.data
+    if isinstance(op, Literal) and isinstance(op.value, IntegerAttr):
+        return op.value.parameters[0].data
+    return None
+
+
+def log2(value: int | None) -> int | None:
+    """The exponent of a power of two."""
+    if value is None or value <= 0 or value & (value - 1):
+        return None
+    return value.bit_length() - 1
+
+
+def erase_if_unused(value: SSAValue, rewriter: PatternRewriter):
+    """Erase a constant that is no longer used after a rewrite."""
+    if isinstance(value.owner, LIOp) and not value.uses:
+        rewriter.erase_op(value.owner)
+
+
 class BinaryExprPattern(RewritePattern):
     @op_type_rewrite_pattern
     def match_and_rewrite(self, bin_op: BinaryExpr, rewriter: PatternRewriter):
@@ -147,14 +154,14 @@ class BinaryExprPattern(RewritePattern):
             sub = SubOp(lhs, rhs)
             rewriter.replace_op(bin_op, [sub])
         elif op == "*":
-            mul = MULOp(lhs, rhs)
-            rewriter.replace_op(bin_op, [mul])
+            self._mul(bin_op, rewriter)
         elif op == "//":
-            zero = LIOp(0)
-            zero_check = BEQOp(rhs, zero, f"_error_div_zero")
-            div = DIVOp(lhs, rhs)
-            rewriter.replace_op(bin_op, [zero, zero_check, div])
+            self._div(bin_op, rewriter)
         elif op == "%":
+            if constant_operand(rhs):
+                # the divisor is a constant that is not zero
+                rewriter.replace_op(bin_op, [REMOp(lhs, rhs)])
+                return
             zero = LIOp(0)
             zero_check = BEQOp(rhs, zero, f"_error_div_zero")
             rem = REMOp(lhs, rhs)
@@ -188,6 +195,42 @@ class BinaryExprPattern(RewritePattern):
             rewriter.replace_op(bin_op, [xor, eq])
         else:
             raise NotImplementedError(f'BinaryExprPattern: {op} {lhs} {rhs}')
+
+    def _mul(self, bin_op: BinaryExpr, rewriter: PatternRewriter):
+        """Multiply by a power of two with a shift."""
+        lhs = bin_op.lhs
+        rhs = bin_op.rhs
+        for value, factor in [(lhs, rhs), (rhs, lhs)]:
+            shift = log2(constant_operand(factor))
+            if shift is None:
+                continue
+            if shift == 0:
+                rewriter.replace_op(bin_op, [], [value])
+            else:
+                rewriter.replace_op(bin_op, [SLLIOp(value, shift)])
+            erase_if_unused(factor, rewriter)
+            return
+        rewriter.replace_op(bin_op, [MULOp(lhs, rhs)])
+
+    def _div(self, bin_op: BinaryExpr, rewriter: PatternRewriter):
+        """
+        A division by a constant that is not zero does not need the check for zero.
+        It is not turned into a shift for powers of two, since `srai` shifts negative
+        numbers logically in riscemu.
+        """
+        lhs = bin_op.lhs
+        rhs = bin_op.rhs
+        divisor = constant_operand(rhs)
+        if divisor == 1:
+            rewriter.replace_op(bin_op, [], [lhs])
+            erase_if_unused(rhs, rewriter)
+        elif divisor:
+            rewriter.replace_op(bin_op, [DIVOp(lhs, rhs)])
+        else:
+            zero = LIOp(0)
+            zero_check = BEQOp(rhs, zero, f"_error_div_zero")
+            div = DIVOp(lhs, rhs)
+            rewriter.replace_op(bin_op, [zero, zero_check, div])
         
 
 class IfPattern(RewritePattern):
@@ -207,7 +250,7 @@ class IfPattern(RewritePattern):
         rewriter.insert_op_after_matched_op(after_label)   
         rewriter.inline_block_after_matched_op(else_block)
         rewriter.insert_op_after_matched_op(else_label)   
-        rewriter.insert_op_after_matched_op(JOp(f"_if_expr_after_{self.counter}"))
+        rewriter.insert_op_after_matched_op(JOp(f"_if_after_{self.counter}"))
         rewriter.inline_block_after_matched_op(then_block)
         
         rewriter.replace_matched_op([zero, branch])
@@ -233,17 +276,15 @@ class AndPattern(RewritePattern):
         zero = LIOp(0)
         branch = BEQOp(lhs_, zero, f"_and_after_{self.counter}")
 
-        res = AllocOp()
-        store_lhs = SWOp(lhs_, res.rd, 0)
-        store_rhs = SWOp(rhs_, res.rd, 0)
-        load_res = LWOp(res, 0)
-        
-        rewriter.insert_op_after_matched_op(load_res)
-        rewriter.insert_op_after_matched_op([store_rhs, after_label])
+        res = PhiOp()
+        assign_lhs = AssignOp(res, lhs_)
+        assign_rhs = AssignOp(res, rhs_)
+
+        rewriter.insert_op_after_matched_op([assign_rhs, after_label])
         rewriter.inline_block_after_matched_op(rhs_block)
-        rewriter.insert_op_after_matched_op([store_lhs, branch])
+        rewriter.insert_op_after_matched_op([assign_lhs, branch])
         rewriter.inline_block_after_matched_op(lhs_block)
-        rewriter.replace_matched_op([res, zero], [load_res.rd])
+        rewriter.replace_matched_op([res, zero], [res.rd])
         
         self.counter += 1
 
@@ -266,17 +307,15 @@ class OrPattern(RewritePattern):
         one = LIOp(1)
         branch = BEQOp(lhs_, one, f"_or_after_{self.counter}")
         
-        res = AllocOp()
-        store_lhs = SWOp(lhs_, res.rd, 0)
-        store_rhs = SWOp(rhs_, res.rd, 0)
-        load_res = LWOp(res, 0)
-        
-        rewriter.insert_op_after_matched_op(load_res)
-        rewriter.insert_op_after_matched_op([store_rhs, after_label])
+        res = PhiOp()
+        assign_lhs = AssignOp(res, lhs_)
+        assign_rhs = AssignOp(res, rhs_)
+
+        rewriter.insert_op_after_matched_op([assign_rhs, after_label])
         rewriter.inline_block_after_matched_op(rhs_block)
-        rewriter.insert_op_after_matched_op([store_lhs, branch])
+        rewriter.insert_op_after_matched_op([assign_lhs, branch])
         rewriter.inline_block_after_matched_op(lhs_block)
-        rewriter.replace_matched_op([res, one], [load_res.rd])
+        rewriter.replace_matched_op([res, one], [res.rd])
         
         self.counter += 1
 
@@ -299,18 +338,16 @@ class IfExprPattern(RewritePattern):
         branch = BEQOp(cond, zero, f"_if_expr_else_{self.counter}")
         jump = JOp(f"_if_expr_after_{self.counter}")
         
-        res = AllocOp()
+        res = PhiOp()
 
-        store_then = SWOp(then_.value, res.rd, 0)
-        store_else = SWOp(else_.value, res.rd, 0)
-        ret = LWOp(res.rd, 0)
-        
-        rewriter.insert_op_after_matched_op([store_else, after_label, ret])  
+        assign_then = AssignOp(res, then_.value)
+        assign_else = AssignOp(res, else_.value)
+
+        rewriter.insert_op_after_matched_op([assign_else, after_label])
         rewriter.inline_block_after_matched_op(else_block)
-        rewriter.insert_op_after_matched_op([store_then, jump, else_label])
+        rewriter.insert_op_after_matched_op([assign_then, jump, else_label])
         rewriter.inline_block_after_matched_op(then_block)
-        # Need to yield the else_.value
-        rewriter.replace_matched_op([zero, res, branch], [ret.rd])
+        rewriter.replace_matched_op([zero, res, branch], [res.rd])
         
         self.counter += 1
 
@@ -336,6 +373,19 @@ class WhilePattern(RewritePattern):
         self.counter += 1
 
 
+class PhiPattern(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, phi: Phi, rewriter: PatternRewriter):
+        res = PhiOp()
+        rewriter.replace_matched_op(res, [res.rd])
+
+
+class AssignPattern(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, assign: Assign, rewriter: PatternRewriter):
+        rewriter.replace_matched_op(AssignOp(assign.target, assign.value))
+
+
 class ListExprPattern(RewritePattern):
     @op_type_rewrite_pattern
     def match_and_rewrite(self, list_expr: ListExpr, rewriter: PatternRewriter):
@@ -356,34 +406,47 @@ class ListExprPattern(RewritePattern):
         rewriter.replace_matched_op(ops, [res.result])
 
 
+def index_checks(access: GetAddress | IndexString) -> list[Operation]:
+    """
+    The checks that the indexed value is not None and that the index is within its
+    bounds, unless they are known to hold. A negative index is a large unsigned number,
+    so a single unsigned comparison checks both bounds.
+    """
+    val = access.value
+    index = access.index
+    ops = []
+    if access.in_bounds is None:
+        if access.not_none is None:
+            zero = LIOp(0)
+            # Check List is not None
+            ops += [zero, BEQOp(val, zero, f"_list_index_none")]
+        # Check Index is not out of bounds
+        length = LWOp(val, 0)
+        maybe_fail_oob = BGEUOp(
+            index, length, f"_list_index_oob", comment="index < 0 or index >= length"
+        )
+        ops += [length, maybe_fail_oob]
+    return ops
+
+
 class GetAddressPattern(RewritePattern):
     @op_type_rewrite_pattern
     def match_and_rewrite(self, get_address: GetAddress, rewriter: PatternRewriter):
         val = get_address.value
         index = get_address.index
-        # Constants
-        zero = LIOp(0)
-        one = LIOp(1)
-        four = LIOp(4)
-        # Check List is not None
-        maybe_fail_none = BEQOp(val, zero, f"_list_index_none")
-        
-        # Check Index is not out of bounds
-        is_neg = SLTIOp(index, 0) # index < 0
-        add_ = AddIOp(index, 1)
-        length = LWOp(val, 0)
-        is_big = SLTOp(length, add_) # index < length
-        is_oob = OROp(is_neg, is_big) # index < 0 or index >= length
-        maybe_fail_oob = BEQOp(is_oob, one, f"_list_index_oob")
-        
-        # Calculate Address
-        mul = MULOp(add_, four)
-        add = AddOp(val, mul)
+        # Calculate Address, after the length
+        shift = SLLIOp(index, 2)
+        add = AddOp(val, shift)
+        address = AddIOp(add, 4)
         # Replace Op
-        rewriter.replace_matched_op([zero, one, four, \
-                                        maybe_fail_none, \
-                                        add_, is_neg, length, is_big, is_oob, maybe_fail_oob,\
-                                        mul, add])
+        rewriter.replace_matched_op(index_checks(get_address) + [shift, add, address])
+
+
+class OffsetAddressPattern(RewritePattern):
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, offset: OffsetAddress, rewriter: PatternRewriter):
+        address = AddIOp(offset.memloc, 4 * offset.offset.value.data)
+        rewriter.replace_matched_op(address)
 
 
 class IndexStringPattern(RewritePattern):
@@ -392,24 +455,12 @@ class IndexStringPattern(RewritePattern):
         val = index_str.value
         index = index_str.index
         # Constants
-        zero = LIOp(0)
         one = LIOp(1)
-        four = LIOp(4)
-        # Check List is not None
-        maybe_fail_none = BEQOp(val, zero, f"_list_index_none")
-        
-        # Check Index is not out of bounds
-        is_neg = SLTIOp(index, 0, comment="index < 0")
-        add_ = AddIOp(index, 1)
-        length = LWOp(val, 0)
-        is_big = SLTOp(length, add_, comment="index < length")
-        is_oob = OROp(is_neg, is_big, comment="index < 0 or index >= length")
-        maybe_fail_oob = BEQOp(is_oob, one, f"_list_index_oob")
         
         # Calculate Address
-        mul = MULOp(add_, four)
-        add = AddOp(val, mul)
-        char = LWOp(add, 0)
+        shift = SLLIOp(index, 2)
+        add = AddOp(val, shift)
+        char = LWOp(add, 4)
         
         # Constants
         size = LIOp(8)
@@ -424,10 +475,8 @@ class IndexStringPattern(RewritePattern):
         res_addr = SWOp(res.result, memloc, 0)
         
         # Replace Op
-        rewriter.replace_matched_op([zero, one, four, \
-                                        maybe_fail_none, \
-                                        add_, is_neg, length, is_big, is_oob, maybe_fail_oob,\
-                                        mul, add, char, size, res, s_len, s_char, memloc, res_addr], [memloc.rd])
+        rewriter.replace_matched_op(index_checks(index_str) + [one, \
+                                        shift, add, char, size, res, s_len, s_char, memloc, res_addr], [memloc.rd])
 
 
 
@@ -477,8 +526,11 @@ class ChocoFlatToRISCVSSA(ModulePass):
                     OrPattern(),
                     IfExprPattern(),
                     WhilePattern(),
+                    PhiPattern(),
+                    AssignPattern(),
                     ListExprPattern(),
                     GetAddressPattern(),
+                    OffsetAddressPattern(),
                     IndexStringPattern(),
                     FuncDefPattern(),
                     ReturnPattern(),
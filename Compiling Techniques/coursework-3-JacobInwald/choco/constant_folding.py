@@ -117,6 +117,9 @@ class BinaryExprRewriter(RewritePattern):
             rhs_value = expr.rhs.op.value.data
         else:
             return
+        if expr.op.data in ["//", "%"] and rhs_value == 0:
+            # keep the division by zero error for the program to raise
+            return
         result_value = apply_str_op(expr.op.data, lhs_value, rhs_value)
         new_constant = Literal.get(result_value)
         rewriter.replace_matched_op([new_constant], [new_constant.result])
@@ -0,0 +1,384 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Union
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp
+from xdsl.ir import Block, MLContext, Operation, Region, SSAValue
+from xdsl.passes import ModulePass
+from xdsl.pattern_rewriter import (
+    GreedyRewritePatternApplier,
+    PatternRewriter,
+    PatternRewriteWalker,
+    RewritePattern,
+    op_type_rewrite_pattern,
+)
+
+from choco.dialects import choco_type
+from choco.dialects.choco_flat import *
+
+
+@dataclass(frozen=True)
+class LatticeMarker:
+    name: str
+
+
+# The lattice of a value is UNDEFINED while no definition of it has been found to be
+# reachable, an int or bool constant, or OVERDEFINED if it may hold different values.
+UNDEFINED = LatticeMarker("undefined")
+OVERDEFINED = LatticeMarker("overdefined")
+
+LatticeValue = Union[int, bool, LatticeMarker]
+
+# The values stored in the tracked memory locations at a point of the program.
+Environment = Dict[SSAValue, LatticeValue]
+
+MIN_INT = -(2**31)
+MAX_INT = 2**31 - 1
+
+
+def join(v1: LatticeValue, v2: LatticeValue) -> LatticeValue:
+    if v1 is UNDEFINED:
+        return v2
+    if v2 is UNDEFINED:
+        return v1
+    if type(v1) is type(v2) and v1 == v2:
+        return v1
+    return OVERDEFINED
+
+
+def join_environments(env1: Environment, env2: Environment) -> Environment:
+    env = dict(env1)
+    for memloc, value in env2.items():
+        env[memloc] = join(env.get(memloc, UNDEFINED), value)
+    return env
+
+
+def is_constant(value: LatticeValue) -> bool:
+    return not isinstance(value, LatticeMarker)
+
+
+def fold_unary_expr(op: str, value: LatticeValue) -> LatticeValue:
+    if isinstance(value, LatticeMarker):
+        return value
+    if op == "not":
+        return not value
+    if op == "-" and MIN_INT <= -value <= MAX_INT:
+        return -value
+    return OVERDEFINED
+
+
+def fold_binary_expr(op: str, lhs: LatticeValue, rhs: LatticeValue) -> LatticeValue:
+    if lhs is UNDEFINED or rhs is UNDEFINED:
+        return UNDEFINED
+    if isinstance(lhs, LatticeMarker) or isinstance(rhs, LatticeMarker):
+        return OVERDEFINED
+    if op in ["//", "%"]:
+        # Keep the division by zero error, and do not fold negative operands, for
+        # which the generated code rounds towards zero.
+        if rhs <= 0 or lhs < 0:
+            return OVERDEFINED
+        return lhs // rhs if op == "//" else lhs % rhs
+    if op == "+":
+        result = lhs + rhs
+    elif op == "-":
+        result = lhs - rhs
+    elif op == "*":
+        result = lhs * rhs
+    elif op == "<":
+        return lhs < rhs
+    elif op == "<=":
+        return lhs <= rhs
+    elif op == ">":
+        return lhs > rhs
+    elif op == ">=":
+        return lhs >= rhs
+    elif op == "==":
+        return lhs == rhs
+    elif op == "!=":
+        return lhs != rhs
+    elif op == "and":
+        return lhs and rhs
+    elif op == "or":
+        return lhs or rhs
+    else:
+        return OVERDEFINED
+    if MIN_INT <= result <= MAX_INT:
+        return result
+    return OVERDEFINED
+
+
+def literal_value(literal: Literal) -> LatticeValue:
+    value = literal.value
+    if isinstance(value, IntegerAttr):
+        return value.parameters[0].data  # type: ignore
+    if isinstance(value, BoolAttr):
+        return value.data
+    return OVERDEFINED
+
+
+def yielded_value(region: Region) -> SSAValue:
+    yield_ = region.block.last_op
+    assert isinstance(yield_, Yield)
+    return yield_.value  # type: ignore
+
+
+def enclosing_function(op: Operation) -> Optional[Operation]:
+    parent = op.parent_op()
+    while parent is not None and not isinstance(parent, FuncDef):
+        parent = parent.parent_op()
+    return parent
+
+
+def tracked_memlocs(module: ModuleOp) -> Set[SSAValue]:
+    """
+    Collect the int and bool memory locations that do not escape the function that
+    allocates them: they are only loaded from and stored to, and only in that
+    function, so calls cannot change them.
+    """
+    memlocs: Set[SSAValue] = set()
+    for op in module.walk():
+        if not isinstance(op, Alloc):
+            continue
+        if op.type not in [choco_type.int_type, choco_type.bool_type]:
+            continue
+        function = enclosing_function(op)
+        if all(
+            (
+                isinstance(use.operation, Load)
+                or (isinstance(use.operation, Store) and use.index == 0)
+            )
+            and enclosing_function(use.operation) is function
+            for use in op.memloc.uses
+        ):
+            memlocs.add(op.memloc)
+    return memlocs
+
+
+@dataclass
+class ConstantPropagation:
+    """
+    Conditional constant propagation over the structured control flow of choco_flat.
+
+    Each function is interpreted over the lattice of constants, with the values of the
+    tracked memory locations in an environment. Branches whose condition is constant
+    are not visited, so the constants of the other branch are not lost, and loops are
+    visited again until the environment at their head reaches a fixpoint.
+    """
+
+    tracked: Set[SSAValue]
+    values: Dict[SSAValue, LatticeValue] = field(default_factory=dict)
+    # The condition of each If, While and IfExpr, and the left-hand side of each
+    # EffectfulBinaryExpr, when last visited.
+    conditions: Dict[Operation, LatticeValue] = field(default_factory=dict)
+
+    def value(self, value: SSAValue) -> LatticeValue:
+        return self.values.get(value, OVERDEFINED)
+
+    def visit_block(self, block: Block, env: Environment) -> Environment:
+        for op in block.ops:
+            env = self.visit_op(op, env)
+        return env
+
+    def visit_op(self, op: Operation, env: Environment) -> Environment:
+        if isinstance(op, FuncDef):
+            # functions only share escaping memory locations, which are not tracked
+            self.visit_block(op.func_body.block, {})
+        elif isinstance(op, Literal):
+            self.values[op.result] = literal_value(op)
+        elif isinstance(op, Load):
+            if op.memloc in self.tracked:
+                self.values[op.result] = env.get(op.memloc, UNDEFINED)
+            else:
+                self.values[op.result] = OVERDEFINED
+        elif isinstance(op, Store):
+            if op.memloc in self.tracked:
+                env[op.memloc] = self.value(op.value)
+        elif isinstance(op, UnaryExpr):
+            self.values[op.result] = fold_unary_expr(
+                op.op.data, self.value(op.value)  # type: ignore
+            )
+        elif isinstance(op, BinaryExpr):
+            self.values[op.result] = fold_binary_expr(
+                op.op.data, self.value(op.lhs), self.value(op.rhs)  # type: ignore
+            )
+        elif isinstance(op, If):
+            cond = self.value(op.cond)
+            self.conditions[op] = cond
+            if cond is True:
+                env = self.visit_block(op.then.block, env)
+            elif cond is False:
+                env = self.visit_block(op.orelse.block, env)
+            elif cond is OVERDEFINED:
+                env = join_environments(
+                    self.visit_block(op.then.block, dict(env)),
+                    self.visit_block(op.orelse.block, dict(env)),
+                )
+        elif isinstance(op, IfExpr):
+            cond = self.value(op.cond)
+            self.conditions[op] = cond
+            value: LatticeValue = UNDEFINED
+            if cond is True or cond is OVERDEFINED:
+                then_env = self.visit_block(op.then.block, dict(env))
+                value = join(value, self.value(op.then_ssa_value))
+            else:
+                then_env = env
+            if cond is False or cond is OVERDEFINED:
+                or_else_env = self.visit_block(op.or_else.block, dict(env))
+                value = join(value, self.value(op.or_else_ssa_value))
+            else:
+                or_else_env = then_env
+            if cond is not UNDEFINED:
+                env = join_environments(then_env, or_else_env)
+            self.values[op.result] = value
+        elif isinstance(op, EffectfulBinaryExpr):
+            env = self.visit_block(op.lhs.block, env)
+            lhs = self.value(yielded_value(op.lhs))
+            self.conditions[op] = lhs
+            # `and` stops at False, `or` at True
+            stop = op.op.data == "or"
+            if lhs is UNDEFINED or lhs is stop:
+                self.values[op.result] = lhs
+            elif lhs is (not stop):
+                env = self.visit_block(op.rhs.block, env)
+                self.values[op.result] = self.value(yielded_value(op.rhs))
+            else:
+                env = join_environments(env, self.visit_block(op.rhs.block, dict(env)))
+                self.values[op.result] = join(stop, self.value(yielded_value(op.rhs)))
+        elif isinstance(op, While):
+            while True:
+                cond_env = self.visit_block(op.cond.block, dict(env))
+                cond = self.value(op.cond_ssa_value)
+                self.conditions[op] = cond
+                if cond is False or cond is UNDEFINED:
+                    break
+                body_env = self.visit_block(op.body.block, dict(cond_env))
+                head_env = join_environments(env, body_env)
+                if head_env == env:
+                    break
+                env = head_env
+            env = cond_env
+        elif isinstance(op, For):
+            while True:
+                body_env = self.visit_block(op.body.block, dict(env))
+                head_env = join_environments(env, body_env)
+                if head_env == env:
+                    break
+                env = head_env
+        else:
+            for result in op.results:
+                self.values[result] = OVERDEFINED
+        return env
+
+
+def inline_region_before(region: Region, rewriter: PatternRewriter) -> SSAValue:
+    """
+    Move the operations of a region that ends with a yield in front of the matched
+    operation and return the yielded value.
+    """
+    yield_ = region.block.last_op
+    assert isinstance(yield_, Yield)
+    value = yield_.value
+    rewriter.erase_op(yield_)
+    rewriter.inline_block_before_matched_op(region.block)
+    return value  # type: ignore
+
+
+@dataclass
+class ConstantValueRewriter(RewritePattern):
+    analysis: ConstantPropagation
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
+        self, op: Union[Load, UnaryExpr, BinaryExpr], rewriter: PatternRewriter
+    ) -> None:
+        value = self.analysis.values.get(op.result, OVERDEFINED)
+        if is_constant(value):
+            rewriter.replace_matched_op(Literal.get(value))  # type: ignore
+
+
+@dataclass
+class IfRewriter(RewritePattern):
+    analysis: ConstantPropagation
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
+        self, if_: If, rewriter: PatternRewriter
+    ) -> None:
+        cond = self.analysis.conditions.get(if_)
+        if cond is True or cond is False:
+            block = if_.then.block if cond else if_.orelse.block
+            rewriter.inline_block_before_matched_op(block)
+            rewriter.erase_matched_op()
+
+
+@dataclass
+class WhileRewriter(RewritePattern):
+    analysis: ConstantPropagation
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
+        self, while_: While, rewriter: PatternRewriter
+    ) -> None:
+        if self.analysis.conditions.get(while_) is False:
+            # the condition is still evaluated once, the body is unreachable
+            inline_region_before(while_.cond, rewriter)
+            rewriter.erase_matched_op()
+
+
+@dataclass
+class IfExprRewriter(RewritePattern):
+    analysis: ConstantPropagation
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
+        self, if_expr: IfExpr, rewriter: PatternRewriter
+    ) -> None:
+        cond = self.analysis.conditions.get(if_expr)
+        if cond is True or cond is False:
+            region = if_expr.then if cond else if_expr.or_else
+            value = inline_region_before(region, rewriter)
+            rewriter.replace_matched_op([], [value])
+
+
+@dataclass
+class EffectfulBinaryExprRewriter(RewritePattern):
+    analysis: ConstantPropagation
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
+        self, expr: EffectfulBinaryExpr, rewriter: PatternRewriter
+    ) -> None:
+        lhs = self.analysis.conditions.get(expr)
+        if lhs is not True and lhs is not False:
+            return
+        value = inline_region_before(expr.lhs, rewriter)
+        if lhs is (expr.op.data == "and"):
+            # the right-hand side decides the result
+            value = inline_region_before(expr.rhs, rewriter)
+        rewriter.replace_matched_op([], [value])
+
+
+class ChocoFlatConstantPropagation(ModulePass):
+    """
+    Propagate int and bool constants through the memory locations that do not escape
+    their function, fold the conditions that become constant, and delete the branches
+    and loop bodies that can never execute.
+    """
+
+    name = "choco-flat-constant-propagation"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        analysis = ConstantPropagation(tracked_memlocs(op))
+        analysis.visit_block(op.body.block, {})
+
+        walker = PatternRewriteWalker(
+            GreedyRewritePatternApplier(
+                [
+                    ConstantValueRewriter(analysis),
+                    IfRewriter(analysis),
+                    WhileRewriter(analysis),
+                    IfExprRewriter(analysis),
+                    EffectfulBinaryExprRewriter(analysis),
+                ]
+            )
+        )
+        walker.rewrite_module(op)
@@ -1,111 +1,103 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
 
 from xdsl.dialects.builtin import ModuleOp
-from xdsl.ir import MLContext
+from xdsl.ir import MLContext, Operation, OpResult, SSAValue
 from xdsl.passes import ModulePass
-from xdsl.pattern_rewriter import (
-    GreedyRewritePatternApplier,
-    PatternRewriter,
-    PatternRewriteWalker,
-    RewritePattern,
-    op_type_rewrite_pattern,
-)
 
 from choco.dialects.choco_flat import *
-from choco.dialects.choco_type import *
+from choco.effects import Effects, function_effects, op_effects
 
 
-class AllocRewriter(RewritePattern):
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, alloc: Alloc, rewriter: PatternRewriter
-    ) -> None:
-        if len(alloc.memloc.uses) == 0:
-            rewriter.erase_op(alloc)
-        return
+def is_variable(memloc: SSAValue) -> bool:
+    return isinstance(memloc, OpResult) and isinstance(memloc.op, Alloc)
 
-@dataclass
-class StoreRewriter(RewritePattern):
-    
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, store: Store, rewriter: PatternRewriter
-    ) -> None:
-        get_address = isinstance(store.memloc.op, (GetAddress, IndexString))
-        if get_address:
-            return
-        
-        uses = store.memloc.uses
-        all_stores = all([isinstance(use.operation, Store) for use in uses])
-        
-        if all_stores or len(uses) == 0:
-            rewriter.erase_op(store)
 
 @dataclass
-class LoadRewriter(RewritePattern):
-    
-    @op_type_rewrite_pattern
-    def match_and_rewrite(self, load: Load, rewriter: PatternRewriter) -> None:
+class DeadCodeElimination:
+    """
+    Mark the operations whose effect or result is needed, and delete the others.
 
-        if len(load.result.uses) == 0 or \
-            len(load.results[0].uses) == 0:
-            rewriter.replace_op(load, [], [None])
-        return
+    The operations that may write memory other than variables, fail or loop forever
+    are needed, as are functions and returns. Then an operation is needed if it
+    computes an operand of a needed operation, contains one, or is the store to a
+    variable that a needed load may read. Stores are matched with loads by variable
+    only, so a store is kept if the variable is loaded anywhere.
+    """
 
-@dataclass
-class LiteralRewriter(RewritePattern):
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, literal: Literal, rewriter: PatternRewriter
-    ) -> None:
-        if len(literal.results[0].uses) == 0:
-            rewriter.replace_op(literal, [], [None])
-        return
+    functions: Dict[str, Effects]
+    live: Set[Operation] = field(default_factory=set)
+    worklist: List[Operation] = field(default_factory=list)
+    # The stores and for loops that write each variable.
+    writes: Dict[SSAValue, List[Operation]] = field(default_factory=dict)
 
+    def mark(self, op: Operation) -> None:
+        if op not in self.live:
+            self.live.add(op)
+            self.worklist.append(op)
+
+    def is_root(self, op: Operation) -> bool:
+        if isinstance(op, (FuncDef, Return)):
+            return True
+        if isinstance(op, Store):
+            return not is_variable(op.memloc)
+        if isinstance(op, CallExpr) and op.removable is not None:
+            return False
+        return not op_effects(op, self.functions).is_removable
+
+    def run(self, module: ModuleOp) -> None:
+        for op in module.walk():
+            if isinstance(op, ModuleOp):
+                continue
+            for memloc in op.operands:
+                if is_variable(memloc) and not isinstance(op, Load):
+                    self.writes.setdefault(memloc, []).append(op)
+            if self.is_root(op):
+                self.mark(op)
+        while self.worklist:
+            op = self.worklist.pop()
+            for operand in op.operands:
+                if isinstance(operand, OpResult):
+                    self.mark(operand.op)
+            parent = op.parent_op()
+            if parent is not None and not isinstance(parent, ModuleOp):
+                self.mark(parent)
+            if isinstance(op, Load):
+                for write in self.writes.get(op.memloc, []):
+                    self.mark(write)
+            if isinstance(op, Phi):
+                for use in op.result.uses:
+                    if isinstance(use.operation, Assign) and use.index == 0:
+                        self.mark(use.operation)
+            for region in op.regions:
+                # the values a live operation yields are needed, such as conditions
+                for yield_ in region.ops:
+                    if isinstance(yield_, Yield):
+                        self.mark(yield_)
+
+    def sweep(self, module: ModuleOp) -> None:
+        dead = [
+            op
+            for op in module.walk()
+            if op not in self.live and not isinstance(op, ModuleOp)
+        ]
+        # the users of a value come after it, or are nested in an operation after it
+        for op in reversed(dead):
+            if op.parent is not None and op.parent_op() is not None:
+                op.detach()
+                op.erase(safe_erase=False)
 
-@dataclass
-class BinaryExprRewriter(RewritePattern):
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, expr: BinaryExpr, rewriter: PatternRewriter
-    ) -> None:
-        if expr.op.data == "//":
-            return
-        if len(expr.results[0].uses) == 0:
-            rewriter.replace_op(expr, [], [None])
-        return
-
-
-class OperationRewriter:
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, expr: Operation, rewriter: PatternRewriter
-    ) -> None:
-        if isinstance(expr, (ModuleOp, EffectfulBinaryExpr, IfExpr, CallExpr, \
-                                Alloc, Store, Load, Literal, BinaryExpr)):
-            return
-        if len(expr.results) > 0 and \
-            len(expr.results[0].uses) == 0 and\
-            not isinstance(expr, (ModuleOp, EffectfulBinaryExpr, IfExpr, CallExpr)):
-            rewriter.erase_op(expr)
-        return
 
 class ChocoFlatDeadCodeElimination(ModulePass):
+    """
+    Delete the operations whose result is unused and that have no effect, including
+    the calls of functions that have none, the stores to variables that are never
+    loaded, and the branches that are left empty.
+    """
+
     name = "choco-flat-dead-code-elimination"
 
     def apply(self, ctx: MLContext, op: ModuleOp) -> None:
-        walker = PatternRewriteWalker(
-            GreedyRewritePatternApplier(
-                [
-                    LiteralRewriter(),
-                    BinaryExprRewriter(),
-                    StoreRewriter(),
-                    LoadRewriter(),
-                    OperationRewriter(),
-                    AllocRewriter(),
-                ]
-            ),
-            walk_reverse=True,
-        )
-        walker.rewrite_module(op)
-        return
+        dce = DeadCodeElimination(function_effects(op))
+        dce.run(op)
+        dce.sweep(op)
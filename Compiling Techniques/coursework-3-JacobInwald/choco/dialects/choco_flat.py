@@ -3,7 +3,7 @@ from __future__ import annotations
 from io import StringIO
 from typing import List, Type, Union
 
-from xdsl.dialects.builtin import IntegerAttr, StringAttr
+from xdsl.dialects.builtin import IntegerAttr, StringAttr, UnitAttr
 from xdsl.ir import (
     Attribute,
     Data,
@@ -185,6 +185,9 @@ class Assign(IRDLOperation):
         ):
             # TODO: I don't know what to do here, so I pass
             pass
+        elif isinstance(self.target.type, MemlocType):  # type: ignore
+            if self.value.type != self.target.type:  # type: ignore
+                error(self, "expected types to match")
         else:
             from choco.type_checking import Type, check_assignment_compatibility
 
@@ -193,6 +196,19 @@ class Assign(IRDLOperation):
             check_assignment_compatibility(value_type, target_type)
 
 
+@irdl_op_definition
+class Phi(IRDLOperation):
+    name = "choco.ir.phi"
+
+    # The value of a variable where control flow joins, set by the `Assign` operations
+    # at the end of the branches and loop bodies flowing into the join.
+    result: OpResult = result_def()
+
+    @staticmethod
+    def get(type: Attribute) -> Phi:
+        return Phi.build(result_types=[type])
+
+
 # Expressions
 
 
@@ -317,6 +333,9 @@ class CallExpr(IRDLOperation):
     result: OptOpResult = opt_result_def()
 
     type_hint: Attribute | None = opt_prop_def(Attribute)
+    # Set when the called function has no effect, so that the call can be removed if
+    # its result is unused.
+    removable: UnitAttr | None = opt_prop_def(UnitAttr)
 
 
 @irdl_op_definition
@@ -363,6 +382,10 @@ class IndexString(IRDLOperation):
     value: Operand = operand_def(Attribute)
     index: Operand = operand_def(choco_type.int_type)
     result: OpResult = result_def(MemlocType)
+    # Set when the value is known not to be None, and when the index is known to be
+    # within the bounds of the value, so that the checks are not generated.
+    not_none: UnitAttr | None = opt_prop_def(UnitAttr)
+    in_bounds: UnitAttr | None = opt_prop_def(UnitAttr)
 
     traits = frozenset([NoTerminator()])
 
@@ -384,6 +407,10 @@ class GetAddress(IRDLOperation):
     value: Operand = operand_def(Attribute)
     index: Operand = operand_def(choco_type.int_type)
     result: OpResult = result_def(MemlocType)
+    # Set when the value is known not to be None, and when the index is known to be
+    # within the bounds of the value, so that the checks are not generated.
+    not_none: UnitAttr | None = opt_prop_def(UnitAttr)
+    in_bounds: UnitAttr | None = opt_prop_def(UnitAttr)
 
     traits = frozenset([NoTerminator()])
 
@@ -398,6 +425,22 @@ class GetAddress(IRDLOperation):
             error(self, "expected List of String type")
 
 
+@irdl_op_definition
+class OffsetAddress(IRDLOperation):
+    name = "choco.ir.offset_address"
+
+    # The address of the element `offset` elements after the one at `memloc`.
+    memloc: Operand = operand_def(MemlocType)
+    offset: IntegerAttr = prop_def(IntegerAttr)
+    result: OpResult = result_def(MemlocType)
+
+    traits = frozenset([NoTerminator()])
+
+    def verify_(self) -> None:
+        if self.result.type != self.memloc.type:  # type: ignore
+            error(self, "expected types to match")
+
+
 @irdl_op_definition
 class Load(IRDLOperation):
     name = "choco.ir.load"
@@ -457,6 +500,7 @@ choco_flat_ops: List[Type[Operation]] = [
     Pass,
     Return,
     Assign,
+    Phi,
     Literal,
     UnaryExpr,
     BinaryExpr,
@@ -468,6 +512,7 @@ choco_flat_ops: List[Type[Operation]] = [
     Alloc,
     GetAddress,
     IndexString,
+    OffsetAddress,
     Load,
     Store,
     Yield,
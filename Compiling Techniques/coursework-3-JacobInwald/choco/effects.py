@@ -0,0 +1,125 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Operation, OpResult, SSAValue
+
+from choco.constant_propagation import enclosing_function
+from choco.dialects.choco_flat import *
+from choco.inliner import call_graph, recursive_functions
+
+# The library functions that only compute their result from their arguments, with
+# whether they may raise an error.
+PURE_LIBRARY_FUNCTIONS = {"len": True, "_str_eq": False, "_list_concat": True}
+
+
+@dataclass(frozen=True)
+class Effects:
+    """
+    What running a function, or an operation, may do besides computing its result.
+
+    `writes` covers the stores to memory that outlives the function, printing and
+    reading input, `reads` the loads of such memory. `may_fail` is set if an error may
+    be raised, and `may_loop` if it may not terminate.
+    """
+
+    writes: bool = False
+    reads: bool = False
+    may_fail: bool = False
+    may_loop: bool = False
+
+    def join(self, other: "Effects") -> "Effects":
+        return Effects(
+            self.writes or other.writes,
+            self.reads or other.reads,
+            self.may_fail or other.may_fail,
+            self.may_loop or other.may_loop,
+        )
+
+    @property
+    def is_pure(self) -> bool:
+        """Whether the result only depends on the arguments, and nothing else changes."""
+        return not self.writes and not self.reads
+
+    @property
+    def is_removable(self) -> bool:
+        """Whether the operation can be removed if its result is unused."""
+        return not self.writes and not self.may_fail and not self.may_loop
+
+
+UNKNOWN = Effects(writes=True, reads=True, may_fail=True, may_loop=True)
+
+
+def is_local(memloc: SSAValue, function: Optional[Operation]) -> bool:
+    """Whether a memory location is a variable allocated by a function."""
+    return (
+        isinstance(memloc, OpResult)
+        and isinstance(memloc.op, Alloc)
+        and enclosing_function(memloc.op) is function
+    )
+
+
+def op_effects(op: Operation, functions: Dict[str, Effects]) -> Effects:
+    """
+    The effects of a single operation, not counting the operations nested in it. The
+    effects of the user functions it may call are taken from `functions`.
+    """
+    if isinstance(op, Store):
+        if is_local(op.memloc, enclosing_function(op)):
+            return Effects()
+        return Effects(writes=True)
+    if isinstance(op, Load):
+        if is_local(op.memloc, enclosing_function(op)):
+            return Effects()
+        return Effects(reads=True)
+    if isinstance(op, (GetAddress, IndexString)):
+        return Effects(may_fail=op.in_bounds is None or op.not_none is None)
+    if isinstance(op, BinaryExpr):
+        return Effects(may_fail=op.op.data in ["//", "%"])
+    if isinstance(op, (While, For)):
+        return Effects(may_loop=True)
+    if isinstance(op, CallExpr):
+        name = op.func_name.data  # type: ignore
+        if name in functions:
+            return functions[name]
+        if name in PURE_LIBRARY_FUNCTIONS:
+            return Effects(may_fail=PURE_LIBRARY_FUNCTIONS[name])
+        return UNKNOWN
+    if isinstance(op, (MemberExpr, ClassDef)):
+        return UNKNOWN
+    return Effects()
+
+
+def body_effects(func: FuncDef, functions: Dict[str, Effects]) -> Effects:
+    effects = Effects()
+    for op in func.func_body.walk():
+        if enclosing_function(op) is func:
+            effects = effects.join(op_effects(op, functions))
+    return effects
+
+
+def function_effects(module: ModuleOp) -> Dict[str, Effects]:
+    """
+    The effects of calling each user function. The functions start without effects,
+    and take on the effects of their bodies and of the functions they call until
+    nothing changes anymore. Recursive functions may not terminate.
+    """
+    funcs = [op for op in module.walk() if isinstance(op, FuncDef)]
+    graph = call_graph(module)
+    recursive = recursive_functions(graph)
+    functions: Dict[str, Effects] = {
+        func.func_name.data: Effects(  # type: ignore
+            may_loop=func.func_name.data in recursive
+        )
+        for func in funcs
+    }
+    changed = True
+    while changed:
+        changed = False
+        for func in funcs:
+            name = func.func_name.data  # type: ignore
+            effects = functions[name].join(body_effects(func, functions))
+            if effects != functions[name]:
+                functions[name] = effects
+                changed = True
+    return functions
@@ -0,0 +1,239 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp, StringAttr, UnitAttr
+from xdsl.ir import Block, MLContext, Region, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import (
+    fold_binary_expr,
+    fold_unary_expr,
+    is_constant,
+)
+from choco.dialects.choco_flat import *
+from choco.effects import Effects, function_effects
+
+Value = Union[None, bool, int, str]
+
+
+class EvaluationError(Exception):
+    """Raised when a call can not be evaluated at compile time."""
+
+
+@dataclass
+class Returned:
+    value: Value
+
+
+def constant_value(value: SSAValue) -> Optional[Literal]:
+    """The literal that computes a value, if it is an int, bool, str or None."""
+    op = value.owner
+    if isinstance(op, Literal) and isinstance(
+        op.value, (IntegerAttr, BoolAttr, StringAttr, NoneAttr)
+    ):
+        return op
+    return None
+
+
+def literal_data(literal: Literal) -> Value:
+    value = literal.value
+    if isinstance(value, IntegerAttr):
+        return value.parameters[0].data  # type: ignore
+    if isinstance(value, (BoolAttr, StringAttr)):
+        return value.data
+    return None
+
+
+@dataclass
+class Evaluator:
+    """
+    Run calls of pure functions with constant arguments at compile time.
+
+    Only ints, bools, strings and None are supported. The evaluation gives up on any
+    other operation, on errors, which are left for the program to raise, after
+    `max_steps` operations, and when calls are nested more than `max_depth` deep.
+    """
+
+    functions: Dict[str, FuncDef]
+    effects: Dict[str, Effects]
+    max_steps: int
+    max_depth: int
+    steps: int = 0
+    depth: int = 0
+    # The values of the SSA values and variables of the running call.
+    frame: Dict[SSAValue, Value] = field(default_factory=dict)
+
+    def call(self, name: str, args: List[Value]) -> Value:
+        func = self.functions.get(name)
+        if func is None or not self.effects[name].is_pure:
+            raise EvaluationError(f"{name} is not a pure user function")
+        if self.depth == self.max_depth:
+            raise EvaluationError("too many nested calls")
+        block = func.func_body.block
+        caller_frame = self.frame
+        self.frame = dict(zip(block.args, args))
+        self.depth += 1
+        try:
+            returned = self.run_block(block)
+        finally:
+            self.frame = caller_frame
+            self.depth -= 1
+        return None if returned is None else returned.value
+
+    def value(self, value: SSAValue) -> Value:
+        if value in self.frame:
+            return self.frame[value]
+        literal = constant_value(value)
+        if literal is None:
+            raise EvaluationError("value defined outside of the function")
+        return literal_data(literal)
+
+    def run_block(self, block: Block) -> Optional[Returned]:
+        for op in block.ops:
+            returned = self.run_op(op)
+            if returned is not None:
+                return returned
+        return None
+
+    def run_region(self, region: Region) -> Value:
+        """Run a region that ends with a yield, and return the yielded value."""
+        yield_ = region.block.last_op
+        assert isinstance(yield_, Yield)
+        for op in region.block.ops:
+            if op is not yield_ and self.run_op(op) is not None:
+                raise EvaluationError("return in an expression")
+        return self.value(yield_.value)
+
+    def run_op(self, op: Operation) -> Optional[Returned]:
+        self.steps += 1
+        if self.steps > self.max_steps:
+            raise EvaluationError("too many steps")
+        if isinstance(op, Literal):
+            if constant_value(op.result) is None:
+                raise EvaluationError(f"unsupported literal {op.value}")
+            self.frame[op.result] = literal_data(op)
+        elif isinstance(op, Alloc):
+            pass
+        elif isinstance(op, Store):
+            self.frame[op.memloc] = self.value(op.value)
+        elif isinstance(op, Load):
+            if op.memloc not in self.frame:
+                raise EvaluationError("load of an unknown variable")
+            self.frame[op.result] = self.value(op.memloc)
+        elif isinstance(op, UnaryExpr):
+            value = fold_unary_expr(op.op.data, self.scalar(op.value))  # type: ignore
+            self.frame[op.result] = self.constant(value)
+        elif isinstance(op, BinaryExpr):
+            self.frame[op.result] = self.binary_expr(op)
+        elif isinstance(op, EffectfulBinaryExpr):
+            lhs = self.run_region(op.lhs)
+            # `and` stops at False, `or` at True
+            if lhs is (op.op.data == "or"):
+                self.frame[op.result] = lhs
+            else:
+                self.frame[op.result] = self.run_region(op.rhs)
+        elif isinstance(op, IfExpr):
+            region = op.then if self.value(op.cond) else op.or_else
+            self.frame[op.result] = self.run_region(region)
+        elif isinstance(op, If):
+            block = op.then.block if self.value(op.cond) else op.orelse.block
+            return self.run_block(block)
+        elif isinstance(op, While):
+            while self.run_region(op.cond):
+                returned = self.run_block(op.body.block)
+                if returned is not None:
+                    return returned
+        elif isinstance(op, Return):
+            return Returned(self.value(op.value))
+        elif isinstance(op, CallExpr):
+            args = [self.value(arg) for arg in op.args]
+            name = op.func_name.data  # type: ignore
+            if name == "len" and isinstance(args[0], str):
+                result: Value = len(args[0])
+            elif name == "_str_eq" and all(isinstance(arg, str) for arg in args):
+                result = args[0] == args[1]
+            else:
+                result = self.call(name, args)
+            if op.result is not None:
+                self.frame[op.result] = result
+        elif not isinstance(op, Pass):
+            raise EvaluationError(f"unsupported operation {op.name}")
+        return None
+
+    def scalar(self, value: SSAValue) -> Union[int, bool]:
+        data = self.value(value)
+        if data is None or isinstance(data, str):
+            raise EvaluationError("operation on a str or None")
+        return data
+
+    def constant(self, value: object) -> Value:
+        if not is_constant(value):  # type: ignore
+            raise EvaluationError("the operation does not give a constant")
+        return value  # type: ignore
+
+    def binary_expr(self, op: BinaryExpr) -> Value:
+        lhs = self.value(op.lhs)
+        rhs = self.value(op.rhs)
+        if op.op.data == "+" and isinstance(lhs, str) and isinstance(rhs, str):
+            return lhs + rhs
+        value = fold_binary_expr(
+            op.op.data, self.scalar(op.lhs), self.scalar(op.rhs)  # type: ignore
+        )
+        return self.constant(value)
+
+
+@dataclass
+class ChocoFlatEvaluatePureCalls(ModulePass):
+    """
+    Replace the calls of functions without side effects whose arguments are all
+    constants by the value they return, and mark the other calls of functions whose
+    result is unused and that can neither fail nor loop forever as removable, so that
+    dead code elimination deletes them.
+    """
+
+    name = "choco-flat-evaluate-pure-calls"
+
+    max_steps: int = 10000
+    """The largest number of operations run to evaluate a single call."""
+
+    max_depth: int = 64
+    """The deepest nesting of calls during an evaluation."""
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        effects = function_effects(op)
+        functions = {
+            func.func_name.data: func  # type: ignore
+            for func in op.walk()
+            if isinstance(func, FuncDef)
+        }
+        calls = [
+            call
+            for call in op.walk()
+            if isinstance(call, CallExpr)
+            and call.func_name.data in functions  # type: ignore
+        ]
+        for call in calls:
+            name = call.func_name.data  # type: ignore
+            literals = [constant_value(arg) for arg in call.args]
+            if effects[name].is_pure and call.result is not None and all(literals):
+                evaluator = Evaluator(
+                    functions, effects, self.max_steps, self.max_depth
+                )
+                try:
+                    value = evaluator.call(
+                        name, [literal_data(lit) for lit in literals]  # type: ignore
+                    )
+                except EvaluationError:
+                    pass
+                else:
+                    literal = Literal.get(value)
+                    if literal.result.type == call.result.type:
+                        block = call.parent_block()
+                        assert block is not None
+                        block.insert_op_before(literal, call)
+                        call.result.replace_by(literal.result)
+                        block.erase_op(call)
+                        continue
+            unused = call.result is None or not call.result.uses
+            if unused and effects[name].is_removable:
+                call.properties["removable"] = UnitAttr()
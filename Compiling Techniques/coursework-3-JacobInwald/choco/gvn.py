@@ -0,0 +1,125 @@
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, MLContext, Operation, OpResult, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import tracked_memlocs
+from choco.dialects.choco_flat import *
+
+# The binary operators whose operands can be swapped.
+COMMUTATIVE_OPERATORS = ["+", "*", "==", "!=", "and", "or"]
+
+# The computations available at a point of a function, by their key.
+Table = Dict[Hashable, SSAValue]
+
+
+@dataclass
+class GlobalValueNumbering:
+    """
+    Number the results of the pure operations of each function, and replace an
+    operation by an earlier one that computes the same number and dominates it.
+
+    An operation dominates the operations that come after it in its block, and those
+    nested in them. The table of available computations is thus copied when entering
+    a region, so that what is computed in a branch or a loop is not used after it.
+    Each function starts with an empty table, since it may be called from anywhere.
+
+    Loads of a variable get the same number while the variable keeps its value. Its
+    generation is increased by each store to it, before a loop that stores to it, and
+    after a branch that does. The variables that do not escape their function keep
+    their value across calls, the others change at each call of a user function.
+    """
+
+    user_functions: Set[str]
+    tracked: Set[SSAValue]
+    numbers: Dict[SSAValue, int] = field(default_factory=dict)
+    generations: Dict[SSAValue, int] = field(default_factory=dict)
+    calls: int = 0
+
+    def number(self, value: SSAValue) -> int:
+        if value not in self.numbers:
+            self.numbers[value] = len(self.numbers)
+        return self.numbers[value]
+
+    def is_variable(self, memloc: SSAValue) -> bool:
+        return isinstance(memloc, OpResult) and isinstance(memloc.op, Alloc)
+
+    def calls_user_function(self, op: Operation) -> bool:
+        return (
+            isinstance(op, CallExpr)
+            and op.func_name.data in self.user_functions  # type: ignore
+        )
+
+    def key(self, op: Operation) -> Optional[Hashable]:
+        """
+        What an operation computes, if it is pure. Operations on phis are not numbered,
+        since the value of a phi changes whenever it is assigned.
+        """
+        if any(isinstance(operand.owner, Phi) for operand in op.operands):
+            return None
+        operands: Tuple[int, ...] = tuple(self.number(value) for value in op.operands)
+        if isinstance(op, Literal):
+            # attributes are not all hashable, their printed forms are
+            return (Literal.name, str(op.value), str(op.result.type))
+        if isinstance(op, UnaryExpr):
+            return (UnaryExpr.name, op.op.data, operands)
+        if isinstance(op, BinaryExpr):
+            if op.op.data in COMMUTATIVE_OPERATORS:
+                operands = tuple(sorted(operands))
+            return (BinaryExpr.name, op.op.data, operands)
+        if isinstance(op, CallExpr) and op.func_name.data == "len":  # type: ignore
+            # the length of a list or string never changes
+            return (CallExpr.name, "len", operands)
+        if isinstance(op, Load) and self.is_variable(op.memloc):
+            calls = 0 if op.memloc in self.tracked else self.calls
+            generation = self.generations.get(op.memloc, 0)
+            return (Load.name, operands, generation, calls)
+        return None
+
+    def invalidate(self, op: Operation) -> None:
+        """Give a new generation to the variables an operation may store to."""
+        for inner in op.walk():
+            # stores, and for loops that assign their target
+            for memloc in inner.operands:
+                if self.is_variable(memloc) and not isinstance(inner, Load):
+                    self.generations[memloc] = self.generations.get(memloc, 0) + 1
+            if self.calls_user_function(inner):
+                self.calls += 1
+
+    def visit_block(self, block: Block, table: Table) -> None:
+        for op in list(block.ops):
+            if isinstance(op, FuncDef):
+                self.visit_block(op.func_body.block, {})
+                continue
+            key = self.key(op)
+            if key is not None:
+                if key in table:
+                    op.results[0].replace_by(table[key])
+                    block.erase_op(op)
+                    continue
+                table[key] = op.results[0]
+            if isinstance(op, (While, For)):
+                # the loop may run again after the stores of its body
+                self.invalidate(op)
+            for region in op.regions:
+                for nested in region.blocks:
+                    self.visit_block(nested, dict(table))
+            self.invalidate(op)
+
+
+class ChocoFlatGlobalValueNumbering(ModulePass):
+    """
+    Remove the literals, arithmetic, `len` calls and variable loads that compute a
+    value already computed earlier in the same function.
+    """
+
+    name = "choco-flat-gvn"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        user_functions = set(
+            func.func_name.data for func in op.walk() if isinstance(func, FuncDef)
+        )
+        gvn = GlobalValueNumbering(user_functions, tracked_memlocs(op))
+        gvn.visit_block(op.body.block, {})
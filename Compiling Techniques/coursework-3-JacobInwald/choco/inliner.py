@@ -0,0 +1,197 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import MLContext, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import enclosing_function
+from choco.dialects import choco_type
+from choco.dialects.choco_flat import *
+
+
+def function_size(func: FuncDef) -> int:
+    """The number of operations in the body of a function."""
+    return sum(1 for _ in func.func_body.walk())
+
+
+def call_graph(module: ModuleOp) -> Dict[str, Set[str]]:
+    """The user functions that each function calls directly."""
+    graph: Dict[str, Set[str]] = {}
+    for op in module.walk():
+        if isinstance(op, FuncDef):
+            graph.setdefault(op.func_name.data, set())  # type: ignore
+    for op in module.walk():
+        if not isinstance(op, CallExpr) or op.func_name.data not in graph:  # type: ignore
+            continue
+        caller = enclosing_function(op)
+        if caller is not None:
+            graph[caller.func_name.data].add(op.func_name.data)  # type: ignore
+    return graph
+
+
+def recursive_functions(graph: Dict[str, Set[str]]) -> Set[str]:
+    """The functions that may call themselves, directly or through other functions."""
+    recursive: Set[str] = set()
+    for func in graph:
+        visited: Set[str] = set()
+        worklist = list(graph[func])
+        while worklist:
+            callee = worklist.pop()
+            if callee == func:
+                recursive.add(func)
+                break
+            if callee not in visited:
+                visited.add(callee)
+                worklist.extend(graph[callee])
+    return recursive
+
+
+def callees_first(graph: Dict[str, Set[str]]) -> List[str]:
+    """The functions, each after all the functions it calls that are not recursive."""
+    order: List[str] = []
+    visited: Set[str] = set()
+
+    def visit(func: str) -> None:
+        visited.add(func)
+        for callee in sorted(graph[func]):
+            if callee not in visited:
+                visit(callee)
+        order.append(func)
+
+    for func in graph:
+        if func not in visited:
+            visit(func)
+    return order
+
+
+def can_pass(arg: SSAValue, param: SSAValue) -> bool:
+    """
+    Whether an argument can replace a parameter without changing the type of the
+    values the body computes: the types are the same, or None or the empty list is
+    passed for a list.
+    """
+    if arg.type == param.type:
+        return True
+    return isinstance(param.type, choco_type.ListType) and arg.type in [
+        choco_type.empty_type,
+        choco_type.none_type,
+    ]
+
+
+@dataclass
+class Inliner:
+    """
+    Replace the calls to small functions by a copy of their body.
+
+    A function is inlined if it is not larger than the threshold, or if it is only
+    called once, so that its definition can be removed afterwards. Recursive functions,
+    functions that define other functions, and functions that return anywhere but at
+    the end of their body are never inlined.
+    """
+
+    threshold: int
+    functions: Dict[str, FuncDef] = field(default_factory=dict)
+    order: List[str] = field(default_factory=list)
+    recursive: Set[str] = field(default_factory=set)
+    calls: Dict[str, List[CallExpr]] = field(default_factory=dict)
+
+    def analyze(self, module: ModuleOp) -> None:
+        names: List[str] = []
+        for op in module.walk():
+            if isinstance(op, FuncDef):
+                names.append(op.func_name.data)  # type: ignore
+                self.functions[op.func_name.data] = op  # type: ignore
+        for name in names:
+            if names.count(name) > 1:
+                # functions of the same name nested in different functions
+                del self.functions[name]
+        graph = call_graph(module)
+        self.order = callees_first(graph)
+        self.recursive = recursive_functions(graph)
+        for op in module.walk():
+            if not isinstance(op, CallExpr):
+                continue
+            name = op.func_name.data  # type: ignore
+            if name in self.functions:
+                self.calls.setdefault(name, []).append(op)
+
+    def is_inlinable(self, func: FuncDef) -> bool:
+        name = func.func_name.data  # type: ignore
+        if name == "_main" or name in self.recursive:
+            return False
+        for op in func.func_body.walk():
+            if isinstance(op, FuncDef):
+                return False
+            if isinstance(op, Return) and op is not func.func_body.block.last_op:
+                return False
+        calls = len(self.calls.get(name, []))
+        return function_size(func) <= self.threshold or calls == 1
+
+    def can_inline(self, call: CallExpr, func: FuncDef) -> bool:
+        params = func.func_body.block.args
+        if len(params) != len(call.args) or not all(
+            can_pass(arg, param) for arg, param in zip(call.args, params)
+        ):
+            return False
+        ret = func.func_body.block.last_op
+        if call.result is None or not isinstance(ret, Return):
+            return True
+        return ret.value.type == call.result.type
+
+    def inline(self, call: CallExpr, func: FuncDef) -> None:
+        block = call.parent_block()
+        assert block is not None
+        value_mapper: Dict[SSAValue, SSAValue] = dict(
+            zip(func.func_body.block.args, call.args)
+        )
+        result: Optional[SSAValue] = None
+        for op in func.func_body.block.ops:
+            if isinstance(op, Return):
+                result = value_mapper.get(op.value, op.value)
+                continue
+            block.insert_op_before(op.clone(value_mapper), call)
+        if call.result is not None:
+            if result is None:
+                # the function returns None by reaching the end of its body
+                none = Literal.get(None)
+                block.insert_op_before(none, call)
+                result = none.result
+            call.result.replace_by(result)
+        block.erase_op(call)
+
+    def run(self) -> None:
+        # The calls a function makes are inlined before the function itself, so that
+        # the copies of its body do not call them anymore.
+        for name in self.order:
+            func = self.functions.get(name)
+            calls = self.calls.get(name, [])
+            if func is None or not calls or not self.is_inlinable(func):
+                continue
+            remaining = [call for call in calls if not self.can_inline(call, func)]
+            for call in calls:
+                if call not in remaining:
+                    self.inline(call, func)
+            self.calls[name] = remaining
+            if not remaining:
+                func.detach()
+                func.erase()
+
+
+@dataclass
+class ChocoFlatInline(ModulePass):
+    """
+    Inline the calls to small, non-recursive functions, which saves the prologue and
+    epilogue of the call and lets the following passes optimize the body with the
+    arguments of each call.
+    """
+
+    name = "choco-flat-inline"
+
+    threshold: int = 24
+    """The largest number of operations of a function that is inlined everywhere."""
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        inliner = Inliner(self.threshold)
+        inliner.analyze(op)
+        inliner.run()
@@ -1,7 +1,22 @@
+import re
+from array import array
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum, auto
 from io import TextIOBase
-from typing import Any, List, Optional, Union
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    overload,
+)
 
 
 class TokenKind(Enum):
@@ -76,7 +91,7 @@ class TokenKind(Enum):
     STR = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     kind: TokenKind
     value: Any = None
@@ -101,8 +116,88 @@ class Token:
             return self.kind.name + ":" + str(self.value) + "," + str(self.column)
 
 
+# The code of each token kind in a `TokenStream`, and the kind of each code.
+TOKEN_KIND_CODES: Dict[TokenKind, int] = {kind: i for i, kind in enumerate(TokenKind)}
+TOKEN_KINDS: Tuple[TokenKind, ...] = tuple(TokenKind)
+
+
+class TokenView(Token):
+    """A token stored in a `TokenStream`, whose fields are read from the stream."""
+
+    __slots__ = ("stream", "index")
+
+    def __init__(self, stream: "TokenStream", index: int):
+        self.stream = stream
+        self.index = index
+
+    @property
+    def kind(self) -> TokenKind:  # type: ignore
+        return TOKEN_KINDS[self.stream.kinds[self.index]]
+
+    @property
+    def value(self) -> Any:  # type: ignore
+        value_id = self.stream.value_ids[self.index]
+        return None if value_id < 0 else self.stream.values[value_id]
+
+    @property
+    def column(self) -> int:  # type: ignore
+        return self.stream.columns[self.index]
+
+    @property
+    def line(self) -> int:
+        return self.stream.lines[self.index]
+
+
+class TokenStream:
+    """A compact sequence of tokens.
+
+    Kinds, columns and lines of the tokens are stored in parallel arrays, and their
+    values as indices into a table that holds every distinct value once. Tokens are
+    only created, as `TokenView`s, when they are accessed.
+    """
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.columns = array("i")
+        self.lines = array("i")
+        self.value_ids = array("i")  # -1 for tokens without a value.
+        self.values: List[Any] = []
+        self.value_table: Dict[Any, int] = {}
+
+    def append(self, token: Token, line: int):
+        self.kinds.append(TOKEN_KIND_CODES[token.kind])
+        self.columns.append(token.column)
+        self.lines.append(line)
+        if token.value is None:
+            self.value_ids.append(-1)
+            return
+        value_id = self.value_table.get(token.value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.value_table[token.value] = value_id
+            self.values.append(token.value)
+        self.value_ids.append(value_id)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> TokenView:
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self) -> Iterator[TokenView]:
+        for index in range(len(self.kinds)):
+            yield TokenView(self, index)
+
+
 class Scanner:
-    def __init__(self, stream: TextIOBase):
+    # Number of characters read from the underlying stream at a time.
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(self, stream: TextIOBase, block_size: int = BLOCK_SIZE):
         """Create a new scanner.
 
         The scanner's input is a stream derived from a string or a file.
@@ -115,14 +210,61 @@ class Scanner:
         s = open("file.choc")
         Scanner(s)
 
+        The stream is read in blocks of `block_size` characters into a text
+        window, and characters are scanned by advancing an integer cursor
+        over that window. The text of the current line is kept in the window,
+        so that `line_buffer` can be recovered by slicing.
+
         :param stream: The stream of characters to be lexed.
+        :param block_size: The number of characters to read from the stream at a time.
         """
         self.stream: TextIOBase = stream
+        self.block_size: int = block_size
         self.buffer: Optional[str] = None  # A buffer of one character.
         self.column: int = (
             -1
         )  # The "tip" of the scanner, i.e. how far inside the line_buffer are we.
-        self.line_buffer: str = ""
+        self.text: str = ""  # The window of the input that is currently loaded.
+        self.cursor: int = 0  # The index of the next unread character in `text`.
+        self.end: int = 0  # The length of `text`.
+        self.line_start: int = 0  # The index in `text` where the current line starts.
+        self.line_prefix: str = ""  # Text assigned to the line buffer by the tokenizer.
+        self.at_eof: bool = False
+
+    @property
+    def line_buffer(self) -> str:
+        """The text of the current line that has been read so far."""
+        return self.line_prefix + self.text[self.line_start : self.cursor]
+
+    @line_buffer.setter
+    def line_buffer(self, value: str):
+        # Everything read so far is replaced by `value`, so the line restarts at the
+        # cursor.
+        self.line_prefix = value
+        self.line_start = self.cursor
+
+    def fill(self) -> bool:
+        """Read the next block of the input stream into the text window.
+
+        Text before the start of the current line is dropped, as it can no longer be
+        part of the line buffer. The block is extended up to the end of its last
+        line, so that no token is ever split across two blocks.
+
+        :return: True if new characters were read, False at the end of the stream.
+        """
+        if self.at_eof:
+            return False
+        block = self.stream.read(self.block_size)
+        if not block:
+            self.at_eof = True
+            return False
+        if block[-1] != "\n":
+            block += self.stream.readline()
+        self.text = self.text[self.line_start :] + block
+        self.end = len(self.text)
+        self.cursor -= self.line_start
+        self.line_start = 0
+        return True
 
     def peek(self) -> str:
         """Return the next character from input without consuming it.
@@ -141,20 +283,64 @@ class Scanner:
         :return: The next character in the input stream or None at the end of the stream.
         """
         # If the buffer is full, we empty the buffer and return the character it contains.
-        if self.buffer:
-            c = self.buffer
+        c = self.buffer
+        if c:
             self.buffer = None
             return c
-        c = self.stream.read(1)
         self.column += 1
-        self.line_buffer += c
-        return c
+        cursor = self.cursor
+        if cursor == self.end:
+            if not self.fill():
+                return ""
+            cursor = self.cursor
+        self.cursor = cursor + 1
+        return self.text[cursor]
+
+
+class LookaheadView(Sequence[Token]):
+    """A read-only view of the first tokens of a lookahead buffer.
+
+    The view does not copy the tokens, so it reflects the buffer as it is when indexed.
+    """
+
+    __slots__ = ("buffer", "k")
+
+    def __init__(self, buffer: Deque[Token], k: int):
+        self.buffer = buffer
+        self.k = k
+
+    def __len__(self) -> int:
+        return self.k
+
+    @overload
+    def __getitem__(self, index: int) -> Token:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Token]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Token, List[Token]]:
+        if isinstance(index, slice):
+            return [self.buffer[i] for i in range(*index.indices(self.k))]
+        if index < 0:
+            index += self.k
+        if not 0 <= index < self.k:
+            raise IndexError("lookahead index out of range")
+        return self.buffer[index]
+
+    def __iter__(self) -> Iterator[Token]:
+        for i in range(self.k):
+            yield self.buffer[i]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
 
 
 class Tokenizer:
     def __init__(self, scanner: Scanner):
         self.scanner = scanner
-        self.buffer: List[Token] = []  # A buffer of tokens
+        self.buffer: Deque[Token] = deque()  # A buffer of tokens
         self.line_number = 0
         self.is_new_line = True
         self.is_logical_line = False
@@ -162,30 +348,40 @@ class Tokenizer:
         # Resets after every end-of-line sequence.
         self.indent_stack = [0]
 
-    def peek(self, k: int = 1) -> Union[Token, List[Token]]:
+    def peek(self, k: int = 1) -> Union[Token, "LookaheadView"]:
         """Peeks through the next `k` number of tokens.
 
         This functions looks ahead the next `k` number of tokens,
-        and returns them as a list.
+        and returns a view of them.
         It uses a FIFO buffer to store tokens temporarily.
         :param k: number of tokens
-        :return: one token or a list of tokens
+        :return: one token or a view of the next `k` tokens
         """
-        if not self.buffer:
-            self.buffer = [self.consume()]
+        buffer = self.buffer
+        # If you need only one token, return it as an element,
+        # not as a view of one element.
+        if k == 1:
+            if not buffer:
+                buffer.append(self.consume())
+            return buffer[0]
 
         # Fill the buffer up to `k` tokens, if needed.
-        buffer_size = len(self.buffer)
-        if buffer_size < k:
-            for _ in list(range(k - buffer_size)):
-                self.buffer.append(self.consume(keep_buffer=True))
+        while len(buffer) < k:
+            buffer.append(self.consume(keep_buffer=True))
+        return LookaheadView(buffer, k)
 
-        # If you need only one token, return it as an element,
-        # not as a list with one element.
-        if k == 1:
-            return self.buffer[0]
+    def lookahead_matches(self, kinds: List[TokenKind]) -> bool:
+        """Check that the next tokens are of the given kinds, in order.
 
-        return self.buffer[0:k]
+        All `len(kinds)` tokens are buffered before comparing, as with `peek`.
+        """
+        buffer = self.buffer
+        while len(buffer) < len(kinds):
+            buffer.append(self.consume(keep_buffer=True))
+        for token, kind in zip(buffer, kinds):
+            if token.kind != kind:
+                return False
+        return True
 
     def consume(self, keep_buffer: bool = False) -> Token:
         """Consumes one token and implements peeking through the next one.
@@ -198,9 +394,7 @@ class Tokenizer:
         :return: one token
         """
         if self.buffer and not keep_buffer:
-            c = self.buffer[0]
-            self.buffer = self.buffer[1:]
-            return c
+            return self.buffer.popleft()
 
         # If we just switched line, flush the buffer.
         if self.is_new_line and not self.is_logical_line:
@@ -458,7 +652,8 @@ class Tokenizer:
                 return Token(TokenKind.STRING, string, col)
             # End of file
             elif not c:
-                # The end of input also serves as an implicit terminator of the physical line.
+                # The end of input also serves as an implicit terminator of the
+                # physical line.
                 # For a logical line emit a newline token.
                 if self.is_logical_line:
                     self.is_logical_line = False
@@ -475,13 +670,306 @@ class Tokenizer:
                 raise Exception("Invalid character detected: '" + c + "'")
 
 
+# Keywords, mapped to the kind of their token. Any other name is an identifier.
+KEYWORDS: Dict[str, TokenKind] = {
+    "class": TokenKind.CLASS,
+    "def": TokenKind.DEF,
+    "global": TokenKind.GLOBAL,
+    "nonlocal": TokenKind.NONLOCAL,
+    "if": TokenKind.IF,
+    "elif": TokenKind.ELIF,
+    "else": TokenKind.ELSE,
+    "while": TokenKind.WHILE,
+    "for": TokenKind.FOR,
+    "in": TokenKind.IN,
+    "None": TokenKind.NONE,
+    "True": TokenKind.TRUE,
+    "False": TokenKind.FALSE,
+    "pass": TokenKind.PASS,
+    "or": TokenKind.OR,
+    "and": TokenKind.AND,
+    "not": TokenKind.NOT,
+    "is": TokenKind.IS,
+    "object": TokenKind.OBJECT,
+    "int": TokenKind.INT,
+    "bool": TokenKind.BOOL,
+    "str": TokenKind.STR,
+    "return": TokenKind.RETURN,
+}
+
+# Operators made of one character that never starts a longer operator.
+SINGLE_CHAR_OPERATORS: Dict[str, TokenKind] = {
+    "+": TokenKind.PLUS,
+    "*": TokenKind.MUL,
+    "%": TokenKind.MOD,
+    "(": TokenKind.LROUNDBRACKET,
+    ")": TokenKind.RROUNDBRACKET,
+    ":": TokenKind.COLON,
+    "[": TokenKind.LSQUAREBRACKET,
+    "]": TokenKind.RSQUAREBRACKET,
+    ",": TokenKind.COMMA,
+}
+
+# Operators that may be followed by a second character, mapped to that character,
+# the kind of the two character operator, and the kind of the operator on its own.
+# The latter is None if the first character is not an operator on its own.
+TWO_CHAR_OPERATORS: Dict[str, Tuple[str, TokenKind, Optional[TokenKind]]] = {
+    "-": (">", TokenKind.RARROW, TokenKind.MINUS),
+    "/": ("/", TokenKind.DIV, None),
+    "=": ("=", TokenKind.EQ, TokenKind.ASSIGN),
+    "!": ("=", TokenKind.NE, None),
+    "<": ("=", TokenKind.LE, TokenKind.LT),
+    ">": ("=", TokenKind.GE, TokenKind.GT),
+}
+
+# Characters that can follow a backslash in a string, mapped to what they stand for.
+ESCAPED_CHARACTERS: Dict[str, str] = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+
+# `\w` matches exactly the characters for which `str.isalnum()` holds, and "_".
+IDENTIFIER_TAIL = re.compile(r"\w*")
+DIGITS = re.compile(r"[0-9]*")
+# A string of printable ASCII characters with valid escape sequences.
+STRING = re.compile(r'"((?:[ !#-\[\]-~]|\\[nt"\\])*)"')
+ESCAPE_SEQUENCE = re.compile(r"\\(.)")
+LINE_END = re.compile(r"[\n\r]")
+
+
+class TableTokenizer(Tokenizer):
+    """A tokenizer that scans the text window of the scanner directly.
+
+    Rather than recursing on every whitespace character and testing characters against
+    a chain of conditions, the first character of a token is looked up in dispatch
+    tables, and identifiers, numbers and strings are matched with compiled regular
+    expressions. The tokens produced are the same as the ones of `Tokenizer`, including
+    the columns of NEWLINE, INDENT, DEDENT and EOF tokens. Once a line has been
+    tokenized, the scanner's line buffer holds the same text as with `Tokenizer`, so that
+    syntax errors are reported identically.
+    """
+
+    def __init__(self, scanner: Scanner):
+        super().__init__(scanner)
+        # The column of the character at index `i` of the text window is
+        # `i - line_origin`.
+        self.line_origin = 0
+        # How many times the end of the input was peeked at. `Tokenizer` moves the column
+        # of the scanner one character further every time.
+        self.eof_peeks = 0
+
+    def consume(self, keep_buffer: bool = False) -> Token:
+        if self.buffer and not keep_buffer:
+            return self.buffer.popleft()
+        return self.next_token()
+
+    def next_token(self) -> Token:
+        """Scan the next token from the text window of the scanner."""
+        scanner = self.scanner
+        text = scanner.text
+        pos = scanner.cursor
+        end = scanner.end
+        c = ""
+        # Whether `c` still has to be peeked, i.e. whether `Tokenizer` would be at the
+        # start of a (recursive) call to `consume`.
+        peek = True
+        while True:
+            if peek:
+                # If we just switched line, flush the buffer.
+                if self.is_new_line and not self.is_logical_line:
+                    scanner.line_prefix = ""
+                    scanner.line_start = pos
+                if pos == end:
+                    scanner.cursor = pos
+                    if scanner.fill():
+                        # The window was shifted to start at the beginning of the line.
+                        self.line_origin -= pos - scanner.cursor
+                        text = scanner.text
+                        pos = scanner.cursor
+                        end = scanner.end
+                if pos == end:
+                    self.eof_peeks += 1
+                    c = ""
+                else:
+                    c = text[pos]
+            peek = True
+
+            if c.isspace():
+                if c == "\n" or c == "\r":
+                    col = pos - self.line_origin
+                    self.line_indent_lvl = 0
+                    self.is_new_line = True
+                    self.line_number += 1
+                    pos += 1
+                    self.line_origin = pos
+                    if self.is_logical_line:
+                        self.is_logical_line = False
+                        scanner.cursor = pos
+                        return Token(TokenKind.NEWLINE, None, col)
+                elif not self.is_new_line:
+                    pos += 1
+                elif c == "\t":
+                    # Tabs at the beginning of a line pad up to a multiple of eight.
+                    self.line_indent_lvl += 8 - self.line_indent_lvl % 8
+                    col = pos - self.line_origin
+                    self.line_origin = pos - (col + 8 - col % 8)
+                    pos += 1
+                else:
+                    self.line_indent_lvl += 1
+                    pos += 1
+                continue
+
+            if c == "#":
+                match = LINE_END.search(text, pos + 1)
+                scanner.line_prefix = ""
+                if match is None:
+                    # Blocks end with a line, so the comment runs until the end of input.
+                    pos = end
+                    scanner.line_start = pos
+                    self.eof_peeks += 1
+                    c = ""
+                else:
+                    pos = match.start()
+                    # The line end was peeked at, so it is not part of the line buffer.
+                    scanner.line_start = pos + 1
+                    c = text[pos]
+                peek = False
+                continue
+
+            scanner.cursor = pos
+            if not c:
+                col = end - self.line_origin - 1 + self.eof_peeks
+                # The end of input also serves as an implicit terminator of the
+                # physical line.
+                if self.is_logical_line:
+                    self.is_logical_line = False
+                    return Token(TokenKind.NEWLINE, None, col)
+                if self.indent_stack[-1] > 0:
+                    self.indent_stack.pop()
+                    return Token(TokenKind.DEDENT, None, self.indent_stack[-1])
+                return Token(TokenKind.EOF, None, col)
+
+            if self.is_new_line:
+                self.is_logical_line = True
+                if self.line_indent_lvl > self.indent_stack[-1]:
+                    self.indent_stack.append(self.line_indent_lvl)
+                    return Token(TokenKind.INDENT, None, self.indent_stack[-2])
+                if self.line_indent_lvl < self.indent_stack[-1]:
+                    if self.line_indent_lvl not in self.indent_stack:
+                        print("Indentation error: mismatched blocks.")
+                        exit(1)
+                    self.indent_stack.pop()
+                    return Token(TokenKind.DEDENT, None, self.indent_stack[-1])
+                # Add the skipped indentation to the line buffer as spaces.
+                scanner.line_prefix = (
+                    self.line_indent_lvl * " "
+                    + scanner.line_prefix
+                    + text[scanner.line_start : pos]
+                )
+                scanner.line_start = pos
+                self.is_new_line = False
+
+            col = pos - self.line_origin
+            kind = SINGLE_CHAR_OPERATORS.get(c)
+            if kind is not None:
+                scanner.cursor = pos + 1
+                return Token(kind, c, col)
+
+            if c.isalpha() or c == "_":
+                tail = IDENTIFIER_TAIL.match(text, pos + 1).end()  # type: ignore
+                if tail == end:
+                    self.eof_peeks += 1
+                name = text[pos:tail]
+                scanner.cursor = tail
+                return Token(KEYWORDS.get(name, TokenKind.IDENTIFIER), name, col)
+
+            operator = TWO_CHAR_OPERATORS.get(c)
+            if operator is not None:
+                second, long_kind, short_kind = operator
+                if pos + 1 == end:
+                    self.eof_peeks += 1
+                    next_c = ""
+                else:
+                    next_c = text[pos + 1]
+                if next_c == second:
+                    scanner.cursor = pos + 2
+                    return Token(long_kind, c + second, col)
+                if short_kind is None:
+                    raise Exception("Unknown lexeme: {}".format(c + next_c))
+                scanner.cursor = pos + 1
+                return Token(short_kind, c, col)
+
+            if c.isdigit():
+                tail = DIGITS.match(text, pos + 1).end()  # type: ignore
+                while tail < end and text[tail].isnumeric():
+                    tail += 1
+                if tail == end:
+                    self.eof_peeks += 1
+                scanner.cursor = tail
+                return Token(TokenKind.INTEGER, int(text[pos:tail]), col)
+
+            if c == '"':
+                match = STRING.match(text, pos)
+                if match is None:
+                    self.string_error(text, pos + 1, end)
+                string = match.group(1)  # type: ignore
+                if "\\" in string:
+                    string = ESCAPE_SEQUENCE.sub(
+                        lambda m: ESCAPED_CHARACTERS[m.group(1)], string
+                    )
+                scanner.cursor = match.end()  # type: ignore
+                return Token(TokenKind.STRING, string, col)
+
+            raise Exception("Invalid character detected: '" + c + "'")
+
+    def string_error(self, text: str, pos: int, end: int):
+        """Report the first invalid character of the string starting at `pos`."""
+        while True:
+            c = text[pos] if pos < end else ""
+            if not 32 <= ord(c) <= 126:  # ASCII limits accepted
+                print("Error: Unknown ASCII number {}".format(ord(c)))
+                exit(1)
+            if c == "\\":
+                pos += 1
+                c = text[pos] if pos < end else ""
+                if c not in ESCAPED_CHARACTERS:
+                    print('Error: "\\{}" not recognized'.format(c))
+                    exit(1)
+            pos += 1
+
+
+# The tokenizers that the lexer can use, by name.
+TOKENIZERS: Dict[str, Type[Tokenizer]] = {
+    "table": TableTokenizer,
+    "recursive": Tokenizer,
+}
+
+
 class Lexer:
-    def __init__(self, stream: TextIOBase):
+    def __init__(self, stream: TextIOBase, tokenizer: str = "table"):
         scanner = Scanner(stream)
-        self.tokenizer = Tokenizer(scanner)
+        self.tokenizer = TOKENIZERS[tokenizer](scanner)
 
-    def peek(self, k: int = 1) -> Union[Token, List[Token]]:
+    def peek(self, k: int = 1) -> Union[Token, LookaheadView]:
         return self.tokenizer.peek(k)
 
+    def lookahead_matches(self, kinds: List[TokenKind]) -> bool:
+        return self.tokenizer.lookahead_matches(kinds)
+
+    def tokenize(self) -> TokenStream:
+        """Lex the whole input into a compact `TokenStream`.
+
+        Tokens are recorded with the (zero-based) line they are on, so this should be
+        called before any token is peeked at.
+        """
+        stream = TokenStream()
+        while True:
+            line = self.tokenizer.line_number
+            token = self.consume()
+            # A NEWLINE token has already moved the tokenizer to the next line,
+            # unless it terminates the input.
+            if token.kind != TokenKind.NEWLINE or self.tokenizer.line_number == line:
+                line = self.tokenizer.line_number
+            stream.append(token, line)
+            if token.kind == TokenKind.EOF:
+                return stream
+
     def consume(self) -> Token:
         return self.tokenizer.consume()
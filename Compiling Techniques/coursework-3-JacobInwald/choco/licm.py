@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from typing import List, Set
+
+from xdsl.dialects.builtin import ModuleOp, StringAttr
+from xdsl.ir import MLContext, Operation, OpResult, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import enclosing_function
+from choco.dialects.choco_flat import *
+
+# The binary operators that raise an error on some operands.
+FAILING_OPERATORS = ["//", "%"]
+
+
+def may_fail(op: Operation) -> bool:
+    """Whether an operation that has no side effect may still raise an error."""
+    if isinstance(op, CallExpr):
+        # len fails on None
+        return True
+    return isinstance(op, BinaryExpr) and op.op.data in FAILING_OPERATORS
+
+
+def is_pure(op: Operation) -> bool:
+    """
+    Whether an operation only computes its result from its operands, and can be
+    computed once for all the iterations of a loop. String literals are not, since
+    each evaluation allocates a new string.
+    """
+    if isinstance(op, Literal):
+        return not isinstance(op.value, StringAttr)
+    if isinstance(op, CallExpr):
+        return op.func_name.data == "len"  # type: ignore
+    return isinstance(op, (UnaryExpr, BinaryExpr, Load))
+
+
+def is_variant(value: SSAValue, loop: While) -> bool:
+    """
+    Whether a value may change between iterations: it is computed in the loop, or it
+    is a phi that is assigned in the loop.
+    """
+    if isinstance(value, OpResult) and loop.is_ancestor(value.op):
+        return True
+    return any(
+        isinstance(use.operation, Assign)
+        and use.index == 0
+        and loop.is_ancestor(use.operation)
+        for use in value.uses
+    )
+
+
+@dataclass
+class LoopInvariantCodeMotion:
+    """
+    Hoist the pure operations of a While loop whose operands do not change while the
+    loop runs in front of the loop, so that they are computed once.
+
+    Inner loops are visited first, so that an operation hoisted out of an inner loop
+    can be hoisted out of the outer loops too. Only the operations directly in the
+    condition and the body of a loop are moved, not those in nested regions.
+    """
+
+    user_functions: Set[str]
+
+    def calls_user_function(self, loop: While) -> bool:
+        return any(
+            isinstance(op, CallExpr)
+            and op.func_name.data in self.user_functions  # type: ignore
+            for op in loop.walk()
+        )
+
+    def is_invariant_load(self, load: Load, loop: While) -> bool:
+        """
+        Whether a load reads a variable that is not stored to while the loop runs,
+        either by the loop itself or by a function it calls. Loads of list elements
+        are never invariant, since any store to a list may change them.
+        """
+        memloc = load.memloc
+        if not isinstance(memloc, OpResult) or not isinstance(memloc.op, Alloc):
+            return False
+        function = enclosing_function(loop)
+        for use in memloc.uses:
+            if not isinstance(use.operation, Store) or use.index != 0:
+                continue
+            if loop.is_ancestor(use.operation):
+                return False
+            if enclosing_function(
+                use.operation
+            ) is not function and self.calls_user_function(loop):
+                return False
+        return True
+
+    def is_invariant(self, op: Operation, loop: While) -> bool:
+        if not is_pure(op):
+            return False
+        if any(is_variant(operand, loop) for operand in op.operands):
+            return False
+        return not isinstance(op, Load) or self.is_invariant_load(op, loop)
+
+    def hoist(self, loop: While) -> None:
+        # The condition is evaluated at least once before anything else in the loop,
+        # so an operation that may fail can be moved out of it while no operation
+        # with an effect comes first. The body may not run, so it can not.
+        self.hoist_ops(loop, list(loop.cond.block.ops), can_fail=True)
+        self.hoist_ops(loop, list(loop.body.block.ops), can_fail=False)
+
+    def hoist_ops(self, loop: While, ops: List[Operation], can_fail: bool) -> None:
+        for op in ops:
+            if self.is_invariant(op, loop) and (can_fail or not may_fail(op)):
+                op.detach()
+                loop.parent_block().insert_op_before(op, loop)  # type: ignore
+            elif not is_pure(op) or may_fail(op):
+                can_fail = False
+
+
+class ChocoFlatLoopInvariantCodeMotion(ModulePass):
+    """
+    Move the computations that give the same result in every iteration of a while
+    loop, such as the `len` of the list a for loop iterates over, in front of the
+    loop.
+    """
+
+    name = "choco-flat-licm"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        user_functions = set(
+            func.func_name.data for func in op.walk() if isinstance(func, FuncDef)
+        )
+        licm = LoopInvariantCodeMotion(user_functions)
+        loops = [loop for loop in op.walk() if isinstance(loop, While)]
+        # inner loops come after the loops that contain them
+        for loop in reversed(loops):
+            licm.hoist(loop)
@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import Dict, List, Set
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, MLContext, Operation, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import tracked_memlocs
+from choco.dialects.choco_flat import *
+
+# The SSA value each promoted memory location holds at a point of the program.
+Definitions = Dict[SSAValue, SSAValue]
+
+
+def stored_memlocs(block: Block, promoted: Set[SSAValue]) -> List[SSAValue]:
+    """The promoted memory locations stored to in a block, in program order."""
+    memlocs: Dict[SSAValue, None] = {}
+    for op in block.walk():
+        if isinstance(op, Store) and op.memloc in promoted:
+            memlocs[op.memloc] = None
+    return list(memlocs)
+
+
+def assign_phis(block: Block, phis: Dict[SSAValue, Phi], defs: Definitions):
+    """
+    Set the phis of a join to the values of their memory locations at the end of
+    `block`. The assignments happen at the same time, so a phi that is read by another
+    assignment is copied before it is overwritten.
+    """
+    copies = [
+        (phi.result, defs[memloc])
+        for memloc, phi in phis.items()
+        if memloc in defs and defs[memloc] is not phi.result
+    ]
+    overwritten = set(target for target, _ in copies)
+    ops: List[Operation] = []
+    for idx, (target, value) in enumerate(copies):
+        if value in overwritten:
+            tmp = Phi.get(value.type)
+            ops += [tmp, Assign.build(operands=[tmp.result, value])]
+            copies[idx] = (target, tmp.result)
+    ops += [Assign.build(operands=[target, value]) for target, value in copies]
+    block.add_ops(ops)
+
+
+@dataclass
+class Mem2Reg:
+    """
+    Replace the loads and stores of promoted memory locations by the SSA values that
+    are stored, walking the structured control flow of choco_flat in program order.
+
+    Where control flow joins, i.e. after an if statement or at the head of a loop, a
+    memory location that holds different values on the incoming paths gets a `Phi`,
+    which is set by an `Assign` at the end of each incoming branch or loop body.
+    """
+
+    promoted: Set[SSAValue]
+
+    def rename_block(self, block: Block, defs: Definitions) -> Definitions:
+        for op in list(block.ops):
+            defs = self.rename_op(op, defs)
+        return defs
+
+    def rename_op(self, op: Operation, defs: Definitions) -> Definitions:
+        parent = op.parent_block()
+        assert parent is not None
+        if isinstance(op, FuncDef):
+            # functions only share escaping memory locations, which are not promoted
+            self.rename_block(op.func_body.block, {})
+        elif isinstance(op, Load) and op.memloc in self.promoted:
+            value = defs.get(op.memloc)
+            if value is None:
+                # read before any store, so the value is undefined
+                phi = Phi.get(op.result.type)
+                parent.insert_op_before(phi, op)
+                value = defs[op.memloc] = phi.result
+            op.result.replace_by(value)
+            parent.erase_op(op)
+        elif isinstance(op, Store) and op.memloc in self.promoted:
+            defs[op.memloc] = op.value
+            parent.erase_op(op)
+        elif isinstance(op, If):
+            then_defs = self.rename_block(op.then.block, dict(defs))
+            orelse_defs = self.rename_block(op.orelse.block, dict(defs))
+            phis: Dict[SSAValue, Phi] = {}
+            for memloc in {**then_defs, **orelse_defs}:
+                value = then_defs.get(memloc)
+                if value is not None and value is orelse_defs.get(memloc):
+                    defs[memloc] = value
+                    continue
+                phi = phis[memloc] = Phi.get(memloc.type.type)  # type: ignore
+                parent.insert_op_before(phi, op)
+                defs[memloc] = phi.result
+            assign_phis(op.then.block, phis, then_defs)
+            assign_phis(op.orelse.block, phis, orelse_defs)
+        elif isinstance(op, (While, For)):
+            phis = {}
+            for memloc in stored_memlocs(op.body.block, self.promoted):
+                phi = phis[memloc] = Phi.get(memloc.type.type)  # type: ignore
+                parent.insert_op_before(phi, op)
+                if memloc in defs:
+                    assign = Assign.build(operands=[phi.result, defs[memloc]])
+                    parent.insert_op_before(assign, op)
+                defs[memloc] = phi.result
+            if isinstance(op, While):
+                self.rename_block(op.cond.block, dict(defs))
+            body_defs = self.rename_block(op.body.block, dict(defs))
+            assign_phis(op.body.block, phis, body_defs)
+        else:
+            # the regions of expressions do not store to memory locations
+            for region in op.regions:
+                for block in region.blocks:
+                    self.rename_block(block, dict(defs))
+        return defs
+
+
+class ChocoFlatMem2Reg(ModulePass):
+    """
+    Promote the int and bool memory locations that do not escape their function to
+    SSA values, so that reading or writing a variable no longer goes through memory.
+    """
+
+    name = "choco-flat-mem2reg"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        promoted = tracked_memlocs(op)
+        Mem2Reg(promoted).rename_block(op.body.block, {})
+
+        for memloc in promoted:
+            alloc = memloc.owner
+            assert isinstance(alloc, Alloc) and not memloc.uses
+            block = alloc.parent_block()
+            assert block is not None
+            block.erase_op(alloc)
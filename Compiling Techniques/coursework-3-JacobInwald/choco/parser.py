@@ -1,4 +1,4 @@
-from typing import List, NoReturn, Union
+from typing import Callable, Dict, List, NoReturn, Union
 
 from xdsl.dialects.builtin import ModuleOp
 from xdsl.ir import Operation
@@ -6,6 +6,54 @@ from xdsl.ir import Operation
 import choco.dialects.choco_ast as ast
 from choco.lexer import Lexer, Token, TokenKind
 
+# FIRST sets of the grammar: the kinds of tokens an expression or statement starts with.
+EXPR_FIRST_SET = frozenset(
+    [
+        TokenKind.IDENTIFIER,
+        TokenKind.TRUE,
+        TokenKind.FALSE,
+        TokenKind.LROUNDBRACKET,
+        TokenKind.NONE,
+        TokenKind.STRING,
+        TokenKind.INTEGER,
+        TokenKind.MINUS,
+        TokenKind.NOT,
+        TokenKind.LSQUAREBRACKET,
+    ]
+)
+STMT_FIRST_SET = EXPR_FIRST_SET | frozenset(
+    [
+        TokenKind.IF,
+        TokenKind.WHILE,
+        TokenKind.FOR,
+        TokenKind.PASS,
+        TokenKind.RETURN,
+    ]
+)
+
+# How tightly each binary operator binds its operands. `if` stands for the conditional
+# expression `expr if expr else expr`.
+BINDING_POWERS: Dict[TokenKind, int] = {
+    TokenKind.IF: 1,
+    TokenKind.OR: 2,
+    TokenKind.AND: 3,
+    TokenKind.EQ: 5,
+    TokenKind.NE: 5,
+    TokenKind.LT: 5,
+    TokenKind.LE: 5,
+    TokenKind.GT: 5,
+    TokenKind.GE: 5,
+    TokenKind.IS: 5,
+    TokenKind.PLUS: 6,
+    TokenKind.MINUS: 6,
+    TokenKind.MUL: 7,
+    TokenKind.DIV: 7,
+    TokenKind.MOD: 7,
+}
+# `not` binds tighter than `and`, but its operand may contain comparisons.
+NOT_BINDING_POWER = 4
+COMPARISON_BINDING_POWER = 5
+
 
 class SyntaxError(Exception):
     def __init__(self, row: int, column: int, message: str, line: str):
@@ -39,6 +87,18 @@ class Parser:
         Initialize parser with the corresponding lexer.
         """
         self.lexer = lexer
+        # Parsers of the statements that are not simple statements, by their first token.
+        self.compound_stmt_parsers: Dict[TokenKind, Callable[[], Operation]] = {
+            TokenKind.IF: self.parse_if_stmt,
+            TokenKind.WHILE: self.parse_while_stmt,
+            TokenKind.FOR: self.parse_for_stmt,
+        }
+        # Parsers of the declarations of a function body, by their first token.
+        # Variable definitions need two tokens of lookahead, and are checked first.
+        self.decl_parsers: Dict[TokenKind, Callable[[], Operation]] = {
+            TokenKind.GLOBAL: self.parse_global_decl,
+            TokenKind.NONLOCAL: self.parse_nonlocal_decl,
+        }
 
     def check(self, expected: Union[List[TokenKind], TokenKind]) -> bool:
         """
@@ -54,14 +114,18 @@ class Parser:
         """
 
         if isinstance(expected, list):
-            tokens = self.lexer.peek(len(expected))
-            assert isinstance(tokens, list), "List of tokens expected"
-            return all([tok.kind == type_ for tok, type_ in zip(tokens, expected)])
+            return self.lexer.lookahead_matches(expected)
 
         token = self.lexer.peek()
         assert isinstance(token, Token), "Single token expected"
         return token.kind == expected
 
+    def peek_kind(self) -> TokenKind:
+        """Return the kind of the next token, without consuming it."""
+        token = self.lexer.peek()
+        assert isinstance(token, Token), "Single token expected"
+        return token.kind
+
     def match(self, expected: TokenKind) -> Token:
         """
         Match a token by first checking the token kind. In case the token is of
@@ -138,23 +202,18 @@ class Parser:
 
         defs: List[Operation] = []
 
-        while (
-            self.check(TokenKind.CLASS)
-            or self.check(TokenKind.DEF)
-            or self.check([TokenKind.IDENTIFIER, TokenKind.COLON])
-        ):
-            if self.check(TokenKind.CLASS):
+        while True:
+            kind = self.peek_kind()
+            if kind == TokenKind.CLASS:
                 assert False, "Classes not yet supported"
-            if self.check(TokenKind.DEF):
+            if kind == TokenKind.DEF:
                 func_def = self.parse_function()
                 defs.append(func_def)
-                continue
-            if self.check(TokenKind.IDENTIFIER):
+            elif self.check([TokenKind.IDENTIFIER, TokenKind.COLON]):
                 var_def = self.parse_var_def()
                 defs.append(var_def)
-                continue
-
-        return defs
+            else:
+                return defs
 
     def parse_function(self) -> Operation:
         """
@@ -210,20 +269,15 @@ class Parser:
         self.match(TokenKind.INDENT)
 
         defs_and_decls: List[Operation] = []
-        while (
-            self.check([TokenKind.IDENTIFIER, TokenKind.COLON])
-            or self.check(TokenKind.GLOBAL)
-            or self.check(TokenKind.NONLOCAL)
-        ):
+        while True:
             if self.check([TokenKind.IDENTIFIER, TokenKind.COLON]):
                 var_def = self.parse_var_def()
                 defs_and_decls.append(var_def)
-            elif self.check(TokenKind.GLOBAL):
-                global_decl = self.parse_global_decl()
-                defs_and_decls.append(global_decl)
-            elif self.check(TokenKind.NONLOCAL):
-                nonlocal_decl = self.parse_nonlocal_decl()
-                defs_and_decls.append(nonlocal_decl)
+                continue
+            parse_decl = self.decl_parsers.get(self.peek_kind())
+            if parse_decl is None:
+                break
+            defs_and_decls.append(parse_decl())
 
         if self.check(TokenKind.INDENT):
             self.error("Unexpected indentation")
@@ -342,33 +396,14 @@ class Parser:
         Check if the next token is in the first set of an expression.
 
         """
-        return (
-            self.check(TokenKind.IDENTIFIER)
-            or self.check(TokenKind.TRUE)
-            or self.check(TokenKind.FALSE)
-            or self.check(TokenKind.LROUNDBRACKET)
-            or self.check(TokenKind.NONE)
-            or self.check(TokenKind.IDENTIFIER)
-            or self.check(TokenKind.STRING)
-            or self.check(TokenKind.INTEGER)
-            or self.check(TokenKind.MINUS)
-            or self.check(TokenKind.NOT)
-            or self.check(TokenKind.LSQUAREBRACKET)
-        )
+        return self.peek_kind() in EXPR_FIRST_SET
 
     def is_stmt_first_set(self) -> bool:
         """
         Check if the next token is in the first set of a statement.
 
         """
-        return (
-            self.is_expr_first_set()
-            or self.check(TokenKind.IF)
-            or self.check(TokenKind.WHILE)
-            or self.check(TokenKind.FOR)
-            or self.check(TokenKind.PASS)
-            or self.check(TokenKind.RETURN)
-        )
+        return self.peek_kind() in STMT_FIRST_SET
 
     def parse_stmt_seq(self) -> List[Operation]:
         """Parse a sequence of statements.
@@ -379,15 +414,17 @@ class Parser:
         """
         stmt_seq: List[Operation] = []
 
-        if self.check(TokenKind.ASSIGN):
+        kind = self.peek_kind()
+        if kind == TokenKind.ASSIGN:
             self.error("No left-hand side in assign statement")
 
-        while self.is_stmt_first_set():
+        while kind in STMT_FIRST_SET:
             stmt_op = self.parse_stmt()
             stmt_seq.append(stmt_op)
-            if self.check(TokenKind.INDENT):
+            kind = self.peek_kind()
+            if kind == TokenKind.INDENT:
                 self.error("Unexpected indentation")
-            if self.check(TokenKind.ASSIGN):
+            if kind == TokenKind.ASSIGN:
                 self.error("No left-hand side in assign statement")
 
         return stmt_seq
@@ -401,12 +438,9 @@ class Parser:
               | for_stmt
         :return: Statement as operation
         """
-        if self.check(TokenKind.IF):
-            return self.parse_if_stmt()
-        elif self.check(TokenKind.WHILE):
-            return self.parse_while_stmt()
-        elif self.check(TokenKind.FOR):
-            return self.parse_for_stmt()
+        parse_compound_stmt = self.compound_stmt_parsers.get(self.peek_kind())
+        if parse_compound_stmt is not None:
+            return parse_compound_stmt()
         simple_stmt = self.parse_simple_stmt()
         self.match(TokenKind.NEWLINE)
         return simple_stmt
@@ -511,11 +545,12 @@ class Parser:
               | assign_expr
         :return: Statement as operation
         """
-        if self.check(TokenKind.PASS):
-            self.match(TokenKind.PASS)
+        kind = self.peek_kind()
+        if kind == TokenKind.PASS:
+            self.lexer.consume()
             return ast.Pass()
-        if self.check(TokenKind.RETURN):
-            self.match(TokenKind.RETURN)
+        if kind == TokenKind.RETURN:
+            self.lexer.consume()
 
             if self.is_expr_first_set():
                 return ast.Return(self.parse_expr())
@@ -536,30 +571,29 @@ class Parser:
         :return: Operation
         """
 
+        token = self.lexer.peek()
+        assert isinstance(token, Token), "Single token expected"
+        kind = token.kind
+
         # `None`
-        if self.check(TokenKind.NONE):
-            self.match(TokenKind.NONE)
+        if kind == TokenKind.NONE:
+            self.lexer.consume()
             return ast.Literal(None)
 
         # `True`
-        if self.check(TokenKind.TRUE):
-            self.match(TokenKind.TRUE)
+        if kind == TokenKind.TRUE:
+            self.lexer.consume()
             return ast.Literal(True)
 
         # `False`
-        if self.check(TokenKind.FALSE):
-            self.match(TokenKind.FALSE)
+        if kind == TokenKind.FALSE:
+            self.lexer.consume()
             return ast.Literal(False)
 
-        # INTEGER
-        if self.check(TokenKind.INTEGER):
-            int_token = self.match(TokenKind.INTEGER)
-            return ast.Literal(int_token.value)
-
-        # STRING
-        if self.check(TokenKind.STRING):
-            str_token = self.match(TokenKind.STRING)
-            return ast.Literal(str_token.value)
+        # INTEGER | STRING
+        if kind == TokenKind.INTEGER or kind == TokenKind.STRING:
+            self.lexer.consume()
+            return ast.Literal(token.value)
 
         self.error("Expected expression")
 
@@ -592,193 +626,64 @@ class Parser:
 
     def parse_expr(self) -> Operation:
         """
-        Parse conditional expressions paired with the `if/else` operators, if such operators exists.
-        Otherwise, parse only one logical expression.
-
-        expr := or_expr `if` expr `else` expr
-              | or_expr
-
-        Conditional expressions are right-associative.
-        :return: Operation
-        """
-        lhs = self.parse_or_expr()
-
-        if self.check(TokenKind.IF):
-            self.match(TokenKind.IF)
-
-            cond = self.parse_expr()
-
-            self.match(TokenKind.ELSE)
-            rhs = self.parse_expr()
-
-            lhs = ast.IfExpr(cond, lhs, rhs)
-
-        return lhs
-
-    def parse_or_expr(self) -> Operation:
-        """
-        Parse logical expressions paired with the `or` operator, if such an operator exists.
-        Otherwise, parse only one logical expression.
-
-        expr := and_expr ('or' and_expr)*
-
-        `or` expressions are left-associative.
-        :return: Operation
-        """
-        lhs = self.parse_and_expr()
-
-        while self.check(TokenKind.OR):
-            self.match(TokenKind.OR)
-
-            rhs = self.parse_and_expr()
-            lhs = ast.BinaryExpr("or", lhs, rhs)
-
-        return lhs
-
-    def parse_and_expr(self) -> Operation:
-        """
-        Parse logical expressions paired with the `and` operator, if such an operator exists.
-        Otherwise, parse only one logical expression.
+        Parse an expression.
 
-        and_expr:= not_expr ('and' not_expr)*
+             expr := or_expr `if` expr `else` expr
+                   | or_expr
+          or_expr := and_expr (`or` and_expr)*
+         and_expr := not_expr (`and` not_expr)*
+         not_expr := `not` not_expr
+                   | comp_expr
+        comp_expr := arith_expr (comp_op arith_expr)?
+       arith_expr := term ((`+` | `-`) term)*
+             term := cexpr ((`*` | `//` | `%`) cexpr)*
 
-        `and` expressions are left-associative.
+        Conditional expressions are right-associative, comparisons are not associative,
+        and all other binary operators are left-associative. Rather than descending
+        through one function per rule, the operators are parsed by precedence climbing
+        over `BINDING_POWERS`.
         :return: Operation
         """
-        lhs = self.parse_not_expr()
-
-        while self.check(TokenKind.AND):
-            self.match(TokenKind.AND)
-
-            rhs = self.parse_not_expr()
-            lhs = ast.BinaryExpr("and", lhs, rhs)
+        return self.parse_operator_expr(0)
 
-        return lhs
-
-    def parse_not_expr(self) -> Operation:
+    def parse_operator_expr(self, min_power: int) -> Operation:
         """
-        Parse a logical expression, with optionally a `not` operator.
+        Parse an expression whose operators bind at least as tightly as `min_power`.
 
-        not_expr:= 'not' not_expr | arith_expr
         :return: Operation
         """
-        if self.check(TokenKind.NOT):
+        # `not` not_expr, where a not_expr is allowed
+        if min_power <= NOT_BINDING_POWER and self.check(TokenKind.NOT):
             self.match(TokenKind.NOT)
-            not_expr = self.parse_not_expr()
+            not_expr = self.parse_operator_expr(NOT_BINDING_POWER)
             lhs = ast.UnaryExpr("not", not_expr)
         else:
-            lhs = self.parse_comp_expr()
-        return lhs
-
-    def parse_comp_expr(self) -> Operation:
-        """
-        Parse a comparison expression.
-
-        comp_expr := arith_expr (comp_op arith_expr)?
-          comp_op := `==`
-                   | `!=`
-                   | `<`
-                   | `<=`
-                   | `>`
-                   | `>=`
-                   | `is`
-
-        :return: Operation
-        """
-        lhs = self.parse_arith_expr()
-
-        if (
-            self.check(TokenKind.EQ)
-            or self.check(TokenKind.NE)
-            or self.check(TokenKind.LT)
-            or self.check(TokenKind.LE)
-            or self.check(TokenKind.GT)
-            or self.check(TokenKind.GE)
-            or self.check(TokenKind.IS)
-        ):
-            if self.check(TokenKind.EQ):
-                op_kind = TokenKind.EQ
-            elif self.check(TokenKind.NE):
-                op_kind = TokenKind.NE
-            elif self.check(TokenKind.LT):
-                op_kind = TokenKind.LT
-            elif self.check(TokenKind.LE):
-                op_kind = TokenKind.LE
-            elif self.check(TokenKind.GT):
-                op_kind = TokenKind.GT
-            elif self.check(TokenKind.GE):
-                op_kind = TokenKind.GE
-            else:
-                op_kind = TokenKind.IS
-
-            op = self.match(op_kind)
-            rhs = self.parse_arith_expr()
-            lhs = ast.BinaryExpr(op.value, lhs, rhs)
-
-            if (
-                self.check(TokenKind.EQ)
-                or self.check(TokenKind.NE)
-                or self.check(TokenKind.LT)
-                or self.check(TokenKind.LE)
-                or self.check(TokenKind.GT)
-                or self.check(TokenKind.GE)
-                or self.check(TokenKind.IS)
-            ):
-                self.error("Comparison operators are not associative")
-
-        return lhs
-
-    def parse_arith_expr(self) -> Operation:
-        """
-        Parse an arithmetic expression from input.
+            lhs = self.parse_cexpr()
+
+        while True:
+            op = self.lexer.peek()
+            assert isinstance(op, Token), "Single token expected"
+            power = BINDING_POWERS.get(op.kind)
+            if power is None or power < min_power:
+                return lhs
+            self.lexer.consume()
 
-        arith_expr := term ((`+` | `-`) cexpr)*
+            if op.kind == TokenKind.IF:
+                cond = self.parse_expr()
 
-        Arithmetic expressions are left-associative.
-        :return: Operation
-        """
-        lhs = self.parse_term()
+                self.match(TokenKind.ELSE)
+                rhs = self.parse_expr()
 
-        while self.check(TokenKind.PLUS) or self.check(TokenKind.MINUS):
-            if self.check(TokenKind.PLUS):
-                op_kind = TokenKind.PLUS
-            else:
-                op_kind = TokenKind.MINUS
+                return ast.IfExpr(cond, lhs, rhs)
 
-            op = self.match(op_kind)
-            rhs = self.parse_term()
+            rhs = self.parse_operator_expr(power + 1)
             lhs = ast.BinaryExpr(op.value, lhs, rhs)
 
-        return lhs
-
-    def parse_term(self):
-        """
-        Parse a term from input.
-
-        term := cexpr ((`*` | `\\` | `%`) cexpr)*
-
-        Terms are left-associative.
-        :return: Operation
-        """
-        lhs = self.parse_cexpr()
-
-        while (
-            self.check(TokenKind.MUL)
-            or self.check(TokenKind.DIV)
-            or self.check(TokenKind.MOD)
-        ):
-            if self.check(TokenKind.MUL):
-                op_kind = TokenKind.MUL
-            elif self.check(TokenKind.DIV):
-                op_kind = TokenKind.DIV
-            else:
-                op_kind = TokenKind.MOD
-
-            op = self.match(op_kind)
-            rhs = self.parse_cexpr()
-            lhs = ast.BinaryExpr(op.value, lhs, rhs)
-
-        return lhs
+            if power == COMPARISON_BINDING_POWER:
+                next_op = self.lexer.peek()
+                assert isinstance(next_op, Token), "Single token expected"
+                if BINDING_POWERS.get(next_op.kind) == COMPARISON_BINDING_POWER:
+                    self.error("Comparison operators are not associative")
 
     def parse_cexpr(self) -> Operation:
         """Parse a cexpr from input.
@@ -830,9 +735,14 @@ class Parser:
 
         :return: Operation
         """
+        token = self.lexer.peek()
+        assert isinstance(token, Token), "Single token expected"
+        kind = token.kind
+
         # ID | ID `(` arglist `)`
-        if self.check(TokenKind.IDENTIFIER):
-            identifier_name = self.match(TokenKind.IDENTIFIER).value
+        if kind == TokenKind.IDENTIFIER:
+            self.lexer.consume()
+            identifier_name = token.value
             # ID `(` arglist `)`
             if self.check(TokenKind.LROUNDBRACKET):
                 self.match(TokenKind.LROUNDBRACKET)
@@ -849,7 +759,7 @@ class Parser:
                 return ast.ExprName(identifier_name)
 
         # `[' arglist `]`
-        if self.check(TokenKind.LSQUAREBRACKET):
+        if kind == TokenKind.LSQUAREBRACKET:
             self.match(TokenKind.LSQUAREBRACKET)
             arglist = self.parse_arglist()
 
@@ -861,14 +771,14 @@ class Parser:
             return ast.ListExpr(arglist)
 
         # `(` expr `)`
-        if self.check(TokenKind.LROUNDBRACKET):
+        if kind == TokenKind.LROUNDBRACKET:
             self.match(TokenKind.LROUNDBRACKET)
             cexpr = self.parse_expr()
             self.match(TokenKind.RROUNDBRACKET)
             return cexpr
 
         # `-` cexpr
-        if self.check(TokenKind.MINUS):
+        if kind == TokenKind.MINUS:
             self.match(TokenKind.MINUS)
             cexpr = self.parse_cexpr()
             return ast.UnaryExpr("-", cexpr)
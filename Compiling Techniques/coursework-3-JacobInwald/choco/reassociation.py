@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp, StringAttr
+from xdsl.ir import BlockArgument, MLContext, Operation, OpResult, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.constant_propagation import MAX_INT, MIN_INT
+from choco.dialects import choco_type
+from choco.dialects.choco_flat import *
+
+# The associative and commutative operators on ints, with their neutral elements.
+NEUTRAL_ELEMENTS = {"+": 0, "*": 1}
+
+
+def is_chain_link(op: Operation) -> bool:
+    return (
+        isinstance(op, BinaryExpr)
+        and op.op.data in NEUTRAL_ELEMENTS
+        and op.result.type == choco_type.int_type
+    )
+
+
+def absorbed_by(op: BinaryExpr) -> Optional[BinaryExpr]:
+    """
+    The operation of the same chain that uses the result of an operation, if it is the
+    only use and they are in the same block, so that the operation can be recomputed
+    in a different order.
+    """
+    if len(op.result.uses) != 1:
+        return None
+    user = next(iter(op.result.uses)).operation
+    if (
+        is_chain_link(user)
+        and user.op.data == op.op.data  # type: ignore
+        and user.parent is op.parent
+    ):
+        return user  # type: ignore
+    return None
+
+
+def int_constant(value: SSAValue) -> Optional[int]:
+    op = value.owner
+    if isinstance(op, Literal) and isinstance(op.value, IntegerAttr):
+        return op.value.parameters[0].data  # type: ignore
+    return None
+
+
+@dataclass
+class Reassociation:
+    """
+    Rewrite each chain of `+`, or of `*`, on ints as the sum, or product, of its terms
+    in a canonical order, with the constant terms folded into a single one at the end.
+    The terms are combined pairwise, so that the result is a balanced tree.
+
+    The terms are ordered by the variable they are loaded from, then by their
+    position, so that chains on the same variables get the same shape whatever order
+    they were written in, and value numbering can find them equal. Since ints wrap
+    around, any order gives the same result. Chains whose constants overflow when
+    folded are left unchanged.
+    """
+
+    # The position of each operation and variable in the module.
+    positions: Dict[Operation, int]
+
+    def rank(self, value: SSAValue) -> Tuple[int, int]:
+        if isinstance(value, BlockArgument):
+            return (1, value.index)
+        op = value.owner
+        assert isinstance(op, Operation)
+        if isinstance(op, Load) and isinstance(op.memloc, OpResult):
+            return (0, self.positions[op.memloc.op])
+        return (2, self.positions[op])
+
+    def terms(self, op: BinaryExpr, links: List[BinaryExpr]) -> List[SSAValue]:
+        """The terms of the chain ending at an operation, and the operations in it."""
+        links.append(op)
+        terms: List[SSAValue] = []
+        for operand in op.operands:
+            inner = operand.owner
+            if is_chain_link(inner) and absorbed_by(inner) is op:  # type: ignore
+                terms += self.terms(inner, links)  # type: ignore
+            else:
+                terms.append(operand)
+        return terms
+
+    def rewrite(self, root: BinaryExpr) -> None:
+        operator = root.op.data  # type: ignore
+        links: List[BinaryExpr] = []
+        terms = self.terms(root, links)
+        neutral = NEUTRAL_ELEMENTS[operator]
+        constant = neutral
+        variables: List[SSAValue] = []
+        for term in terms:
+            value = int_constant(term)
+            if value is None:
+                variables.append(term)
+            elif operator == "+":
+                constant += value
+            else:
+                constant *= value
+        if not MIN_INT <= constant <= MAX_INT:
+            return
+        variables.sort(key=self.rank)
+        if len(links) == 1 and len(variables) == len(terms) and variables == terms:
+            # nothing to fold, and already in order
+            return
+
+        new_ops: List[Operation] = []
+        if constant == 0 and operator == "*":
+            variables = []
+        if constant != neutral or not variables:
+            literal = Literal.get(constant)
+            new_ops.append(literal)
+            variables.append(literal.result)
+        while len(variables) > 1:
+            pairs: List[SSAValue] = []
+            for lhs, rhs in zip(variables[::2], variables[1::2]):
+                expr = BinaryExpr.create(
+                    properties={"op": StringAttr(operator)},
+                    operands=[lhs, rhs],
+                    result_types=[choco_type.int_type],
+                )
+                new_ops.append(expr)
+                pairs.append(expr.result)
+            if len(variables) % 2:
+                pairs.append(variables[-1])
+            variables = pairs
+
+        block = root.parent_block()
+        assert block is not None
+        block.insert_ops_before(new_ops, root)
+        for new_op in new_ops:
+            # later chains may use the result as a term
+            self.positions[new_op] = self.positions[root]
+        root.result.replace_by(variables[0])
+        # the chain ends at the root, each other link is only used by a later one
+        for link in links:
+            block.erase_op(link)
+
+
+class ChocoFlatReassociation(ModulePass):
+    """
+    Put the chains of int additions and multiplications in a canonical order, folding
+    their constants together.
+    """
+
+    name = "choco-flat-reassociation"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        positions = {inner: position for position, inner in enumerate(op.walk())}
+        roots = [
+            expr
+            for expr in op.walk()
+            if is_chain_link(expr) and absorbed_by(expr) is None  # type: ignore
+        ]
+        reassociation = Reassociation(positions)
+        for root in roots:
+            reassociation.rewrite(root)  # type: ignore
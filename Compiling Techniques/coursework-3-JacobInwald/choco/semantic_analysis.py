@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Union
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import MLContext, Operation
+from xdsl.passes import ModulePass
+
+from choco.check_assign_target import AssignVisitor, CheckAssignTargetPass
+from choco.dialects import choco_ast
+from choco.name_analysis import (
+    NameAnalysis,
+    NameAnalysisVisitor,
+    NameTable,
+    build_name_table,
+    get_func_scope,
+)
+from choco.semantic_error import SemanticError
+from choco.symbol_table import Scope, SymbolTables
+from choco.type_checking import (
+    FunctionInfo,
+    LocalEnvironment,
+    Type,
+    TypeChecking,
+    build_globals,
+    check_program,
+)
+
+
+class SemanticEnvironment(LocalEnvironment):
+    """
+    Local environment that checks the assignment targets and names of every statement
+    and expression while the type checker traverses the program.
+    """
+
+    def __init__(
+        self, global_scope: Scope[Union[Type, FunctionInfo]], names: NameTable
+    ):
+        super().__init__(global_scope)
+        self.names = names
+        self.assign_visitor = AssignVisitor()
+        self.name_visitor = NameAnalysisVisitor(names)
+
+    def check_stmt(self, op: Operation):
+        if isinstance(op, choco_ast.Assign):
+            # the targets of a multiple assignment are nested assignments
+            assign = op
+            while isinstance(assign, choco_ast.Assign):
+                self.assign_visitor.visit_assign(assign)
+                self.name_visitor.visit_assign(assign)
+                assign = assign.value.op
+        elif isinstance(op, choco_ast.For):
+            self.name_visitor.check_iter_name(op)
+        elif isinstance(op, choco_ast.GlobalDecl):
+            self.name_visitor.visit_global_decl(op)
+        elif isinstance(op, choco_ast.NonLocalDecl):
+            self.name_visitor.visit_non_local_decl(op)
+
+    def check_expr(self, op: Operation):
+        if isinstance(op, choco_ast.ExprName):
+            self.name_visitor.visit_expr_name(op)
+        elif isinstance(op, choco_ast.CallExpr):
+            self.name_visitor.visit_call_expr(op)
+
+    @contextmanager
+    def function_scope(
+        self, f: str, symbols: Dict[str, Union[Type, FunctionInfo]]
+    ) -> Iterator[Scope[Union[Type, FunctionInfo]]]:
+        with self.names.scope(get_func_scope(self.names, f)):
+            with super().function_scope(f, symbols) as scope:
+                yield scope
+
+
+class SemanticAnalysis(ModulePass):
+    """
+    Check the assignment targets, analyse the names and type check the program in a
+    single traversal, instead of one traversal per pass.
+    """
+
+    name = "semantic-analysis"
+
+    # Shared with the other passes of the pipeline by choco-opt.
+    symbols: Optional[SymbolTables] = None
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        symbols = self.symbols or SymbolTables()
+        try:
+            names = symbols.get(op, "names", build_name_table)
+            env = SemanticEnvironment(symbols.get(op, "types", build_globals), names)
+            check_program(env, op)
+        except SemanticError:
+            # A single traversal finds the errors of a program in a different order
+            # than the separate passes. Run them to raise the error they would report.
+            CheckAssignTargetPass().apply(ctx, op)
+            for semantic_pass in (NameAnalysis(), TypeChecking()):
+                semantic_pass.symbols = symbols
+                semantic_pass.apply(ctx, op)
+            raise
@@ -0,0 +1,130 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp, UnitAttr
+from xdsl.ir import MLContext, Operation, SSAValue
+from xdsl.passes import ModulePass
+
+from choco.bounds_check_elimination import assignments, constant_int, defining_op
+from choco.dialects.choco_flat import *
+from choco.licm import is_variant
+
+
+def induction_step(phi: SSAValue) -> Optional[Tuple[While, Assign, int]]:
+    """
+    The loop in which a phi is an induction variable, that is increased by a constant
+    at the end of each iteration, with the assignment and the constant.
+    """
+    steps = []
+    for assign in assignments(phi):
+        loop = assign.parent_op()
+        if isinstance(loop, While) and assign.parent_region() is loop.body:
+            steps.append((loop, assign))
+    if len(steps) != 1:
+        return None
+    loop, assign = steps[0]
+    if any(
+        loop.is_ancestor(other) and other is not assign for other in assignments(phi)
+    ):
+        return None
+    increment = defining_op(assign.value)
+    if not isinstance(increment, BinaryExpr) or increment.op.data != "+":
+        return None
+    for term, step in [(increment.lhs, increment.rhs), (increment.rhs, increment.lhs)]:
+        constant = constant_int(step)
+        if term is phi and constant is not None:
+            return loop, assign, constant
+    return None
+
+
+def runs_before(op: Operation, assign: Assign, loop: While) -> bool:
+    """Whether an operation of a loop runs before an assignment at the end of its body."""
+    ancestor = op
+    while ancestor.parent_op() is not loop:
+        ancestor = ancestor.parent_op()
+        assert ancestor is not None
+    if ancestor.parent_region() is loop.cond:
+        return True
+    block = loop.body.block
+    return block.get_operation_index(ancestor) < block.get_operation_index(assign)
+
+
+@dataclass
+class StrengthReduction:
+    """
+    Replace the element addresses `value + (index + 1) * 4` computed in a loop whose
+    index is increased by a constant in each iteration by a pointer, which is
+    increased along with the index. The address of the element at the index is then
+    available without any multiplication.
+
+    Only the accesses whose checks have been removed are rewritten, since the checks
+    read the index anyway.
+    """
+
+    # The pointer of each list or string and induction variable.
+    pointers: Dict[Tuple[SSAValue, SSAValue], SSAValue] = field(default_factory=dict)
+
+    def rewrite(self, access: GetAddress) -> None:
+        if access.in_bounds is None or access.not_none is None:
+            return
+        index = access.index
+        if not isinstance(defining_op(index), Phi):
+            return
+        step = induction_step(index)
+        if step is None:
+            return
+        loop, assign, constant = step
+        if not loop.is_ancestor(access) or not runs_before(access, assign, loop):
+            return
+        if is_variant(access.value, loop):
+            return
+        access.result.replace_by(
+            self.pointer(access, loop, assign, constant)
+        )
+        access.parent_block().erase_op(access)  # type: ignore
+
+    def pointer(
+        self, access: GetAddress, loop: While, assign: Assign, constant: int
+    ) -> SSAValue:
+        key = (access.value, access.index)
+        if key in self.pointers:
+            return self.pointers[key]
+        memloc_type = access.result.type
+        pointer = Phi.get(memloc_type)
+        # the element the index points to when the loop starts, which is not read if
+        # the loop does not run
+        start = GetAddress.create(
+            operands=[access.value, access.index],
+            properties={"in_bounds": UnitAttr(), "not_none": UnitAttr()},
+            result_types=[memloc_type],
+        )
+        loop.parent_block().insert_ops_before(  # type: ignore
+            [pointer, start, Assign.build(operands=[pointer.result, start.result])],
+            loop,
+        )
+        next_ = OffsetAddress.create(
+            operands=[pointer.result],
+            properties={"offset": IntegerAttr.from_int_and_width(constant, 32)},
+            result_types=[memloc_type],
+        )
+        loop.body.block.insert_op_before(next_, assign)
+        loop.body.block.insert_op_after(
+            Assign.build(operands=[pointer.result, next_.result]), assign
+        )
+        self.pointers[key] = pointer.result
+        return pointer.result
+
+
+class ChocoFlatStrengthReduction(ModulePass):
+    """
+    Turn the list element addresses computed from the index of a loop into pointers
+    that are increased in each iteration.
+    """
+
+    name = "choco-flat-strength-reduction"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        strength_reduction = StrengthReduction()
+        accesses = [access for access in op.walk() if isinstance(access, GetAddress)]
+        for access in accesses:
+            strength_reduction.rewrite(access)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, TypeVar
+
+from xdsl.dialects.builtin import ModuleOp
+
+T = TypeVar("T")
+
+
+@dataclass(eq=False)
+class Scope(Generic[T]):
+    """
+    The symbols declared in one scope of a program, e.g. the global scope or the
+    body of a function.
+    """
+
+    symbols: Dict[str, T] = field(default_factory=dict)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.symbols
+
+
+class SymbolTable(Generic[T]):
+    """
+    Scoped symbol table used by the semantic passes and the IR generation.
+
+    The scopes that are currently open form a chain from the global scope to the
+    innermost scope. Instead of walking this chain on every lookup, the table keeps
+    a flattened view of it: for every name the stack of its visible declarations,
+    innermost last. Lookups are therefore O(1) and opening or closing a scope costs
+    time proportional to the symbols of that scope only, not to the whole chain.
+    """
+
+    def __init__(self, global_scope: Optional[Scope[T]] = None):
+        self.global_scope: Scope[T] = global_scope or Scope()
+        self.scopes: List[Scope[T]] = []
+        self.bindings: Dict[str, List[T]] = {}
+        self.enter(self.global_scope)
+
+    @property
+    def current(self) -> Scope[T]:
+        """The innermost open scope."""
+        return self.scopes[-1]
+
+    @property
+    def enclosing(self) -> Optional[Scope[T]]:
+        """The scope the current scope is nested in, if any."""
+        return self.scopes[-2] if len(self.scopes) > 1 else None
+
+    def enter(self, scope: Scope[T]):
+        """Open a scope nested in the current scope, making its symbols visible."""
+        self.scopes.append(scope)
+        for name, value in scope.symbols.items():
+            self.bindings.setdefault(name, []).append(value)
+
+    def exit(self):
+        """Close the current scope, hiding its symbols again."""
+        scope = self.scopes.pop()
+        for name in scope.symbols:
+            stack = self.bindings[name]
+            stack.pop()
+            if not stack:
+                del self.bindings[name]
+
+    @contextmanager
+    def scope(self, scope: Scope[T]) -> Iterator[Scope[T]]:
+        """Open `scope` for the duration of a `with` block."""
+        self.enter(scope)
+        try:
+            yield scope
+        finally:
+            self.exit()
+
+    def declare(self, name: str, value: T):
+        """Declare or redeclare `name` in the current scope."""
+        symbols = self.current.symbols
+        if name in symbols:
+            self.bindings[name][-1] = value
+        else:
+            self.bindings.setdefault(name, []).append(value)
+        symbols[name] = value
+
+    def __contains__(self, name: str) -> bool:
+        """Check if `name` is declared in the current scope or an enclosing scope."""
+        return name in self.bindings
+
+    def __getitem__(self, name: str) -> T:
+        """The innermost visible declaration of `name`."""
+        return self.bindings[name][-1]
+
+    def get(self, name: str, default: Optional[T] = None) -> Optional[T]:
+        stack = self.bindings.get(name)
+        return stack[-1] if stack else default
+
+
+class SymbolTables:
+    """
+    The symbol tables of a module, built once and shared by the passes that run on it.
+
+    choco-opt hands the same instance to every pass of a pipeline that needs a table,
+    so that e.g. name analysis and type checking do not both collect the declarations
+    of the program. Each table is built the first time a pass asks for it, and all
+    tables are dropped when a pass gets another module. The IR generation does not
+    use them, as it binds names to SSA values that only exist during the lowering.
+    """
+
+    def __init__(self):
+        self.module: Optional[ModuleOp] = None
+        self.tables: Dict[str, Any] = {}
+
+    def get(self, module: ModuleOp, name: str, build: Callable[[ModuleOp], T]) -> T:
+        """The table `name` of `module`, built with `build` if it does not exist yet."""
+        if module is not self.module:
+            self.module = module
+            self.tables = {}
+        if name not in self.tables:
+            self.tables[name] = build(module)
+        return self.tables[name]
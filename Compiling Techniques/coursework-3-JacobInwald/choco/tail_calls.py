@@ -0,0 +1,166 @@
+from typing import List, Optional
+
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, MLContext, Operation, OpResult, Region
+from xdsl.passes import ModulePass
+
+from choco.dialects import choco_type
+from choco.dialects.choco_flat import *
+
+
+def parameter_stores(func: FuncDef) -> Optional[List[Store]]:
+    """
+    The stores of the parameters of a function to their variables, which are all at
+    the start of its body.
+    """
+    stores: List[Store] = []
+    for arg in func.func_body.block.args:
+        arg_stores = [
+            use.operation
+            for use in arg.uses
+            if isinstance(use.operation, Store)
+            and use.index == 1
+            and use.operation.parent_op() is func
+            and isinstance(use.operation.memloc, OpResult)
+            and isinstance(use.operation.memloc.op, Alloc)
+        ]
+        if len(arg_stores) != 1:
+            return None
+        stores.append(arg_stores[0])
+    return stores
+
+
+def is_in_tail_position(op: Operation, func: FuncDef) -> bool:
+    """
+    Whether nothing else runs in the body of a function after an operation: it is the
+    last one of its block, and the ifs it is nested in are too.
+    """
+    while op.parent_op() is not func:
+        if op.next_op is not None or not isinstance(op.parent_op(), If):
+            return False
+        op = op.parent_op()  # type: ignore
+    return op.next_op is None
+
+
+def returns_self_call(op: Operation, func: FuncDef) -> bool:
+    """Whether an operation returns the result of a self call made right before it."""
+    call = op.prev_op
+    return (
+        isinstance(op, Return)
+        and isinstance(call, CallExpr)
+        and call.func_name == func.func_name
+        and call.result is not None
+        and op.value is call.result
+        and len(call.result.uses) == 1
+    )
+
+
+def move_into_branches(block: Block) -> None:
+    """
+    Move the operations that follow an if whose branch ends with a return into its
+    other branch, so that the if, and the last operations of its branches, are the
+    last ones of the block:
+
+        if c:                       if c:
+            return f(a)                 return f(a)
+        return f(b)         ->      else:
+                                        return f(b)
+    """
+    op = block.first_op
+    while op is not None:
+        if isinstance(op, If):
+            then_returns = isinstance(op.then.block.last_op, Return)
+            orelse_returns = isinstance(op.orelse.block.last_op, Return)
+            if then_returns != orelse_returns:
+                other = op.orelse.block if then_returns else op.then.block
+                while op.next_op is not None:
+                    following = op.next_op
+                    following.detach()
+                    other.add_op(following)
+            if op.next_op is None:
+                move_into_branches(op.then.block)
+                move_into_branches(op.orelse.block)
+        op = op.next_op
+
+
+def tail_calls(func: FuncDef) -> List[Return]:
+    """The returns of the result of a call of the function itself, made right before."""
+    return [
+        op
+        for op in func.func_body.walk()
+        if isinstance(op, Return)
+        and returns_self_call(op, func)
+        and is_in_tail_position(op, func)
+    ]
+
+
+def eliminate_tail_calls(func: FuncDef) -> None:
+    """
+    Run the body of a function in a loop that goes on while a tail call replaced the
+    parameters with the arguments of the call:
+
+        again = True
+        while again:
+            again = False
+            <body, with `return f(args)` replaced by `params = args; again = True`>
+    """
+    stores = parameter_stores(func)
+    if stores is None or not any(
+        returns_self_call(op, func) for op in func.func_body.walk()
+    ):
+        return
+    move_into_branches(func.func_body.block)
+    returns = tail_calls(func)
+    if not returns:
+        return
+    block = func.func_body.block
+    again = Alloc.build(
+        properties={"type": choco_type.bool_type},
+        result_types=[MemlocType([choco_type.bool_type])],
+    )
+    for ret in returns:
+        call = ret.prev_op
+        assert isinstance(call, CallExpr)
+        parent = ret.parent_block()
+        assert parent is not None
+        # the arguments are all computed before the parameters change
+        true = Literal.get(True)
+        parent.insert_ops_before(
+            [
+                Store.build(operands=[store.memloc, arg])
+                for store, arg in zip(stores, call.args)
+            ]
+            + [true, Store.build(operands=[again, true])],
+            call,
+        )
+        parent.erase_op(ret)
+        parent.erase_op(call)
+
+    # the parameters are stored before the loop, the rest of the body runs in it
+    entry = max([-1] + [block.get_operation_index(store) for store in stores])
+    body_ops = list(block.ops)[entry + 1 :]
+    false = Literal.get(False)
+    loop_body = Block([false, Store.build(operands=[again, false])])
+    for op in body_ops:
+        op.detach()
+        loop_body.add_op(op)
+    cond = Load.build(operands=[again], result_types=[choco_type.bool_type])
+    loop = While.create(
+        regions=[Region(Block([cond, Yield.get(cond)])), Region(loop_body)]
+    )
+    true = Literal.get(True)
+    block.add_ops([again, true, Store.build(operands=[again, true]), loop])
+
+
+class ChocoFlatTailCallElimination(ModulePass):
+    """
+    Turn the self-recursive calls of a function whose result is returned right away
+    into a loop, so that the function runs in constant stack space.
+    """
+
+    name = "choco-flat-tail-call-elimination"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        funcs = [func for func in op.walk() if isinstance(func, FuncDef)]
+        for func in funcs:
+            eliminate_tail_calls(func)
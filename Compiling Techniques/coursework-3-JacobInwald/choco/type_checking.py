@@ -3,7 +3,7 @@ from __future__ import annotations
 from abc import ABC
 from dataclasses import dataclass
 from functools import reduce
-from typing import Dict, List, Optional, Tuple, Union
+from typing import ContextManager, Dict, List, Optional, Tuple, Union
 
 from xdsl.dialects.builtin import ModuleOp
 from xdsl.ir import Attribute, MLContext, Operation
@@ -12,6 +12,7 @@ from xdsl.passes import ModulePass
 from choco.ast_visitor import Visitor
 from choco.dialects import choco_ast, choco_type
 from choco.semantic_error import SemanticError
+from choco.symbol_table import Scope, SymbolTable, SymbolTables
 
 
 class Type(ABC):
@@ -191,29 +192,56 @@ class FunctionInfo:
             raise Exception(f"Expected same number of input types and parameter names")
 
 
-LocalEnvironment = Dict[str, Union[Type, FunctionInfo]]
+class LocalEnvironment(SymbolTable[Union[Type, FunctionInfo]]):
+    """
+    The local environment O of the typing rules.
+
+    Before typing a statement or an expression the type checker calls `check_stmt` or
+    `check_expr` on it, and it opens the scope of each function body with
+    `function_scope`. Subclasses use these to run further checks during the same
+    traversal.
+    """
+
+    def check_stmt(self, op: Operation):
+        pass
+
+    def check_expr(self, op: Operation):
+        pass
+
+    def function_scope(
+        self, f: str, symbols: Dict[str, Union[Type, FunctionInfo]]
+    ) -> ContextManager[Scope[Union[Type, FunctionInfo]]]:
+        return self.scope(Scope(symbols))
 
 
 class TypeChecking(ModulePass):
     name = "type-checking"
 
+    # Shared with the other passes of the pipeline by choco-opt.
+    symbols: Optional[SymbolTables] = None
+
     def apply(self, ctx: MLContext, op: ModuleOp) -> None:
-        o = build_env(op)
-        r = bottom_type
+        global_scope = (self.symbols or SymbolTables()).get(op, "types", build_globals)
+        o = LocalEnvironment(global_scope)
+        check_program(o, op)
+
+
+def check_program(o: LocalEnvironment, module: ModuleOp):
+    r = bottom_type
 
-        program = op.ops.first
-        assert isinstance(program, choco_ast.Program)
-        defs = list(program.defs.ops)
-        if len(defs) >= 1:
-            check_stmt_or_def_list(o, r, defs)
-        stmts = list(program.stmts.ops)
-        if len(stmts) >= 1:
-            check_stmt_or_def_list(o, r, stmts)
+    program = module.ops.first
+    assert isinstance(program, choco_ast.Program)
+    defs = list(program.defs.ops)
+    if len(defs) >= 1:
+        check_stmt_or_def_list(o, r, defs)
+    stmts = list(program.stmts.ops)
+    if len(stmts) >= 1:
+        check_stmt_or_def_list(o, r, stmts)
 
 
 # Build local environments
 def build_env(module: ModuleOp) -> LocalEnvironment:
-    o: LocalEnvironment = {
+    o: Dict[str, Union[Type, FunctionInfo]] = {
         "len": FunctionInfo(FunctionType([object_type], int_type), ["arg"], []),
         "print": FunctionInfo(FunctionType([object_type], none_type), ["arg"], []),
         "input": FunctionInfo(FunctionType([], str_type), [], []),
@@ -221,7 +249,12 @@ def build_env(module: ModuleOp) -> LocalEnvironment:
 
     @dataclass
     class BuildEnvVisitor(Visitor):
-        o: LocalEnvironment
+        o: Dict[str, Union[Type, FunctionInfo]]
+
+        def traverse_program(self, program: choco_ast.Program):
+            # only the definitions of a program hold typed variables
+            for op in program.defs.ops:
+                self.traverse(op)
 
         def visit_typed_var(self, typed_var: choco_ast.TypedVar):
             name, type = typed_var.var_name.data, Type.from_op(  # type: ignore
@@ -248,7 +281,8 @@ def build_env(module: ModuleOp) -> LocalEnvironment:
             # collect nested variable definitions
             body_visitor = BuildEnvVisitor({})
             for op in func_def.func_body.ops:
-                body_visitor.traverse(op)
+                if isinstance(op, (choco_ast.VarDef, choco_ast.FuncDef)):
+                    body_visitor.traverse(op)
             vs: List[Tuple[str, Type]] = []
             for var_name, var_type in body_visitor.o.items():
                 assert isinstance(var_type, Type)
@@ -258,7 +292,12 @@ def build_env(module: ModuleOp) -> LocalEnvironment:
 
     BuildEnvVisitor(o).traverse(module)
 
-    return o
+    return LocalEnvironment(Scope(o))
+
+
+def build_globals(module: ModuleOp) -> Scope[Union[Type, FunctionInfo]]:
+    """The global scope of the local environment, which the type checker never changes."""
+    return build_env(module).global_scope
 
 
 # Dispatch to typing rules to decide which rule to invoke
@@ -269,6 +308,7 @@ def check_stmt_or_def_list(o: LocalEnvironment, r: Type, ops: List[Operation]):
 
 
 def check_stmt_or_def(o: LocalEnvironment, r: Type, op: Operation):
+    o.check_stmt(op)
     if isinstance(op, choco_ast.FuncDef):
         func_def = op
         f = func_def.func_name.data  # type: ignore
@@ -328,9 +368,9 @@ def check_stmt_or_def(o: LocalEnvironment, r: Type, op: Operation):
         id = op.iter_name.data  # type: ignore
         t = check_expr(o, r, e)
         if t == str_type:
-            return for_str_rule(o, r, id, e, b)
+            return for_str_rule(o, r, id, t, b)
         elif isinstance(t, ListType):
-            return for_list_rule(o, r, id, e, b)
+            return for_list_rule(o, r, id, t, b)
         else:
             raise SemanticError(f"Found {t} but expected str or list type")
     elif isinstance(op, choco_ast.GlobalDecl) or isinstance(op, choco_ast.NonLocalDecl):
@@ -340,6 +380,7 @@ def check_stmt_or_def(o: LocalEnvironment, r: Type, op: Operation):
 
 
 def check_expr(o: LocalEnvironment, r: Type, op: Operation) -> Type:
+    o.check_expr(op)
     t: Optional[Type] = None
     if isinstance(op, choco_ast.Literal):
         t = literal_rules(o, r, op)
@@ -359,33 +400,33 @@ def check_expr(o: LocalEnvironment, r: Type, op: Operation) -> Type:
         if op_name in ["+", "-", "*", "//", "%"]:
             t1 = check_expr(o, r, e1)
             if t1 == int_type:
-                t = arith_rule(o, r, e1, op_name, e2)
+                t = arith_rule(o, r, t1, op_name, e2)
             elif t1 == str_type and op_name == "+":
-                t = str_concat_rule(o, r, e1, e2)
+                t = str_concat_rule(o, r, t1, e2)
             elif isinstance(t1, ListType):
                 if op_name != "+":
                     raise SemanticError(
                         f"Operator {op_name} cannot be applied on a list type"
                     )
-                t = list_concat_rule(o, r, e1, e2)
+                t = list_concat_rule(o, r, t1, e2)
             else:
                 raise SemanticError(f"Found {t1} but expected int, str, or list type")
         elif op_name in ["<", "<=", ">", ">=", "==", "!="]:
             t1 = check_expr(o, r, e1)
             if t1 == int_type:
-                t = int_compare_rule(o, r, e1, op_name, e2)
+                t = int_compare_rule(o, r, t1, op_name, e2)
             elif t1 == bool_type:
                 if op_name not in ["==", "!="]:
                     raise SemanticError(
                         f"Operator {op_name} cannot be applied on a bool"
                     )
-                t = bool_compare_rule(o, r, e1, op_name, e2)
+                t = bool_compare_rule(o, r, t1, op_name, e2)
             elif t1 == str_type:
                 if op_name not in ["==", "!="]:
                     raise SemanticError(
                         f"Operator {op_name} cannot be applied on a str"
                     )
-                t = str_compare_rule(o, r, e1, op_name, e2)
+                t = str_compare_rule(o, r, t1, op_name, e2)
             else:
                 raise SemanticError(f"Found {t1} but expected int, bool, or str type")
         elif op_name == "and":
@@ -408,9 +449,9 @@ def check_expr(o: LocalEnvironment, r: Type, op: Operation) -> Type:
         e2 = op.index.op
         t1 = check_expr(o, r, e1)
         if t1 == str_type:
-            t = str_select_rule(o, r, e1, e2)
+            t = str_select_rule(o, r, t1, e2)
         elif isinstance(t1, ListType):
-            t = list_select_rule(o, r, e1, e2)
+            t = list_select_rule(o, r, t1, e2)
         else:
             raise SemanticError(f"Found `{t1}' but expected str or list type")
     elif isinstance(op, choco_ast.ListExpr):
@@ -431,7 +472,10 @@ def check_expr(o: LocalEnvironment, r: Type, op: Operation) -> Type:
     return t
 
 
-# Typing rules, each typing rule is implemented by a corresponding function
+# Typing rules, each typing rule is implemented by a corresponding function.
+# Where the dispatch above already had to type an operand to choose the rule, that
+# type is passed to the rule instead of the operand, so that every expression is
+# typed exactly once.
 
 
 # [VAR-READ] rule
@@ -518,13 +562,11 @@ def negate_rule(o: LocalEnvironment, r: Type, e: Operation) -> Type:
 
 # [ARITH] rule
 # O, R |- e1 op e2 : int
-def arith_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, op: str, e2: Operation
-) -> Type:
+def arith_rule(o: LocalEnvironment, r: Type, t1: Type, op: str, e2: Operation) -> Type:
     # op ∈ {+, −, ∗, //, %}
     assert op in ["+", "-", "*", "//", "%"]
     # O, R |- e1: int
-    check_type(check_expr(o, r, e1), expected=int_type)
+    check_type(t1, expected=int_type)
     # O, R |- e2: int
     check_type(check_expr(o, r, e2), expected=int_type)
     return int_type
@@ -533,12 +575,12 @@ def arith_rule(
 # [INT-COMPARE] rule
 # O, R |- e1 cmp_op e2 : bool
 def int_compare_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, cmp_op: str, e2: Operation
+    o: LocalEnvironment, r: Type, t1: Type, cmp_op: str, e2: Operation
 ) -> Type:
     # cmp_op ∈ {<,<=,>,>=,==,!=}
     assert cmp_op in ["<", "<=", ">", ">=", "==", "!="]
     # O, R |- e1: int
-    check_type(check_expr(o, r, e1), expected=int_type)
+    check_type(t1, expected=int_type)
     # O, R |- e2: int
     check_type(check_expr(o, r, e2), expected=int_type)
     return bool_type
@@ -547,12 +589,12 @@ def int_compare_rule(
 # [BOOL-COMPARE] rule
 # O, R |- e1 cmp_op e2 : bool
 def bool_compare_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, cmp_op: str, e2: Operation
+    o: LocalEnvironment, r: Type, t1: Type, cmp_op: str, e2: Operation
 ) -> Type:
     # cmp_op ∈ {==, !=}
     assert cmp_op in ["==", "!="]
     # O, R |- e1: bool
-    check_type(check_expr(o, r, e1), expected=bool_type)
+    check_type(t1, expected=bool_type)
     # O, R |- e2: bool
     check_type(check_expr(o, r, e2), expected=bool_type)
     return bool_type
@@ -604,12 +646,12 @@ def cond_rule(
 # [STR-COMPARE] rule
 # O, R |- e1 cmp_op e2 : bool
 def str_compare_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, cmp_op: str, e2: Operation
+    o: LocalEnvironment, r: Type, t1: Type, cmp_op: str, e2: Operation
 ) -> Type:
     # cmp_op ∈ {==, !=}
     assert cmp_op in ["==", "!="]
     # O, R |- e1: str
-    check_type(check_expr(o, r, e1), expected=str_type)
+    check_type(t1, expected=str_type)
     # O, R |- e2: str
     check_type(check_expr(o, r, e2), expected=str_type)
     return bool_type
@@ -617,9 +659,9 @@ def str_compare_rule(
 
 # [STR-CONCAT]
 # O, R |- e1 + e2 : str
-def str_concat_rule(o: LocalEnvironment, r: Type, e1: Operation, e2: Operation) -> Type:
+def str_concat_rule(o: LocalEnvironment, r: Type, t1: Type, e2: Operation) -> Type:
     # O, R |- e1 : str
-    check_type(check_expr(o, r, e1), expected=str_type)
+    check_type(t1, expected=str_type)
     # O, R |- e2 : str
     check_type(check_expr(o, r, e2), expected=str_type)
     return str_type
@@ -627,9 +669,9 @@ def str_concat_rule(o: LocalEnvironment, r: Type, e1: Operation, e2: Operation)
 
 # [STR-SELECT]
 # O, R |- e1[e2] : str
-def str_select_rule(o: LocalEnvironment, r: Type, e1: Operation, e2: Operation) -> Type:
+def str_select_rule(o: LocalEnvironment, r: Type, t1: Type, e2: Operation) -> Type:
     # O, R |- e1 : str
-    check_type(check_expr(o, r, e1), expected=str_type)
+    check_type(t1, expected=str_type)
     # O, R |- e2 : int
     check_type(check_expr(o, r, e2), expected=int_type)
     return str_type
@@ -676,25 +718,21 @@ def nil_rule(o: LocalEnvironment, r: Type) -> Type:
 
 # [LIST-CONCAT]
 # O, R |- e1 + e2 : [T]
-def list_concat_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, e2: Operation
-) -> Type:
+def list_concat_rule(o: LocalEnvironment, r: Type, t1: Type, e2: Operation) -> Type:
     # O, R |- e1 : [T1]
-    t1 = check_list_type(check_expr(o, r, e1))
+    elem_t1 = check_list_type(t1)
     # O, R |- e2 : [T2]
-    t2 = check_list_type(check_expr(o, r, e2))
+    elem_t2 = check_list_type(check_expr(o, r, e2))
     # T = T1 |_| T2
-    t = join(t1, t2)
+    t = join(elem_t1, elem_t2)
     return ListType(t)
 
 
 # [LIST-SELECT]
 # O, R |- e1[e2] : T
-def list_select_rule(
-    o: LocalEnvironment, r: Type, e1: Operation, e2: Operation
-) -> Type:
+def list_select_rule(o: LocalEnvironment, r: Type, t1: Type, e2: Operation) -> Type:
     # O, R |- e1 : [T]
-    t = check_list_type(check_expr(o, r, e1))
+    t = check_list_type(t1)
     # O, R |- e2 : int
     check_type(check_expr(o, r, e2), expected=int_type)
     return t
@@ -716,7 +754,8 @@ def multi_assign_stmt(o: LocalEnvironment, r: Type, es: List[Operation], e0: Ope
     t0 = check_expr(o, r, e0)
     for ei in es:
         # O, R |- ei = e0
-        assign_stmt_rule(o, r, ei, e0)
+        ti = check_expr(o, r, ei)
+        check_assignment_compatibility(t0, ti)
     # T0 != [<None>]
     if t0 == ListType(none_type):
         raise SemanticError(f"Type {t0} not allowed to be [<None>]")
@@ -794,11 +833,9 @@ def while_rule(o: LocalEnvironment, r: Type, e: Operation, b: List[Operation]):
 
 # [FOR-STR]
 # O, R |- for id in e: b
-def for_str_rule(
-    o: LocalEnvironment, r: Type, id: str, e: Operation, b: List[Operation]
-):
+def for_str_rule(o: LocalEnvironment, r: Type, id: str, t_e: Type, b: List[Operation]):
     # O, R |- e : str
-    check_type(check_expr(o, r, e), expected=str_type)
+    check_type(t_e, expected=str_type)
     # O(id) = T
     t = o[id]
     if isinstance(t, FunctionInfo):
@@ -813,11 +850,9 @@ def for_str_rule(
 
 # [FOR-LIST]
 # O, R |- for id in e: b
-def for_list_rule(
-    o: LocalEnvironment, r: Type, id: str, e: Operation, b: List[Operation]
-):
+def for_list_rule(o: LocalEnvironment, r: Type, id: str, t_e: Type, b: List[Operation]):
     # O, R |- e : [T1]
-    t1 = check_list_type(check_expr(o, r, e))
+    t1 = check_list_type(t_e)
     # O(id) = T
     t = o[id]
     if isinstance(t, FunctionInfo):
@@ -844,10 +879,10 @@ def func_def_rule(o: LocalEnvironment, r: Type, f: str, b: List[Operation]):
     xs = info.params
     vs = info.nested_defs
 
-    o = o.copy()
-    for xi, ti in zip(xs, ts):
-        o.update({xi: ti})
-    for vi, ti in vs:
-        o.update({vi: ti})
+    # Only the parameters and nested definitions are bound in the scope of the
+    # function, the enclosing scopes are shared rather than copied.
+    local_scope: Dict[str, Union[Type, FunctionInfo]] = dict(zip(xs, ts))
+    local_scope.update(vs)
     # O[T1/x1]...[Tn/xn][T1'/v1]...[Tm'/vm] T |- b
-    check_stmt_or_def_list(o, t, b)
+    with o.function_scope(f, local_scope):
+        check_stmt_or_def_list(o, t, b)
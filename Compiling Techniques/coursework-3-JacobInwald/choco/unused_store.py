@@ -1,64 +1,131 @@
 # type: ignore
 
 from dataclasses import dataclass
+from typing import Set
 
-from xdsl.dialects.builtin import IntegerAttr, ModuleOp
-from xdsl.ir import MLContext
+from xdsl.dialects.builtin import ModuleOp
+from xdsl.ir import Block, MLContext, Operation, SSAValue
 from xdsl.passes import ModulePass
-from xdsl.pattern_rewriter import (
-    GreedyRewritePatternApplier,
-    PatternRewriter,
-    PatternRewriteWalker,
-    RewritePattern,
-    op_type_rewrite_pattern,
-)
 
+from choco.constant_propagation import enclosing_function
 from choco.dialects.choco_flat import *
-from choco.dialects.choco_type import *
+
+Live = Set[SSAValue]
+
+
+def local_variables(module: ModuleOp) -> Set[SSAValue]:
+    """
+    Collect the variables that do not escape the function that allocates them: they
+    are only loaded from, stored to and assigned by for loops in that function, so no
+    call can read them.
+    """
+    memlocs: Set[SSAValue] = set()
+    for op in module.walk():
+        if not isinstance(op, Alloc):
+            continue
+        function = enclosing_function(op)
+        if all(
+            (
+                isinstance(use.operation, Load)
+                or (isinstance(use.operation, (Store, For)) and use.index == 0)
+            )
+            and enclosing_function(use.operation) is function
+            for use in op.memloc.uses
+        ):
+            memlocs.add(op.memloc)
+    return memlocs
 
 
-# # TODO: why doesn't this work!!!!
 @dataclass
-class StoreRewriter(RewritePattern):
-    
-    @op_type_rewrite_pattern
-    def match_and_rewrite(  # type: ignore reportIncompatibleMethodOverride
-        self, store: Store, rewriter: PatternRewriter
-    ) -> None:
-        if isinstance(store.memloc.op, (GetAddress, IndexString)):
-            return
-        uses = store.memloc.uses
-        store_not_loaded = True
-        store_found = False
-        for use in uses:
-            if not store_found:
-                store_found = use.operation == store
-                continue
-            
-            if isinstance(use.operation, Store):
-                break
-            if isinstance(use.operation, Load):
-                store_not_loaded = False
+class UnusedStoreElimination:
+    """
+    Backward liveness of the local variables over the structured control flow of
+    choco_flat. A variable is live at a point if some path from it loads the variable
+    before storing to it, and a store to a variable that is not live after it is
+    erased. Nothing is live at the end of a function or at a return.
+
+    Loops are iterated until the variables live at their start do not change anymore.
+    Stores are only erased once that is known, when `erase` is set.
+    """
+
+    variables: Set[SSAValue]
+    erase: bool = True
+
+    def visit_block(self, block: Block, live: Live) -> Live:
+        for op in reversed(list(block.ops)):
+            live = self.visit_op(op, live)
+        return live
+
+    def visit_op(self, op: Operation, live: Live) -> Live:
+        if isinstance(op, Load):
+            return live | {op.memloc}
+        if isinstance(op, Store):
+            if op.memloc not in self.variables:
+                return live
+            if op.memloc not in live:
+                if self.erase:
+                    op.parent_block().erase_op(op)  # type: ignore
+                return live
+            return live - {op.memloc}
+        if isinstance(op, Return):
+            return set()
+        if isinstance(op, FuncDef):
+            # the body runs when the function is called, not here
+            return live
+        if isinstance(op, If):
+            then = self.visit_block(op.then.block, live)
+            return then | self.visit_block(op.orelse.block, live)
+        if isinstance(op, IfExpr):
+            then = self.visit_block(op.then.block, live)
+            return then | self.visit_block(op.or_else.block, live)
+        if isinstance(op, EffectfulBinaryExpr):
+            # the right hand side may not run
+            rhs = self.visit_block(op.rhs.block, live)
+            return self.visit_block(op.lhs.block, live | rhs)
+        if isinstance(op, While):
+            return self.visit_loop(op, live)
+        if isinstance(op, For):
+            return self.visit_loop(op, live)
+        if op.regions:
+            # keep every variable loaded by operations we know nothing about
+            return live | set(
+                inner.memloc for inner in op.walk() if isinstance(inner, Load)
+            )
+        return live
+
+    def loop_entry(self, loop: Operation, live: Live, entry: Live) -> Live:
+        """The variables live at the start of an iteration, given those at the next."""
+        if isinstance(loop, While):
+            body = self.visit_block(loop.body.block, entry)
+            return self.visit_block(loop.cond.block, live | body)
+        assert isinstance(loop, For)
+        # the variable is assigned before each iteration, which may not happen at all
+        body = self.visit_block(loop.body.block, entry)
+        return live | (body - {loop.iter_})
+
+    def visit_loop(self, loop: Operation, live: Live) -> Live:
+        erase = self.erase
+        self.erase = False
+        entry: Live = set()
+        while True:
+            next_entry = self.loop_entry(loop, live, entry)
+            if next_entry == entry:
                 break
-                
-        if store_not_loaded and store_found:
-            # raise Exception(store)
-            rewriter.erase_op(store)
+            entry = next_entry
+        self.erase = erase
+        return self.loop_entry(loop, live, entry)
 
 
 class ChocoUnusedStoreElimination(ModulePass):
+    """
+    Remove the stores to local variables that are overwritten, or that the function
+    returns, before the variable is loaded again.
+    """
+
     name = "choco-unused-store-elimination"
 
     def apply(self, ctx: MLContext, op: ModuleOp) -> None:
-
-        walker = PatternRewriteWalker(
-            GreedyRewritePatternApplier(
-                [
-                    StoreRewriter(),
-                ]
-            ),
-            walk_reverse=True
-        )
-
-        walker.rewrite_module(op)
-
+        elimination = UnusedStoreElimination(local_variables(op))
+        funcs = [func for func in op.walk() if isinstance(func, FuncDef)]
+        for func in funcs:
+            elimination.visit_block(func.func_body.block, set())
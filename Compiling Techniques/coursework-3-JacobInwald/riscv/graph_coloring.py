@@ -0,0 +1,234 @@
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from xdsl.dialects.builtin import IntegerAttr
+from xdsl.ir import SSAValue
+
+import riscv.ssa_dialect as riscvssa
+from riscv.linear_scan import (
+    CALLEE_SAVED_REGISTERS,
+    CALLER_SAVED_REGISTERS,
+    Allocation,
+)
+from riscv.liveness import BRANCH_OPS, Liveness, label_of, op_defs
+
+REGISTERS = CALLER_SAVED_REGISTERS + CALLEE_SAVED_REGISTERS
+
+
+def is_immediate(value: SSAValue) -> bool:
+    """Whether a value is an integer constant, which can be loaded again anywhere."""
+    op = value.owner
+    return isinstance(op, riscvssa.LIOp) and isinstance(op.immediate, IntegerAttr)
+
+
+@dataclass
+class GraphColoring:
+    """
+    Graph-colouring register allocation in the style of Chaitin and Briggs.
+
+    Two values interfere when one is defined while the other is live. Copies between
+    values that do not interfere are coalesced when this keeps the graph colourable
+    (the Briggs test), so that both get the same register and the copy disappears.
+    The graph is then simplified by removing the nodes of degree lower than the number
+    of registers, and nodes with the lowest spill cost when there are none. The nodes
+    are coloured in the reverse order, optimistically, and those that cannot be
+    coloured are spilled. Spilled constants are loaded again where they are used
+    rather than kept on the stack.
+
+    The nodes of the graph are numbered in program order, so that the allocation
+    does not depend on the hash of the values.
+    """
+
+    liveness: Liveness
+    is_main: bool = False
+    spill: Set[SSAValue] = field(default_factory=set)
+    """Values that must be kept on the stack."""
+
+    values: List[SSAValue] = field(init=False)
+    index: Dict[SSAValue, int] = field(init=False)
+    adjacent: Dict[int, Set[int]] = field(init=False)
+    moves: List[Tuple[int, int]] = field(init=False)
+    cost: Dict[int, float] = field(init=False)
+    crosses_call: Set[int] = field(init=False)
+    alias: Dict[int, int] = field(init=False)
+
+    def find(self, node: int) -> int:
+        while node in self.alias:
+            node = self.alias[node]
+        return node
+
+    def add_edge(self, a: int, b: int):
+        if a != b:
+            self.adjacent[a].add(b)
+            self.adjacent[b].add(a)
+
+    def loop_depths(self) -> List[int]:
+        """The number of loops around each operation, from the backward jumps."""
+        labels = {
+            op.label.data: idx
+            for idx, op in enumerate(self.liveness.ops)
+            if isinstance(op, riscvssa.LabelOp)
+        }
+        delta = [0] * (len(self.liveness.ops) + 1)
+        for idx, op in enumerate(self.liveness.ops):
+            if isinstance(op, BRANCH_OPS + (riscvssa.JOp,)):
+                label = label_of(op)
+                target = None if label is None else labels.get(label)
+                if target is not None and target < idx:
+                    delta[target] += 1
+                    delta[idx + 1] -= 1
+        depths, depth = [], 0
+        for change in delta[:-1]:
+            depth += change
+            depths.append(depth)
+        return depths
+
+    def build(self):
+        self.values = [value for value in self.liveness.intervals]
+        self.index = {value: idx for idx, value in enumerate(self.values)}
+        self.adjacent = {
+            idx: set()
+            for idx, value in enumerate(self.values)
+            if value not in self.spill
+        }
+        self.moves = []
+        self.cost = {idx: 0.0 for idx in self.adjacent}
+        self.crosses_call = set()
+        self.alias = {}
+
+        def nodes(values) -> List[int]:
+            return [
+                self.index[value]
+                for value in values
+                if self.index.get(value) in self.adjacent
+            ]
+
+        # the arguments are all defined on entry
+        entry = nodes(self.liveness.blocks[0].live_in) if self.liveness.blocks else []
+        for a in entry:
+            for b in entry:
+                self.add_edge(a, b)
+
+        depths = self.loop_depths()
+        for idx, op, live in self.liveness.walk_backward():
+            live_nodes = nodes(live)
+            defs = nodes(op_defs(op))
+            copied = []
+            if isinstance(op, riscvssa.AssignOp):
+                copied = nodes([op.rs])
+                if defs and copied:
+                    self.moves.append((defs[0], copied[0]))
+            for node in defs:
+                for other in live_nodes:
+                    if other not in copied:
+                        self.add_edge(node, other)
+            if idx in self.liveness.live_across:
+                self.crosses_call.update(nodes(self.liveness.live_across[idx]))
+            for node in defs + nodes(op.operands):
+                self.cost[node] += 10 ** min(depths[idx], 4)
+
+    def briggs(self, a: int, b: int) -> bool:
+        """Whether merging two nodes leaves fewer than K neighbours of degree K."""
+        neighbours = self.adjacent[a] | self.adjacent[b]
+        significant = [
+            node for node in neighbours if len(self.adjacent[node]) >= len(REGISTERS)
+        ]
+        return len(significant) < len(REGISTERS)
+
+    def merge(self, a: int, b: int):
+        for node in self.adjacent.pop(b):
+            self.adjacent[node].discard(b)
+            self.add_edge(a, node)
+        self.alias[b] = a
+        self.cost[a] += self.cost.pop(b)
+        if b in self.crosses_call:
+            self.crosses_call.add(a)
+
+    def coalesce(self):
+        changed = True
+        while changed:
+            changed = False
+            for rd, rs in self.moves:
+                a, b = self.find(rd), self.find(rs)
+                if a == b or b in self.adjacent[a] or not self.briggs(a, b):
+                    continue
+                self.merge(a, b)
+                changed = True
+
+    def simplify(self) -> List[int]:
+        """The order in which the nodes are removed from the graph."""
+        degree = {node: len(adjacent) for node, adjacent in self.adjacent.items()}
+        remaining = dict.fromkeys(sorted(self.adjacent))
+        low = [node for node in remaining if degree[node] < len(REGISTERS)]
+        stack: List[int] = []
+        while remaining:
+            if low:
+                node = low.pop()
+                if node not in remaining:
+                    continue
+            else:
+                # a potential spill: the node that is cheapest to keep in memory
+                node = min(
+                    remaining,
+                    key=lambda node: self.cost[node]
+                    / max(degree[node], 1)
+                    * (0.5 if is_immediate(self.values[node]) else 1),
+                )
+            del remaining[node]
+            stack.append(node)
+            for other in self.adjacent[node]:
+                if other in remaining:
+                    degree[other] -= 1
+                    if degree[other] == len(REGISTERS) - 1:
+                        low.append(other)
+        return stack
+
+    def preferences(self, node: int) -> List[str]:
+        if self.is_main or node in self.crosses_call:
+            return CALLEE_SAVED_REGISTERS + CALLER_SAVED_REGISTERS
+        return REGISTERS
+
+    def select(self, stack: List[int]) -> Dict[int, str]:
+        partners: Dict[int, List[int]] = {}
+        for rd, rs in self.moves:
+            a, b = self.find(rd), self.find(rs)
+            if a != b:
+                partners.setdefault(a, []).append(b)
+                partners.setdefault(b, []).append(a)
+
+        colors: Dict[int, str] = {}
+        for node in reversed(stack):
+            used = set(
+                colors[other] for other in self.adjacent[node] if other in colors
+            )
+            # prefer the register of a copy that could not be coalesced
+            biased = [
+                colors[partner]
+                for partner in partners.get(node, [])
+                if partner in colors
+            ]
+            for reg in biased + self.preferences(node):
+                if reg not in used:
+                    colors[node] = reg
+                    break
+        return colors
+
+    def allocate(self) -> Allocation:
+        self.build()
+        self.coalesce()
+        colors = self.select(self.simplify())
+
+        allocation = Allocation()
+        for idx, value in enumerate(self.values):
+            node = self.find(idx)
+            if node in colors:
+                allocation.registers[value] = colors[node]
+            elif is_immediate(value):
+                allocation.rematerialized.add(value)
+            else:
+                allocation.spilled.append(value)
+        allocation.add_call_saves(self.liveness)
+        return allocation
@@ -0,0 +1,123 @@
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from xdsl.ir import Operation, SSAValue
+
+from riscv.liveness import LiveInterval, Liveness
+
+# t0, t1 and t2 are kept free to load spilled values and to break cycles of moves.
+SCRATCH_REGISTERS = ["t0", "t1", "t2"]
+CALLER_SAVED_REGISTERS = [
+    "t3",
+    "t4",
+    "t5",
+    "t6",
+    "a7",
+    "a6",
+    "a5",
+    "a4",
+    "a3",
+    "a2",
+    "a1",
+    "a0",
+]
+CALLEE_SAVED_REGISTERS = [f"s{idx}" for idx in range(1, 12)]
+
+
+@dataclass
+class Allocation:
+    """The location of the values of a function after register allocation."""
+
+    registers: Dict[SSAValue, str] = field(default_factory=dict)
+    """The register holding each value that is not spilled."""
+    spilled: List[SSAValue] = field(default_factory=list)
+    """The values that live in a stack slot."""
+    rematerialized: Set[SSAValue] = field(default_factory=set)
+    """The constants that are loaded again where they are used."""
+    call_saves: Dict[Operation, List[SSAValue]] = field(default_factory=dict)
+    """The values in caller-saved registers that are live across each call."""
+
+    def used_callee_saved(self) -> List[str]:
+        used = set(self.registers.values())
+        return [reg for reg in CALLEE_SAVED_REGISTERS if reg in used]
+
+    def add_call_saves(self, liveness: Liveness):
+        for position, live in liveness.live_across.items():
+            # visit the values in program order, so that the output is deterministic
+            saved = [
+                value
+                for value in liveness.intervals
+                if value in live and self.registers.get(value) in CALLER_SAVED_REGISTERS
+            ]
+            if saved:
+                self.call_saves[liveness.ops[position]] = saved
+
+
+@dataclass
+class LinearScan:
+    """
+    Linear-scan register allocation (Poletto & Sarkar): the live intervals are
+    visited by increasing start, and each gets a register that is free for its whole
+    interval. When none is free, the interval that ends last is spilled.
+
+    Intervals that cross a call prefer callee-saved registers, which need no save
+    around the call. Main is never returned to, so it prefers them everywhere.
+    """
+
+    liveness: Liveness
+    is_main: bool = False
+    spill: Set[SSAValue] = field(default_factory=set)
+    """Values that must be kept on the stack."""
+
+    def preferences(self, interval: LiveInterval) -> List[str]:
+        calls = self.liveness.calls
+        idx = bisect_right(calls, interval.start)
+        crosses_call = idx < len(calls) and calls[idx] < interval.end
+        if self.is_main or crosses_call:
+            return CALLEE_SAVED_REGISTERS + CALLER_SAVED_REGISTERS
+        return CALLER_SAVED_REGISTERS + CALLEE_SAVED_REGISTERS
+
+    def allocate(self) -> Allocation:
+        allocation = Allocation()
+        intervals = sorted(
+            self.liveness.intervals.values(), key=lambda interval: interval.start
+        )
+        active: List[LiveInterval] = []
+        free = set(CALLER_SAVED_REGISTERS + CALLEE_SAVED_REGISTERS)
+
+        for interval in intervals:
+            if interval.value in self.spill:
+                allocation.spilled.append(interval.value)
+                continue
+
+            # Free the registers of the intervals that ended
+            for other in list(active):
+                if other.end < interval.start:
+                    active.remove(other)
+                    free.add(allocation.registers[other.value])
+
+            reg = next((reg for reg in self.preferences(interval) if reg in free), None)
+            if reg is not None:
+                free.remove(reg)
+                allocation.registers[interval.value] = reg
+                active.append(interval)
+                continue
+
+            # Spill the interval that is live the furthest
+            victim = max(active, key=lambda other: other.end)
+            if victim.end <= interval.end:
+                allocation.spilled.append(interval.value)
+                continue
+            allocation.registers[interval.value] = allocation.registers.pop(
+                victim.value
+            )
+            allocation.spilled.append(victim.value)
+            active.remove(victim)
+            active.append(interval)
+
+        allocation.add_call_saves(self.liveness)
+        return allocation
@@ -0,0 +1,196 @@
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+from xdsl.ir import Block, BlockArgument, Operation, SSAValue
+
+import riscv.dialect as riscv
+import riscv.ssa_dialect as riscvssa
+
+BRANCH_OPS = (
+    riscvssa.BEQOp,
+    riscvssa.BNEOp,
+    riscvssa.BLTOp,
+    riscvssa.BGEOp,
+    riscvssa.BLTUOp,
+    riscvssa.BGEUOp,
+)
+
+
+def op_defs(op: Operation) -> Sequence[SSAValue]:
+    """The values an operation writes."""
+    if isinstance(op, riscvssa.AssignOp):
+        return [op.rd]
+    return op.results
+
+
+def op_uses(op: Operation) -> Sequence[SSAValue]:
+    """The values an operation reads."""
+    if isinstance(op, riscvssa.AssignOp):
+        return [op.rs]
+    return op.operands
+
+
+def label_of(op: Operation) -> str | None:
+    """The label a jump or branch goes to, if it is a label."""
+    offset = getattr(op, "offset", None)
+    if isinstance(offset, riscv.LabelAttr):
+        return offset.data
+    return None
+
+
+@dataclass
+class LiveInterval:
+    """
+    The range of positions in which a value is live, from its first definition to
+    its last use, including the gaps where it is not.
+    """
+
+    value: SSAValue
+    start: int
+    end: int
+
+
+@dataclass
+class BasicBlock:
+    start: int
+    end: int
+    successors: List[int] = field(default_factory=list)
+    gen: Set[SSAValue] = field(default_factory=set)
+    kill: Set[SSAValue] = field(default_factory=set)
+    live_in: Set[SSAValue] = field(default_factory=set)
+    live_out: Set[SSAValue] = field(default_factory=set)
+
+
+@dataclass
+class Liveness:
+    """
+    Liveness of the values of a riscv_ssa function, whose body is a single block with
+    explicit labels, branches and jumps. The operations are numbered in order, and
+    the arguments of the function are defined at position -1.
+    """
+
+    body: Block
+    ops: List[Operation] = field(init=False)
+    blocks: List[BasicBlock] = field(init=False)
+    intervals: Dict[SSAValue, LiveInterval] = field(init=False)
+    calls: List[int] = field(init=False)
+    """The positions of the operations that clobber the caller-saved registers."""
+    live_across: Dict[int, Set[SSAValue]] = field(init=False)
+    """The values that are live across each of these operations."""
+
+    def __post_init__(self):
+        # functions nested in main are allocated separately
+        self.ops = [op for op in self.body.ops if not isinstance(op, riscvssa.FuncOp)]
+        self.calls = [
+            idx
+            for idx, op in enumerate(self.ops)
+            if isinstance(op, (riscvssa.CallOp, riscvssa.ECALLOp))
+        ]
+        self.build_blocks()
+        self.solve()
+        self.build_intervals()
+
+        self.live_across = {}
+        for idx, op, live in self.walk_backward():
+            if isinstance(op, (riscvssa.CallOp, riscvssa.ECALLOp)):
+                self.live_across[idx] = live - set(op_defs(op))
+
+    def is_local(self, value: SSAValue) -> bool:
+        """Whether the value is defined in this function rather than in main."""
+        if isinstance(value, BlockArgument):
+            return value.block is self.body
+        return value.owner.parent_block() is self.body
+
+    def build_blocks(self):
+        leaders = {0}
+        for idx, op in enumerate(self.ops):
+            if isinstance(op, riscvssa.LabelOp):
+                leaders.add(idx)
+            if isinstance(op, BRANCH_OPS + (riscvssa.JOp, riscvssa.ReturnOp)):
+                leaders.add(idx + 1)
+        starts = sorted(leader for leader in leaders if leader < len(self.ops))
+        self.blocks = [
+            BasicBlock(start, end - 1)
+            for start, end in zip(starts, starts[1:] + [len(self.ops)])
+        ]
+
+        label_block: Dict[str, int] = {}
+        for idx, block in enumerate(self.blocks):
+            first = self.ops[block.start]
+            if isinstance(first, riscvssa.LabelOp):
+                label_block[first.label.data] = idx
+
+        for idx, block in enumerate(self.blocks):
+            last = self.ops[block.end]
+            # jumps to labels outside of the function are to error handlers, which
+            # do not return
+            if isinstance(last, (riscvssa.JOp,) + BRANCH_OPS):
+                target = label_of(last)
+                if target in label_block:
+                    block.successors.append(label_block[target])
+            if isinstance(last, (riscvssa.JOp, riscvssa.ReturnOp)):
+                continue
+            if idx + 1 < len(self.blocks):
+                block.successors.append(idx + 1)
+
+        for block in self.blocks:
+            for op in self.ops[block.start : block.end + 1]:
+                for value in op_uses(op):
+                    if value not in block.kill and self.is_local(value):
+                        block.gen.add(value)
+                block.kill.update(op_defs(op))
+
+    def solve(self):
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.blocks):
+                live_out = set()
+                for successor in block.successors:
+                    live_out |= self.blocks[successor].live_in
+                live_in = block.gen | (live_out - block.kill)
+                if live_out != block.live_out or live_in != block.live_in:
+                    block.live_out = live_out
+                    block.live_in = live_in
+                    changed = True
+
+    def walk_backward(self) -> Iterator[Tuple[int, Operation, Set[SSAValue]]]:
+        """
+        Visit the operations of each basic block backwards, with the values that are
+        live right after each of them. The set is updated in place during the walk.
+        """
+        for block in self.blocks:
+            live = set(block.live_out)
+            for idx in range(block.end, block.start - 1, -1):
+                op = self.ops[idx]
+                yield idx, op, live
+                live.difference_update(op_defs(op))
+                live.update(value for value in op_uses(op) if self.is_local(value))
+
+    def build_intervals(self):
+        self.intervals = {}
+
+        def extend(value: SSAValue, position: int):
+            interval = self.intervals.get(value)
+            if interval is None:
+                self.intervals[value] = LiveInterval(value, position, position)
+            else:
+                interval.start = min(interval.start, position)
+                interval.end = max(interval.end, position)
+
+        for arg in self.body.args:
+            extend(arg, -1)
+        for idx, op in enumerate(self.ops):
+            for value in op_defs(op):
+                extend(value, idx)
+            for value in op_uses(op):
+                if self.is_local(value):
+                    extend(value, idx)
+        for block in self.blocks:
+            for value in block.live_in:
+                extend(value, block.start)
+            for value in block.live_out:
+                extend(value, block.end)
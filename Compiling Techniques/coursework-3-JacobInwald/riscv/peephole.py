@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+from xdsl.dialects.builtin import IntegerAttr, ModuleOp
+from xdsl.ir import Block, MLContext, Operation
+from xdsl.passes import ModulePass
+
+import riscv.dialect as riscv
+
+CONDITIONAL_BRANCHES = (
+    riscv.Riscv2Rs1OffOperation,
+    riscv.Riscv1Rs1OffOperation,
+    riscv.Riscv1Rs1Rt1OffOperation,
+)
+ARGUMENT_REGISTERS = set(f"a{idx}" for idx in range(8))
+# The registers a caller does not expect to keep their value across a call, apart
+# from the return value in a0.
+TEMPORARY_REGISTERS = set(f"t{idx}" for idx in range(7)) | ARGUMENT_REGISTERS - {"a0"}
+# The registers that hold the stack, the globals of main and the return address.
+RESERVED_REGISTERS = {"zero", "ra", "sp", "gp", "tp"}
+# The operations that only write their destination register.
+PURE_OPERATIONS = (
+    riscv.Riscv1Rd2RsOperation,
+    riscv.Riscv1Rd1Rs1ImmOperation,
+    riscv.Riscv1Rd1ImmOperation,
+    riscv.Riscv1Rd1RsOperation,
+)
+# How many operations `Window.is_dead` looks at before it gives up.
+DEAD_SEARCH_LIMIT = 256
+
+
+def register(op: Operation, name: str) -> Optional[str]:
+    attr = op.properties.get(name)
+    if isinstance(attr, riscv.RegisterAttr):
+        return attr.get_abi_name()
+    return None
+
+
+def reads(op: Operation) -> Set[str]:
+    regs: Set[str] = set()
+    for name in ("rs1", "rs2", "rs", "rt"):
+        reg = register(op, name)
+        if reg is not None:
+            regs.add(reg)
+    if isinstance(op, (riscv.ECALLOp, riscv.JALOp)):
+        regs |= ARGUMENT_REGISTERS
+    return regs
+
+
+def writes(op: Operation) -> Set[str]:
+    reg = register(op, "rd")
+    return set() if reg is None else {reg}
+
+
+def immediate(op: Operation) -> Optional[int]:
+    attr = op.properties.get("immediate")
+    if isinstance(attr, IntegerAttr):
+        return attr.value.data
+    return None
+
+
+def fits_immediate(value: int) -> bool:
+    return -(2**11) <= value < 2**11
+
+
+@dataclass
+class Window:
+    """
+    The operations of a block without the comments, in which the patterns look for
+    consecutive operations.
+    """
+
+    block: Block
+    ops: List[Operation] = field(init=False)
+    labels: Dict[str, int] = field(init=False)
+
+    def __post_init__(self):
+        self.ops = [op for op in self.block.ops if not isinstance(op, riscv.CommentOp)]
+        self.index_labels()
+
+    def index_labels(self):
+        self.labels = {}
+        for idx, op in enumerate(self.ops):
+            if isinstance(op, riscv.LabelOp):
+                self.labels.setdefault(op.label.data, idx)
+
+    def replace(self, start: int, size: int, new_ops: List[Operation]):
+        old_ops = self.ops[start : start + size]
+        anchor = old_ops[-1].next_op
+        for op in old_ops:
+            # the patterns may keep some of the operations they match
+            op.detach()
+        if anchor is None:
+            self.block.add_ops(new_ops)
+        else:
+            self.block.insert_ops_before(new_ops, anchor)
+        for op in old_ops:
+            if op not in new_ops:
+                op.erase()
+        self.ops[start : start + size] = new_ops
+        self.index_labels()
+
+    def exits(self, idx: int) -> bool:
+        """Whether the operation at `idx` is the system call that ends the program."""
+        if not isinstance(self.ops[idx], riscv.ECALLOp) or idx == 0:
+            return False
+        previous = self.ops[idx - 1]
+        return (
+            isinstance(previous, riscv.LIOp)
+            and register(previous, "rd") == "a7"
+            and immediate(previous) == 93
+        )
+
+    def is_dead(self, start: int, reg: str) -> bool:
+        """
+        Whether the register is written before it is read on every path starting at
+        the operation `start`. Called functions only read their arguments, and their
+        callers only read a0 and the callee-saved registers after they return. Long
+        searches are cut short, and the register is then assumed to be live.
+        """
+        worklist = [start]
+        visited: Set[int] = set()
+        while worklist:
+            idx = worklist.pop()
+            if idx in visited:
+                continue
+            visited.add(idx)
+            if idx >= len(self.ops) or len(visited) > DEAD_SEARCH_LIMIT:
+                return False
+            op = self.ops[idx]
+            if reg in reads(op):
+                return False
+            if isinstance(op, riscv.RETOp):
+                if reg not in TEMPORARY_REGISTERS:
+                    return False
+                continue
+            if isinstance(op, riscv.JALROp):
+                return False
+            if self.exits(idx):
+                continue
+            if reg in writes(op):
+                continue
+            if isinstance(op, (riscv.JOp,) + CONDITIONAL_BRANCHES):
+                label = op.offset
+                if not isinstance(label, riscv.LabelAttr):
+                    return False
+                target = self.labels.get(label.data)
+                if target is None:
+                    return False
+                worklist.append(target)
+                if isinstance(op, riscv.JOp):
+                    continue
+            worklist.append(idx + 1)
+        return True
+
+
+# A pattern gets the window and the position of its first operation, and returns
+# the operations that replace its `size` operations, or None if it does not apply.
+PatternFunction = Callable[[Window, int], Optional[List[Operation]]]
+
+
+@dataclass(frozen=True)
+class PeepholePattern:
+    name: str
+    size: int
+    rewrite: PatternFunction
+
+
+def store_load(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`sw a, k(b)` then `lw c, k(b)` loads back the value of `a`."""
+    store, load = window.ops[idx : idx + 2]
+    if not isinstance(store, riscv.SWOp) or not isinstance(load, riscv.LWOp):
+        return None
+    if register(store, "rs2") != register(load, "rs1"):
+        return None
+    if immediate(store) != immediate(load):
+        return None
+    value, target = register(store, "rs1"), register(load, "rd")
+    if value == target:
+        return [store]
+    return [store, riscv.MVOp(target, value)]
+
+
+def add_immediates(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`addi r, r, x` then `addi r, r, y` is `addi r, r, x + y`."""
+    first, second = window.ops[idx : idx + 2]
+    if not isinstance(first, riscv.AddIOp) or not isinstance(second, riscv.AddIOp):
+        return None
+    reg = register(first, "rd")
+    if not (
+        register(first, "rs1") == reg
+        and register(second, "rd") == reg
+        and register(second, "rs1") == reg
+    ):
+        return None
+    first_value, second_value = immediate(first), immediate(second)
+    if reg is None or first_value is None or second_value is None:
+        return None
+    total = first_value + second_value
+    if total == 0:
+        return []
+    if not fits_immediate(total):
+        return None
+    return [riscv.AddIOp(reg, reg, total, first.comment and first.comment.data)]
+
+
+def immediate_operand(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`li t, k` then `add d, s, t` is `addi d, s, k` when `t` is not used after."""
+    load, op = window.ops[idx : idx + 2]
+    if not isinstance(load, riscv.LIOp) or not isinstance(
+        op, (riscv.AddOp, riscv.SubOp)
+    ):
+        return None
+    temp, value = register(load, "rd"), immediate(load)
+    if temp is None or value is None:
+        return None
+    lhs, rhs = register(op, "rs1"), register(op, "rs2")
+    if isinstance(op, riscv.SubOp):
+        if rhs != temp or lhs == temp:
+            return None
+        value = -value
+        source = lhs
+    elif rhs == temp and lhs != temp:
+        source = lhs
+    elif lhs == temp and rhs != temp:
+        source = rhs
+    else:
+        return None
+    if not fits_immediate(value):
+        return None
+    target = register(op, "rd")
+    if target != temp and not window.is_dead(idx + 2, temp):
+        return None
+    return [riscv.AddIOp(target, source, value)]
+
+
+def address_offset(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`addi t, b, k` then `lw d, x(t)` is `lw d, x + k(b)` when `t` is not used after."""
+    address, access = window.ops[idx : idx + 2]
+    if not isinstance(address, riscv.AddIOp) or not isinstance(
+        access, (riscv.LWOp, riscv.SWOp)
+    ):
+        return None
+    temp, base = register(address, "rd"), register(address, "rs1")
+    address_value, access_value = immediate(address), immediate(access)
+    if temp is None or address_value is None or access_value is None:
+        return None
+    offset = address_value + access_value
+    if not fits_immediate(offset):
+        return None
+    comment = access.comment and access.comment.data
+    if isinstance(access, riscv.LWOp):
+        target = register(access, "rd")
+        if register(access, "rs1") != temp:
+            return None
+        if target != temp and not window.is_dead(idx + 2, temp):
+            return None
+        return [riscv.LWOp(target, base, offset, comment)]
+    value = register(access, "rs1")
+    if register(access, "rs2") != temp or value == temp:
+        return None
+    if not window.is_dead(idx + 2, temp):
+        return None
+    return [riscv.SWOp(value, base, offset, comment)]
+
+
+def move_back(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`mv a, b` then `mv b, a` leaves `b` unchanged."""
+    first, second = window.ops[idx : idx + 2]
+    if not isinstance(first, riscv.MVOp) or not isinstance(second, riscv.MVOp):
+        return None
+    if register(first, "rd") != register(second, "rs") or register(
+        first, "rs"
+    ) != register(second, "rd"):
+        return None
+    return [first]
+
+
+def forward_move(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`op t, ...` then `mv d, t` is `op d, ...` when `t` is not used after."""
+    op, move = window.ops[idx : idx + 2]
+    if not isinstance(op, PURE_OPERATIONS) or not isinstance(move, riscv.MVOp):
+        return None
+    temp, target = register(op, "rd"), register(move, "rd")
+    if temp is None or target is None:
+        return None
+    if register(move, "rs") != temp or target == temp:
+        return None
+    if temp in RESERVED_REGISTERS or target in RESERVED_REGISTERS:
+        return None
+    if not window.is_dead(idx + 2, temp):
+        return None
+    op.properties["rd"] = riscv.RegisterAttr.from_name(target)
+    return [op]
+
+
+def dead_write(window: Window, idx: int) -> Optional[List[Operation]]:
+    """An operation whose result is overwritten before it is read does nothing."""
+    op = window.ops[idx]
+    if not isinstance(op, PURE_OPERATIONS):
+        return None
+    target = register(op, "rd")
+    if target is None or target in RESERVED_REGISTERS:
+        return None
+    if not window.is_dead(idx + 1, target):
+        return None
+    return []
+
+
+def jump_to_next(window: Window, idx: int) -> Optional[List[Operation]]:
+    """A jump to a label that directly follows it does nothing."""
+    jump = window.ops[idx]
+    if not isinstance(jump, riscv.JOp) or not isinstance(jump.offset, riscv.LabelAttr):
+        return None
+    for op in window.ops[idx + 1 :]:
+        if not isinstance(op, riscv.LabelOp):
+            return None
+        if op.label.data == jump.offset.data:
+            return []
+    return None
+
+
+def self_move(window: Window, idx: int) -> Optional[List[Operation]]:
+    """`mv r, r` does nothing."""
+    op = window.ops[idx]
+    if isinstance(op, riscv.MVOp) and register(op, "rd") == register(op, "rs"):
+        return []
+    return None
+
+
+PEEPHOLE_PATTERNS: List[PeepholePattern] = [
+    PeepholePattern("store-load", 2, store_load),
+    PeepholePattern("add-immediates", 2, add_immediates),
+    PeepholePattern("immediate-operand", 2, immediate_operand),
+    PeepholePattern("address-offset", 2, address_offset),
+    PeepholePattern("move-back", 2, move_back),
+    PeepholePattern("forward-move", 2, forward_move),
+    PeepholePattern("jump-to-next", 1, jump_to_next),
+    PeepholePattern("self-move", 1, self_move),
+    PeepholePattern("dead-write", 1, dead_write),
+]
+
+
+def optimize_block(block: Block, patterns: List[PeepholePattern]):
+    """
+    Slide a window over the operations of a block, and apply the first pattern that
+    matches. After a rewrite, the window steps back so that the new operations can
+    be matched with the previous ones.
+    """
+    window = Window(block)
+    longest = max(pattern.size for pattern in patterns)
+    idx = 0
+    while idx < len(window.ops):
+        for pattern in patterns:
+            if idx + pattern.size > len(window.ops):
+                continue
+            new_ops = pattern.rewrite(window, idx)
+            if new_ops is not None:
+                window.replace(idx, pattern.size, new_ops)
+                idx = max(idx - longest + 1, 0)
+                break
+        else:
+            idx += 1
+
+
+class RISCVPeephole(ModulePass):
+    """
+    Remove and merge redundant sequences of riscv operations, as described by
+    `PEEPHOLE_PATTERNS`.
+    """
+
+    name = "riscv-peephole"
+
+    def apply(self, ctx: MLContext, op: ModuleOp) -> None:
+        blocks = [
+            block
+            for region_op in op.walk()
+            for region in region_op.regions
+            for block in region.blocks
+        ]
+        for block in blocks:
+            optimize_block(block, PEEPHOLE_PATTERNS)
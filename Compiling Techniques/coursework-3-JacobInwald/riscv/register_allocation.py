@@ -1,10 +1,8 @@
 # type: ignore
 
-from __future__ import annotations
-
 from dataclasses import dataclass, field
 from io import StringIO
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from xdsl.dialects.builtin import ModuleOp
 from xdsl.ir import MLContext, Operation, SSAValue
@@ -19,33 +17,39 @@ from xdsl.printer import Printer
 
 import riscv.dialect as riscv
 import riscv.ssa_dialect as riscvssa
-from choco.dialects.choco_flat import FuncDef
-from riscv.dialect import Register, RegisterAttr
+from riscv.dialect import RegisterAttr
+from riscv.graph_coloring import GraphColoring, is_immediate
+from riscv.linear_scan import Allocation, LinearScan
+from riscv.liveness import Liveness
+
+
+def rematerializable(value: SSAValue) -> bool:
+    """
+    Whether a value of main can be recomputed where it is used instead of being read
+    from the stack of main.
+    """
+    return is_immediate(value) or isinstance(value.owner, riscvssa.AllocOp)
+
+
+ALLOCATORS = {
+    "linear-scan": LinearScan,
+    "graph-coloring": GraphColoring,
+}
 
 
 def allocate_registers(
-    func: FuncDef,
-) -> Tuple[int, Dict[SSAValue, int], int, Dict[Operation, int]]:
+    func: riscvssa.FuncOp,
+    allocator: str = "linear-scan",
+    is_main: bool = False,
+    spill: Set[SSAValue] = set(),
+) -> Allocation:
     """
-    Allocate each infinite register to a place in the stack.
-    returns the number of register spilled, and the position of
-    each infinite register on the stack.
+    Allocate the infinite registers of a function to the physical registers, and to
+    the stack when there are not enough of them. `spill` are the values that must be
+    kept on the stack.
     """
-    spilled_reg = 0
-    stack_vars = 0
-    stack_pos = dict()
-    alloc_to_stack_var = dict()
-    for arg in func.func_body.blocks[0].args:
-        stack_pos[arg] = spilled_reg
-        spilled_reg += 1
-    for op in func.func_body.ops:
-        for result in op.results:
-            stack_pos[result] = spilled_reg
-            spilled_reg += 1
-        if isinstance(op, riscvssa.AllocOp):
-            alloc_to_stack_var[op] = stack_vars
-            stack_vars += 1
-    return spilled_reg, stack_pos, stack_vars, alloc_to_stack_var
+    liveness = Liveness(func.func_body.blocks[0])
+    return ALLOCATORS[allocator](liveness, is_main, spill).allocate()
 
 
 @dataclass(eq=False)
@@ -53,79 +57,117 @@ class RiscvToRiscvSSAPattern(RewritePattern):
     """
     Rewrite a single RISCV_SSA operation into a RISCV operation, given
     the allocation of registers.
+
+    The stack frame of a function holds, from the stack pointer upwards, the slots of
+    the spilled values and of the caller-saved registers saved around calls, the
+    stack-allocated memory, the callee-saved registers the function uses, and the
+    return address.
     """
 
     ctx: MLContext
-    func: FuncDef
-    stack_pos: Dict[SSAValue, int]
-    alloc_to_stack_var: Dict[SSAValue, int]
-    """Position of the variables on the stack."""
+    func: riscvssa.FuncOp
+    allocation: Allocation
     printer: Printer
     output: StringIO
-    global_stack_pos: Optional[Dict[SSAValue, int]] = field(default=None)
+    global_pattern: Optional["RiscvToRiscvSSAPattern"] = field(default=None)
+    """The pattern of main, whose values are also used by the functions."""
+
+    slots: Dict[SSAValue, int] = field(init=False)
+    stack_vars: Dict[Operation, int] = field(init=False)
+    callee_saved: List[str] = field(init=False)
+    saves_ra: bool = field(init=False)
+    frame_size: int = field(init=False)
+    unused: Set[SSAValue] = field(init=False)
+    """The results that are never read, recorded before the uses are rewritten."""
+
+    def __post_init__(self):
+        self.unused = set(
+            result
+            for op in self.func.func_body.ops
+            for result in op.results
+            if not result.uses
+        )
+        self.slots = {}
+        for value in self.allocation.spilled:
+            self.slots[value] = len(self.slots)
+        for saved in self.allocation.call_saves.values():
+            for value in saved:
+                self.slots.setdefault(value, len(self.slots))
+
+        self.stack_vars = {}
+        for op in self.func.func_body.ops:
+            if isinstance(op, riscvssa.AllocOp):
+                self.stack_vars[op] = len(self.slots) + len(self.stack_vars)
+
+        # main does not return, so it does not need to restore the registers
+        self.callee_saved = (
+            [] if self.global_pattern is None else self.allocation.used_callee_saved()
+        )
+        self.saves_ra = any(
+            isinstance(op, riscvssa.CallOp) for op in self.func.func_body.ops
+        )
+        self.frame_size = (
+            len(self.slots)
+            + len(self.stack_vars)
+            + len(self.callee_saved)
+            + self.saves_ra
+        )
 
-    def add_stack_allocation(
-        self, func: riscvssa.FuncOp, spilled_reg: int, stack_vars: int, is_main=False
-    ):
+    @staticmethod
+    def stack_offset(word: int) -> int:
+        if 4 * word >= 2**11:
+            raise NotImplementedError(
+                "Register allocator is not working for more than 512 stack slots."
+            )
+        return 4 * word
+
+    def add_stack_allocation(self, func: riscvssa.FuncOp, is_main=False):
         """
         Allocate data on the stack at the beginning of the
         module, and deallocate it at the end.
         """
-        header_ops: List[Operation] = [
-            riscv.AddIOp("sp", "sp", -4, "Reserve space for ra"),
-            riscv.SWOp("ra", "sp", 0, "Store return address"),
-            riscv.AddIOp(
-                "sp",
-                "sp",
-                -4 * spilled_reg,
-                "Reserve stack space for spilled registers",
-            ),
+        frame_offset = self.stack_offset(self.frame_size)
+        saved_regs = [
+            (reg, self.stack_offset(self.frame_size - self.saves_ra - idx - 1))
+            for idx, reg in enumerate(self.callee_saved)
         ]
-        if stack_vars > 0:
+        if self.saves_ra:
+            saved_regs.append(("ra", self.stack_offset(self.frame_size - 1)))
+
+        header_ops: List[Operation] = []
+        if self.frame_size:
             header_ops.append(
-                riscv.AddIOp(
-                    "sp",
-                    "sp",
-                    -4 * stack_vars,
-                    "Reserve stack space for stack-allocated memory",
-                )
+                riscv.AddIOp("sp", "sp", -frame_offset, "Reserve stack frame")
             )
+        for reg, offset in saved_regs:
+            header_ops.append(riscv.SWOp(reg, "sp", offset, f"Save {reg}"))
         if is_main:
             header_ops.append(
                 riscv.MVOp("tp", "sp", "Move main stack pointer to special register")
             )
 
-        idx = 0
-        for arg in func.func_body.blocks[0].args:
-            header_ops += self.store_variable_from_register(
-                RegisterAttr.from_name(f"a{idx}"), arg
-            )
-            idx += 1
+        # Move the arguments from the argument registers to their location
+        moves = []
+        for idx, arg in enumerate(func.func_body.blocks[0].args):
+            if not arg.uses:
+                continue
+            if arg in self.allocation.registers:
+                moves.append((self.allocation.registers[arg], f"a{idx}"))
+            else:
+                header_ops += self.store_variable_from_register(f"a{idx}", arg)
+        header_ops += self.parallel_move(moves)
 
         footer_ops: List[Operation] = [
             riscv.CommentOp(""),
             riscv.CommentOp("Footer Ops"),
             riscv.LabelOp("_" + func.properties["func_name"].data + "_return"),
-            riscv.AddIOp(
-                "sp",
-                "sp",
-                4 * spilled_reg,
-                "Free stack space reserved for spilled registers",
-            ),
         ]
-        if stack_vars:
+        for reg, offset in saved_regs:
+            footer_ops.append(riscv.LWOp(reg, "sp", offset, f"Restore {reg}"))
+        if self.frame_size:
             footer_ops.append(
-                riscv.AddIOp(
-                    "sp",
-                    "sp",
-                    4 * stack_vars,
-                    "Free stack space reserved for stack-allocated memory",
-                )
+                riscv.AddIOp("sp", "sp", frame_offset, "Free stack frame")
             )
-        footer_ops += [
-            riscv.LWOp("ra", "sp", 0, "Store return address"),
-            riscv.AddIOp("sp", "sp", 4, "Free space for ra"),
-        ]
         block = func.regions[0].blocks[0]
         if block.first_op:
             block.insert_ops_before(header_ops, block.first_op)
@@ -136,73 +178,132 @@ class RiscvToRiscvSSAPattern(RewritePattern):
         else:
             block.add_ops(footer_ops)
 
-    def get_variable_on_register(self, val: SSAValue, reg: Register) -> List[Operation]:
-        """Place a variable on a specific register."""
-
-        # Get the variable name
+    def format_operand(self, val: SSAValue) -> str:
         full = self.output.getvalue()
         self.printer.print_operand(val)
-        formatted_op = self.output.getvalue()
-        formatted_op = formatted_op[len(full) :]
-
-        # Get its address if the variable is defined in main
-        if val not in self.stack_pos:
-            if self.global_stack_pos is None or val not in self.global_stack_pos:
-                raise Exception("Critical error in riscv variable allocator.")
-            pos = self.global_stack_pos[val]
-            if pos * 4 > 2**12:
-                raise NotImplementedError(
-                    "Register allocator is not working for more than 128 variables."
-                )
-            op = riscv.LWOp(reg, "tp", pos * 4, f"Unspill register '{formatted_op}'")
-            return [op]
+        return self.output.getvalue()[len(full) :]
 
-        pos = self.stack_pos[val]
-        if pos * 4 > 2**12:
-            raise NotImplementedError(
-                "Register allocator is not working for more than 128 variables."
+    def get_variable_on_register(self, val: SSAValue, reg: str) -> List[Operation]:
+        """Place a variable on a specific register."""
+        if val in self.allocation.registers:
+            if self.allocation.registers[val] == reg:
+                return []
+            return [riscv.MVOp(reg, self.allocation.registers[val])]
+
+        if val in self.allocation.rematerialized:
+            return [riscv.LIOp(reg, val.owner.immediate)]
+
+        if val in self.slots:
+            offset = self.stack_offset(self.slots[val])
+            return [
+                riscv.LWOp(
+                    reg,
+                    "sp",
+                    offset,
+                    f"Unspill register '{self.format_operand(val)}'",
+                )
+            ]
+
+        # The variable is defined in main
+        main = self.global_pattern
+        if main is None:
+            raise Exception("Critical error in riscv variable allocator.")
+        op = val.owner
+        if is_immediate(val):
+            return [riscv.LIOp(reg, op.immediate)]
+        if isinstance(op, riscvssa.AllocOp):
+            offset = main.stack_offset(main.stack_vars[op])
+            return [riscv.AddIOp(reg, "tp", offset, "Get ptr of main stack-slot")]
+        offset = main.stack_offset(main.slots[val])
+        return [
+            riscv.LWOp(
+                reg, "tp", offset, f"Unspill register '{self.format_operand(val)}'"
             )
+        ]
 
-        op = riscv.LWOp(reg, "sp", pos * 4, f"Unspill register '{formatted_op}'")
-        return [op]
+    def store_variable_from_register(self, reg: str, val: SSAValue) -> List[Operation]:
+        """
+        Store a variable into its place, knowing the current position of the
+        variable in the registers.
+        """
+        if val in self.allocation.registers:
+            if self.allocation.registers[val] == reg:
+                return []
+            return [riscv.MVOp(self.allocation.registers[val], reg)]
+        offset = self.stack_offset(self.slots[val])
+        return [riscv.SWOp(reg, "sp", offset, "Spill register")]
+
+    def operand_register(
+        self, val: SSAValue, scratch: str
+    ) -> Tuple[str, List[Operation]]:
+        """The register holding a variable, loading it in `scratch` if needed."""
+        if val in self.allocation.registers:
+            return self.allocation.registers[val], []
+        return scratch, self.get_variable_on_register(val, scratch)
+
+    def parallel_move(self, moves: List[Tuple[str, str]]) -> List[Operation]:
+        """
+        Copy registers into other registers at the same time, given as pairs of
+        destination and source. Cycles of moves are broken with t0.
+        """
+        pending = [(dst, src) for dst, src in moves if dst != src]
+        new_ops: List[Operation] = []
+        while pending:
+            sources = set(src for _, src in pending)
+            for idx, (dst, src) in enumerate(pending):
+                if dst not in sources:
+                    new_ops.append(riscv.MVOp(dst, src))
+                    pending.pop(idx)
+                    break
+            else:
+                dst, _ = pending[0]
+                new_ops.append(riscv.MVOp("t0", dst))
+                pending = [(d, "t0" if s == dst else s) for d, s in pending]
+        return new_ops
+
+    def move_to_registers(self, moves: List[Tuple[str, SSAValue]]) -> List[Operation]:
+        """Place variables on specific registers at the same time."""
+        register_moves = [
+            (dst, self.allocation.registers[val])
+            for dst, val in moves
+            if val in self.allocation.registers
+        ]
+        new_ops = self.parallel_move(register_moves)
+        for dst, val in moves:
+            if val not in self.allocation.registers:
+                new_ops += self.get_variable_on_register(val, dst)
+        return new_ops
 
-    def store_variable_from_register(
-        self, reg: Register, val: SSAValue
-    ) -> List[Operation]:
+    def save_registers(self, op: Operation) -> Tuple[List[Operation], List[Operation]]:
         """
-        Store a variable into its place in the stack, knowing the
-        current position of the variable in the registers.
+        Save the caller-saved registers that are live across a call before it, and
+        restore them after it.
         """
-        pos = self.stack_pos[val]
-        if pos * 4 > 2**12:
-            raise NotImplementedError(
-                "Register allocator is not working for more than 128 variables."
+        save_ops, restore_ops = [], []
+        for val in self.allocation.call_saves.get(op, []):
+            reg = self.allocation.registers[val]
+            offset = self.stack_offset(self.slots[val])
+            save_ops.append(riscv.SWOp(reg, "sp", offset, "Save caller-saved register"))
+            restore_ops.append(
+                riscv.LWOp(reg, "sp", offset, "Restore caller-saved register")
             )
-        op = riscv.SWOp(reg, "sp", pos * 4, "Spill register")
-        return [op]
+        return save_ops, restore_ops
 
     def rewrite_ecall(self, op: riscvssa.ECALLOp, rewriter: PatternRewriter) -> None:
-        new_ops = []
-        new_ops.extend(
-            self.get_variable_on_register(op.syscall_num, RegisterAttr.from_name("a7"))
-        )
-        for idx, operand in enumerate(op.args):
-            new_ops.extend(
-                self.get_variable_on_register(
-                    operand, RegisterAttr.from_name("a" + str(idx))
-                )
-            )
+        save_ops, restore_ops = self.save_registers(op)
+        moves = [("a7", op.syscall_num)]
+        moves += [(f"a{idx}", operand) for idx, operand in enumerate(op.args)]
+        new_ops = save_ops + self.move_to_registers(moves)
         new_ops.append(riscv.ECALLOp())
+        new_ops += restore_ops
         rewriter.replace_op(op, new_ops, [None] * len(op.results), safe_erase=True)
 
     def rewrite_call(self, op: riscvssa.CallOp, rewriter: PatternRewriter) -> None:
-        new_ops = [riscv.CommentOp(""), riscv.CommentOp(f"{op.name}")]
-        for idx, operand in enumerate(op.args):
-            new_ops.extend(
-                self.get_variable_on_register(
-                    operand, RegisterAttr.from_name("a" + str(idx))
-                )
-            )
+        save_ops, restore_ops = self.save_registers(op)
+        new_ops = [riscv.CommentOp(""), riscv.CommentOp(f"{op.name}")] + save_ops
+        new_ops += self.move_to_registers(
+            [(f"a{idx}", operand) for idx, operand in enumerate(op.args)]
+        )
         jump = riscv.JALOp(RegisterAttr.from_name("ra"), op.func_name.data)
         new_ops = new_ops + [jump]
 
@@ -211,33 +312,38 @@ class RiscvToRiscvSSAPattern(RewritePattern):
             1,
         ], "Only functions with zero or one return value supported"
 
-        if len(op.results) == 1:
-            new_ops.extend(
-                self.store_variable_from_register(
-                    RegisterAttr.from_name("a0"), op.results[0]
-                )
-            )
+        if len(op.results) == 1 and op.results[0] not in self.unused:
+            new_ops.extend(self.store_variable_from_register("a0", op.results[0]))
+        new_ops += restore_ops
         rewriter.replace_op(op, new_ops, [None] * len(op.results), safe_erase=True)
 
     def rewrite_alloc(self, op: riscvssa.AllocOp, rewriter: PatternRewriter) -> None:
-        stack_pos = 4 * (self.alloc_to_stack_var[op] + len(self.stack_pos))
+        stack_pos = self.stack_offset(self.stack_vars[op])
+        reg = self.allocation.registers.get(op.results[0], "t0")
         new_ops = [
-            riscv.AddIOp(
-                RegisterAttr.from_name("t0"),
-                RegisterAttr.from_name("sp"),
-                stack_pos,
-                "Save ptr of stack-slot into register",
-            )
+            riscv.AddIOp(reg, "sp", stack_pos, "Save ptr of stack-slot into register")
         ]
-        new_ops.extend(
-            self.store_variable_from_register(
-                RegisterAttr.from_name("t0"), op.results[0]
-            )
-        )
+        new_ops.extend(self.store_variable_from_register(reg, op.results[0]))
         rewriter.replace_op(op, new_ops, [None] * len(op.results), safe_erase=True)
 
+    def rewrite_phi(self, op: riscvssa.PhiOp, rewriter: PatternRewriter) -> None:
+        # The value of a phi is placed in its location by the assignments to it
+        rewriter.replace_op(op, [], [None] * len(op.results), safe_erase=True)
+
+    def rewrite_assign(self, op: riscvssa.AssignOp, rewriter: PatternRewriter) -> None:
+        if op.rd in self.allocation.registers:
+            new_ops = self.get_variable_on_register(
+                op.rs, self.allocation.registers[op.rd]
+            )
+        else:
+            reg, new_ops = self.operand_register(op.rs, "t0")
+            new_ops.extend(self.store_variable_from_register(reg, op.rd))
+        rewriter.replace_op(op, new_ops)
+
     def rewrite_return(self, ret: riscvssa.ReturnOp, rewriter: PatternRewriter):
-        new_ops = self.get_variable_on_register(ret.value, RegisterAttr.from_name("a0"))
+        new_ops = []
+        if ret.value is not None:
+            new_ops = self.get_variable_on_register(ret.value, "a0")
         new_ops.append(
             riscv.JOp("_" + ret.parent_op().properties["func_name"].data + "_return")
         )
@@ -256,11 +362,21 @@ class RiscvToRiscvSSAPattern(RewritePattern):
         if isinstance(op, riscvssa.AllocOp):
             self.rewrite_alloc(op, rewriter)
             return
+        if isinstance(op, riscvssa.PhiOp):
+            self.rewrite_phi(op, rewriter)
+            return
+        if isinstance(op, riscvssa.AssignOp):
+            self.rewrite_assign(op, rewriter)
+            return
         if isinstance(op, riscvssa.FuncOp):
             return
         if isinstance(op, riscvssa.ReturnOp):
             self.rewrite_return(op, rewriter)
             return
+        if op.results and op.results[0] in self.allocation.rematerialized:
+            # The constant is loaded where it is used
+            rewriter.replace_op(op, [], [None], safe_erase=True)
+            return
 
         # Get the matching operation in RISCV
         name = op.name.split(".", maxsplit=1)
@@ -285,36 +401,27 @@ class RiscvToRiscvSSAPattern(RewritePattern):
         assert len(op.results) <= 1
 
         # Fill the properties with the right values for operands and results.
-        # Also move operand variables to specific registers.
+        # Spilled operands are first loaded in scratch registers.
         if len(op.operands) > 0:
-            new_ops.extend(
-                self.get_variable_on_register(
-                    op.operands[0], RegisterAttr.from_name("t1")
-                )
-            )
-            new_op_properties["rs1"] = RegisterAttr.from_name("t1")
+            reg, load_ops = self.operand_register(op.operands[0], "t1")
+            new_ops.extend(load_ops)
+            new_op_properties["rs1"] = RegisterAttr.from_name(reg)
 
         if len(op.operands) > 1:
-            new_ops.extend(
-                self.get_variable_on_register(
-                    op.operands[1], RegisterAttr.from_name("t2")
-                )
-            )
-            new_op_properties["rs2"] = RegisterAttr.from_name("t2")
+            reg, load_ops = self.operand_register(op.operands[1], "t2")
+            new_ops.extend(load_ops)
+            new_op_properties["rs2"] = RegisterAttr.from_name(reg)
 
         if len(op.results) != 0:
-            new_op_properties["rd"] = RegisterAttr.from_name("t0")
+            reg = self.allocation.registers.get(op.results[0], "t0")
+            new_op_properties["rd"] = RegisterAttr.from_name(reg)
 
         # Create the new corresponding operation
         new_ops.append(new_op_type.create(properties=new_op_properties))
 
-        # Place the result in its right place on the stack
+        # Place a spilled result in its right place on the stack
         if len(op.results) != 0:
-            new_ops.extend(
-                self.store_variable_from_register(
-                    RegisterAttr.from_name("t0"), op.results[0]
-                )
-            )
+            new_ops.extend(self.store_variable_from_register(reg, op.results[0]))
 
         rewriter.replace_op(op, new_ops, [None] * len(op.results), safe_erase=True)
 
@@ -646,9 +753,13 @@ def add_return(op: Operation):
     op.regions[0].blocks[0].add_ops(new_ops)
 
 
+@dataclass
 class RISCVSSAToRISCV(ModulePass):
     name = "riscv-ssa-to-riscv"
 
+    allocator: str = "linear-scan"
+    """The register allocator, either `linear-scan` or `graph-coloring`."""
+
     def apply(self, ctx: MLContext, mod: ModuleOp) -> None:
         """
         Translate a riscvssa program into an equivalent RISCV program.
@@ -663,30 +774,37 @@ class RISCVSSAToRISCV(ModulePass):
         assert len(mod.ops) == 1, "expected at least one main function"
         main = mod.ops.first
 
-        (
-            global_spilled_reg,
-            global_stack_pos,
-            global_stack_vars,
-            global_alloc_to_stack_var,
-        ) = allocate_registers(main)
+        # The values of main used by functions are read from the stack of main,
+        # unless they can be recomputed.
+        shared = set(
+            result
+            for op in main.func_body.ops
+            if not isinstance(op, riscvssa.FuncOp)
+            for result in op.results
+            if not rematerializable(result)
+            and any(use.operation.parent_op() is not main for use in result.uses)
+        )
+        global_pattern = RiscvToRiscvSSAPattern(
+            ctx,
+            main,
+            allocate_registers(main, self.allocator, is_main=True, spill=shared),
+            printer,
+            output,
+        )
 
         # Allocate registers in all function definitions
         for func in main.func_body.ops:
             if not isinstance(func, riscvssa.FuncOp):
                 continue
-            spilled_reg, stack_pos, stack_vars, alloc_to_stack_var = allocate_registers(
-                func
-            )
             pattern = RiscvToRiscvSSAPattern(
                 ctx,
                 func,
-                stack_pos,
-                alloc_to_stack_var,
+                allocate_registers(func, self.allocator),
                 printer,
                 output,
-                global_stack_pos=global_stack_pos,
+                global_pattern=global_pattern,
             )
-            pattern.add_stack_allocation(func, spilled_reg, stack_vars)
+            pattern.add_stack_allocation(func)
             add_return(func)
             walker = PatternRewriteWalker(
                 GreedyRewritePatternApplier([pattern]),
@@ -696,14 +814,9 @@ class RISCVSSAToRISCV(ModulePass):
             walker.rewrite_module(func)
 
         # Allocate registers in the main function
-        pattern = RiscvToRiscvSSAPattern(
-            ctx, main, global_stack_pos, global_alloc_to_stack_var, printer, output
-        )
-        pattern.add_stack_allocation(
-            main, global_spilled_reg, global_stack_vars, is_main=True
-        )
+        global_pattern.add_stack_allocation(main, is_main=True)
         walker = PatternRewriteWalker(
-            GreedyRewritePatternApplier([pattern]),
+            GreedyRewritePatternApplier([global_pattern]),
             apply_recursively=True,
             walk_reverse=True,
         )
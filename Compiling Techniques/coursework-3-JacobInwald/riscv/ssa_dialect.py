@@ -617,6 +617,25 @@ class AllocOp(IRDLOperation):
         super().__init__(result_types=[RegisterType()])
 
 
+@irdl_op_definition
+class PhiOp(IRDLOperation):
+    name = "riscv_ssa.phi"
+    rd: OpResult = result_def(RegisterType)
+
+    def __init__(self):
+        super().__init__(result_types=[RegisterType()])
+
+
+@irdl_op_definition
+class AssignOp(IRDLOperation):
+    name = "riscv_ssa.assign"
+    rd: Operand = operand_def(RegisterType)
+    rs: Operand = operand_def(RegisterType)
+
+    def __init__(self, rd: Union[Operation, SSAValue], rs: Union[Operation, SSAValue]):
+        super().__init__(operands=[rd, rs])
+
+
 @irdl_op_definition
 class FuncOp(IRDLOperation):
     name = "riscv_ssa.func"
@@ -689,6 +708,8 @@ riscv_ssa_ops: List[Type[Operation]] = [
     LabelOp,
     CallOp,
     AllocOp,
+    PhiOp,
+    AssignOp,
     FuncOp,
     ReturnOp,
 ]
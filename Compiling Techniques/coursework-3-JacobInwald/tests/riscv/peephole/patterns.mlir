@@ -0,0 +1,29 @@
+// RUN: choco-opt %s -p riscv-peephole -t riscv | filecheck %s
+
+builtin.module {
+  "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = -8 : i64}> : () -> ()
+  "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 8 : i64}> : () -> ()
+  "riscv.li"() <{"rd" = !riscv.reg<t3>, "immediate" = 5 : i64}> : () -> ()
+  "riscv.sw"() <{"rs1" = !riscv.reg<t3>, "rs2" = !riscv.reg<sp>, "immediate" = 0 : i64}> : () -> ()
+  "riscv.lw"() <{"rd" = !riscv.reg<t4>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64}> : () -> ()
+  "riscv.li"() <{"rd" = !riscv.reg<t5>, "immediate" = 3 : i64}> : () -> ()
+  "riscv.add"() <{"rd" = !riscv.reg<s1>, "rs1" = !riscv.reg<t4>, "rs2" = !riscv.reg<t5>}> : () -> ()
+  "riscv.addi"() <{"rd" = !riscv.reg<t6>, "rs1" = !riscv.reg<tp>, "immediate" = 4 : i64}> : () -> ()
+  "riscv.lw"() <{"rd" = !riscv.reg<a1>, "rs1" = !riscv.reg<t6>, "immediate" = 8 : i64}> : () -> ()
+  "riscv.li"() <{"rd" = !riscv.reg<s2>, "immediate" = 1 : i64}> : () -> ()
+  "riscv.li"() <{"rd" = !riscv.reg<s2>, "immediate" = 2 : i64}> : () -> ()
+  "riscv.add"() <{"rd" = !riscv.reg<t3>, "rs1" = !riscv.reg<s1>, "rs2" = !riscv.reg<s2>}> : () -> ()
+  "riscv.mv"() <{"rd" = !riscv.reg<a0>, "rs" = !riscv.reg<t3>}> : () -> ()
+  "riscv.mv"() <{"rd" = !riscv.reg<t3>, "rs" = !riscv.reg<a0>}> : () -> ()
+  "riscv.li"() <{"rd" = !riscv.reg<a7>, "immediate" = 93 : i64}> : () -> ()
+  "riscv.ecall"() : () -> ()
+}
+
+// CHECK:      li t3, 5
+// CHECK-NEXT: sw t3, 0(sp)
+// CHECK-NEXT: mv t4, t3
+// CHECK-NEXT: addi s1, t4, 3
+// CHECK-NEXT: lw a1, 12(tp)
+// CHECK-NEXT: addi a0, s1, 2
+// CHECK-NEXT: li a7, 93
+// CHECK-NEXT: ecall
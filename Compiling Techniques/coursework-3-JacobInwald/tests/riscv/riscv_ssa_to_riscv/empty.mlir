@@ -8,16 +8,10 @@ builtin.module {
 
 // CHECK:       builtin.module {
 // CHECK-NEXT:    "choco.ir.func_def"() <{"func_name" = "_main", "return_type" = !choco.ir.named_type<"<None>">}> ({
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = -4 : i64, "comment" = "Reserve space for ra"}> : () -> ()
-// CHECK-NEXT:      "riscv.sw"() <{"rs1" = !riscv.reg<ra>, "rs2" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Store return address"}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Reserve stack space for spilled registers"}> : () -> ()
 // CHECK-NEXT:      "riscv.mv"() <{"rd" = !riscv.reg<tp>, "rs" = !riscv.reg<sp>, "comment" = "Move main stack pointer to special register"}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "Footer Ops"}> : () -> ()
 // CHECK-NEXT:      "riscv.label"() <{"label" = #riscv.label<__main_return>}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Free stack space reserved for spilled registers"}> : () -> ()
-// CHECK-NEXT:      "riscv.lw"() <{"rd" = !riscv.reg<ra>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Store return address"}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 4 : i64, "comment" = "Free space for ra"}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "Exit program"}> : () -> ()
 // CHECK-NEXT:      "riscv.li"() <{"rd" = !riscv.reg<a0>, "immediate" = 0 : i64}> : () -> ()
@@ -10,24 +10,21 @@ builtin.module {
 
 // CHECK:       builtin.module {
 // CHECK-NEXT:    "riscv_ssa.func"() <{"func_name" = "_main"}> ({
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = -4 : i64, "comment" = "Reserve space for ra"}> : () -> ()
-// CHECK-NEXT:      "riscv.sw"() <{"rs1" = !riscv.reg<ra>, "rs2" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Store return address"}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = -4 : i64, "comment" = "Reserve stack space for spilled registers"}> : () -> ()
+// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = -4 : i64, "comment" = "Reserve stack frame"}> : () -> ()
+// CHECK-NEXT:      "riscv.sw"() <{"rs1" = !riscv.reg<ra>, "rs2" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Save ra"}> : () -> ()
 // CHECK-NEXT:      "riscv.mv"() <{"rd" = !riscv.reg<tp>, "rs" = !riscv.reg<sp>, "comment" = "Move main stack pointer to special register"}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "%0 = \"riscv_ssa.li\"() <{\"immediate\" = 5 : i32}> : () -> !riscv_ssa.re"}> : () -> ()
-// CHECK-NEXT:      "riscv.li"() <{"immediate" = 5 : i32, "rd" = !riscv.reg<t0>}> : () -> ()
-// CHECK-NEXT:      "riscv.sw"() <{"rs1" = !riscv.reg<t0>, "rs2" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Spill register"}> : () -> ()
+// CHECK-NEXT:      "riscv.li"() <{"immediate" = 5 : i32, "rd" = !riscv.reg<s1>}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "riscv_ssa.call"}> : () -> ()
-// CHECK-NEXT:      "riscv.lw"() <{"rd" = !riscv.reg<a0>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Unspill register '%0'"}> : () -> ()
+// CHECK-NEXT:      "riscv.mv"() <{"rd" = !riscv.reg<a0>, "rs" = !riscv.reg<s1>}> : () -> ()
 // CHECK-NEXT:      "riscv.jal"() <{"rd" = !riscv.reg<ra>, "offset" = #riscv.label<print>}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "Footer Ops"}> : () -> ()
 // CHECK-NEXT:      "riscv.label"() <{"label" = #riscv.label<__main_return>}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 4 : i64, "comment" = "Free stack space reserved for spilled registers"}> : () -> ()
-// CHECK-NEXT:      "riscv.lw"() <{"rd" = !riscv.reg<ra>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Store return address"}> : () -> ()
-// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 4 : i64, "comment" = "Free space for ra"}> : () -> ()
+// CHECK-NEXT:      "riscv.lw"() <{"rd" = !riscv.reg<ra>, "rs1" = !riscv.reg<sp>, "immediate" = 0 : i64, "comment" = "Restore ra"}> : () -> ()
+// CHECK-NEXT:      "riscv.addi"() <{"rd" = !riscv.reg<sp>, "rs1" = !riscv.reg<sp>, "immediate" = 4 : i64, "comment" = "Free stack frame"}> : () -> ()
 // CHECK-NEXT:      "riscv.comment"() : () -> ()
 // CHECK-NEXT:      "riscv.comment"() <{"comment" = "Exit program"}> : () -> ()
 // CHECK-NEXT:      "riscv.li"() <{"rd" = !riscv.reg<a0>, "immediate" = 0 : i64}> : () -> ()
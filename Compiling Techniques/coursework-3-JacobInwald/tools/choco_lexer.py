@@ -2,15 +2,31 @@
 
 import argparse
 
-from choco.lexer import Lexer, TokenKind
+from choco.lexer import TOKENIZERS, Lexer, TokenKind
 
 
 def __main__():
     parser = argparse.ArgumentParser(description="A ChocoPy lexer")
     parser.add_argument("file", type=argparse.FileType("r"))
+    parser.add_argument(
+        "--lexer",
+        choices=list(TOKENIZERS),
+        default="table",
+        help="The tokenizer used to lex the file",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Lex the whole file into a compact token stream before printing it",
+    )
     args = parser.parse_args()
 
-    lexer = Lexer(args.file)
+    lexer = Lexer(args.file, args.lexer)
+    if args.compact:
+        for token in lexer.tokenize():
+            print(token)
+        return
+
     while True:
         token = lexer.consume()
         print(token)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 from io import IOBase
 from typing import IO, List, Type
 
@@ -8,26 +9,39 @@ from xdsl.passes import ModulePass, ModulePassT
 from xdsl.utils.parse_pipeline import PipelinePassSpec
 from xdsl.xdsl_opt_main import xDSLOptMain
 
+from choco.bounds_check_elimination import ChocoFlatBoundsCheckElimination
 from choco.check_assign_target import CheckAssignTargetPass
 from choco.choco_ast_to_choco_flat import ChocoASTToChocoFlat
 from choco.choco_flat_introduce_library_calls import ChocoFlatIntroduceLibraryCalls
 from choco.choco_flat_to_riscv_ssa import ChocoFlatToRISCVSSA
 from choco.constant_folding import ChocoFlatConstantFolding
-from choco.dupe_elimination import ChocoFlatDupeElimination
+from choco.constant_propagation import ChocoFlatConstantPropagation
 from choco.dead_code_elimination import ChocoFlatDeadCodeElimination
+from choco.evaluate_calls import ChocoFlatEvaluatePureCalls
 from choco.unused_store import ChocoUnusedStoreElimination
 from choco.dialects.choco_ast import ChocoAST
 from choco.dialects.choco_flat import ChocoFlat
 from choco.for_to_while import ForToWhile
+from choco.gvn import ChocoFlatGlobalValueNumbering
+from choco.inliner import ChocoFlatInline
+from choco.licm import ChocoFlatLoopInvariantCodeMotion
+from choco.lexer import TOKENIZERS
 from choco.lexer import Lexer as ChocoLexer
+from choco.mem2reg import ChocoFlatMem2Reg
 from choco.name_analysis import NameAnalysis
 from choco.parser import Parser as ChocoParser
 from choco.parser import SyntaxError
+from choco.reassociation import ChocoFlatReassociation
+from choco.semantic_analysis import SemanticAnalysis
 from choco.semantic_error import SemanticError
+from choco.strength_reduction import ChocoFlatStrengthReduction
+from choco.symbol_table import SymbolTables
+from choco.tail_calls import ChocoFlatTailCallElimination
 from choco.type_checking import TypeChecking
 from choco.warn_dead_code import DeadCodeError, WarnDeadCode
 from riscv.dialect import RISCV
 from riscv.function_lowering import RISCVFunctionLowering
+from riscv.peephole import RISCVPeephole
 from riscv.printer import print_program
 from riscv.register_allocation import RISCVSSAToRISCV
 from riscv.ssa_dialect import RISCVSSA
@@ -39,28 +53,58 @@ class ChocoOptMain(xDSLOptMain):
         CheckAssignTargetPass,
         NameAnalysis,
         TypeChecking,
+        SemanticAnalysis,
         WarnDeadCode,
         # IR Generation
         ChocoASTToChocoFlat,
         # IR Optimization
         ChocoFlatIntroduceLibraryCalls,
+        ChocoFlatTailCallElimination,
+        ChocoFlatInline,
+        ChocoFlatConstantPropagation,
+        ChocoFlatEvaluatePureCalls,
         # ChocoFlatVarReplacement,
-        ChocoFlatDupeElimination,
+        ChocoFlatReassociation,
+        ChocoFlatGlobalValueNumbering,
         ChocoFlatConstantFolding,
-        # ChocoUnusedStoreElimination,
-        ChocoFlatDupeElimination,
+        ChocoUnusedStoreElimination,
         ChocoFlatDeadCodeElimination,
         ForToWhile,
+        ChocoFlatMem2Reg,
+        ChocoFlatLoopInvariantCodeMotion,
+        ChocoFlatBoundsCheckElimination,
+        ChocoFlatStrengthReduction,
         # Code Generation
         ChocoFlatToRISCVSSA,
         RISCVSSAToRISCV,
         RISCVFunctionLowering,
+        RISCVPeephole,
     ]
 
+    # The passes that `semantic-analysis` runs in a single traversal. They can still be
+    # selected one by one, but the predefined pipelines use the fused pass.
+    fused_semantic_passes: list[str] = [
+        CheckAssignTargetPass.name,
+        NameAnalysis.name,
+        TypeChecking.name,
+    ]
+
+    # The passes that look up the names of a program in the shared `SymbolTables`.
+    symbol_table_passes = (NameAnalysis, TypeChecking, SemanticAnalysis)
+
     def register_all_passes(self):
         for pass_ in self.passes_native:
             self.register_pass(pass_)
 
+    def register_all_arguments(self, arg_parser: argparse.ArgumentParser):
+        super().register_all_arguments(arg_parser)
+        arg_parser.add_argument(
+            "--lexer",
+            choices=list(TOKENIZERS),
+            default="table",
+            help="The tokenizer used to lex ChocoPy programs",
+        )
+
     def _output_risc(self, prog: ModuleOp, output: IOBase):
         print_program(prog.ops, "riscv", stream=output)  # type: ignore
 
@@ -77,7 +121,7 @@ class ChocoOptMain(xDSLOptMain):
 
     def setup_pipeline(self):
         entries = {
-            "type": TypeChecking,
+            "type": SemanticAnalysis,
             "warn": WarnDeadCode,
             "ir": ChocoASTToChocoFlat,
             "fold": ChocoFlatConstantFolding,
@@ -88,7 +132,11 @@ class ChocoOptMain(xDSLOptMain):
 
         if self.args.passes != "all":
             if self.args.passes in entries:
-                pipeline = list(self.available_passes.keys())
+                pipeline = [
+                    p
+                    for p in self.available_passes
+                    if p not in self.fused_semantic_passes
+                ]
                 entry = self.pipeline_entry(self.args.passes, entries)
                 if entry is None:
                     raise Exception(
@@ -103,18 +151,27 @@ class ChocoOptMain(xDSLOptMain):
                 ]
             else:
                 super().setup_pipeline()
+                self.share_symbol_tables()
                 return
 
         else:
             pipeline = [
                 PipelinePassSpec(p, dict())
                 for p in self.available_passes
-                if p != "warn-dead-code"
+                if p != "warn-dead-code" and p not in self.fused_semantic_passes
             ]
 
         self.pipeline = [
             self.available_passes[p.name].from_pass_spec(p) for p in pipeline
         ]
+        self.share_symbol_tables()
+
+    def share_symbol_tables(self):
+        """Build the symbol tables once for all passes of the pipeline that use them."""
+        symbols = SymbolTables()
+        for pass_ in self.pipeline:
+            if isinstance(pass_, self.symbol_table_passes):
+                pass_.symbols = symbols
 
     def register_all_dialects(self):
         """Register all dialects that can be used."""
@@ -142,7 +199,7 @@ class ChocoOptMain(xDSLOptMain):
         super().register_all_frontends()
 
         def parse_choco(f: IO[str]):
-            lexer = ChocoLexer(f)  # type: ignore
+            lexer = ChocoLexer(f, self.args.lexer)  # type: ignore
             parser = ChocoParser(lexer)
             program = parser.parse_program()
             return program